@@ -0,0 +1,103 @@
+"""
+Benchmark de las entradas de log en memoria: dict (formato anterior) frente a LogRecord.
+
+Mide bytes por entrada retenida en 'logs', entradas registradas por segundo y el coste
+de servirlas como JSON (como jsonify): la primera vez ("en frío") y al volver a servir
+entradas cuyas cadenas de id/fechas ya están en la caché de decodificación. Uso:
+
+    python benchmark_log_records.py [--entries 100000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from liftr_common.blobs import externalize_entry  # noqa: E402
+from liftr_common.logrecords import (LOG_DECODE_CACHE_SIZE, LOG_TIME_FORMAT, compact_entry,  # noqa: E402
+                                     decode_log_time, decode_log_uuid, log_json_default)
+
+BLOBS_DIR = tempfile.mkdtemp(prefix="faas-bench-blobs-")
+
+
+def make_entry(i):
+    """Entrada tal y como la construye execute_function."""
+    s_time = time.time()
+    return {
+        "id": str(uuid.uuid4()),
+        "args": [i],
+        "result": i * 2,
+        "status": "success",
+        "time_start": datetime.fromtimestamp(s_time).strftime(LOG_TIME_FORMAT),
+        "time_end": datetime.fromtimestamp(time.time()).strftime(LOG_TIME_FORMAT),
+    }
+
+
+def build_dicts(n):
+    return [externalize_entry(BLOBS_DIR, make_entry(i)) for i in range(n)]
+
+
+def build_records(n):
+    return [compact_entry(BLOBS_DIR, make_entry(i)) for i in range(n)]
+
+
+def measure(build, n):
+    gc.collect()
+    start = time.perf_counter()
+    entries = build(n)
+    elapsed = time.perf_counter() - start
+    del entries
+
+    gc.collect()
+    tracemalloc.start()
+    entries = build(n)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cold = serve_rate(entries, cold=True)
+    # Lo que el panel vuelve a pedir: las entradas más recientes, que caben en la caché
+    recent = entries[-LOG_DECODE_CACHE_SIZE:]
+    serve_rate(recent)
+    return {"bytes_per_entry": retained / n, "entries_per_s": n / elapsed,
+            "served_per_s": cold, "served_cached_per_s": serve_rate(recent)}
+
+
+def serve_rate(entries, cold=False, repeat=3):
+    """Entradas servidas por segundo (la mejor de 'repeat' pasadas)."""
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            decode_log_uuid.cache_clear()
+            decode_log_time.cache_clear()
+        start = time.perf_counter()
+        json.dumps(entries, default=log_json_default)
+        best = min(best, time.perf_counter() - start)
+    return len(entries) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    n = parser.parse_args().entries
+
+    results = {"dict": measure(build_dicts, n), "LogRecord": measure(build_records, n)}
+    print(f"{n} entradas (args/resultado pequeños)\n")
+    print(f"{'formato':<10} {'bytes/entrada':>14} {'registradas/s':>14} {'servidas/s':>12} {'recientes/s':>12}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['bytes_per_entry']:>14.0f} {r['entries_per_s']:>14.0f} "
+              f"{r['served_per_s']:>12.0f} {r['served_cached_per_s']:>12.0f}")
+    ratio = results["dict"]["bytes_per_entry"] / results["LogRecord"]["bytes_per_entry"]
+    print(f"\nMemoria por entrada: {ratio:.1f}x menor con LogRecord")
+    for column, label in (("served_per_s", "en frío"), ("served_cached_per_s", "recientes")):
+        slowdown = results["dict"][column] / results["LogRecord"][column]
+        print(f"Servir como JSON ({label}): {slowdown:.1f}x más lento con LogRecord")
+
+
+if __name__ == "__main__":
+    main()
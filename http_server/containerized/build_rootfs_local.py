@@ -7,6 +7,8 @@ import json
 import pwd, grp 
 import shutil 
 import sys 
+import hashlib
+from contextlib import contextmanager
 
 # === CONFIGURACIÓN (RUTAS CORREGIDAS PARA SUDO) ===
 # Determinar la ruta base, usando SUDO_USER si se está ejecutando con sudo
@@ -23,15 +25,38 @@ else:
 BASE_DIR = user_home / "faas-lab"
 ROOTFS_DIR = BASE_DIR / "rootfs"
 
+# --rootfs-dir <ruta>: construir en otro directorio (el servidor lo usa para
+# preparar una versión nueva mientras la activa sigue en uso)
+if "--rootfs-dir" in sys.argv:
+    ROOTFS_DIR = Path(sys.argv[sys.argv.index("--rootfs-dir") + 1]).resolve()
+
 ARCH = "x86_64"
 ALPINE_VERSION = "3.20.0"
 ROOTFS_URL = f"https://dl-cdn.alpinelinux.org/alpine/v3.20/releases/{ARCH}/alpine-minirootfs-{ALPINE_VERSION}-{ARCH}.tar.gz"
 TAR_PATH = BASE_DIR / f"alpine-minirootfs-{ALPINE_VERSION}-{ARCH}.tar.gz"
 
 PACKAGES_CONFIG_FILE = Path("packages.json")
+# --packages-config <ruta>: lista de paquetes alternativa (el servidor pasa la ampliada
+# y solo la publica como packages.json cuando el nuevo rootfs se ha activado)
+if "--packages-config" in sys.argv:
+    PACKAGES_CONFIG_FILE = Path(sys.argv[sys.argv.index("--packages-config") + 1])
 
 COMMON_PYTHON_PACKAGES = ""
 COMMON_NODE_PACKAGES = ""
+# Paquetes esenciales de Alpine (🔴 CORRECCIÓN: se incluye g++, compilador C++)
+SYSTEM_PACKAGES = "python3 py3-pip python3-dev nodejs npm gcc g++ libc-dev"
+
+# === CACHÉ PERSISTENTE DE PAQUETES (fuera del rootfs) ===
+# Se monta dentro del chroot para que apk, pip y npm reutilicen lo ya descargado
+CACHE_DIR = BASE_DIR / "cache"
+CACHE_INDEX_FILE = CACHE_DIR / "index.json"
+CHROOT_CACHE_DIR = "/var/cache/faas"
+CACHE_SUBDIRS = ("apk", "pip", "npm")
+
+# Manifiesto de lo que ya está instalado en el rootfs (para instalar solo lo que falta)
+MANIFEST_FILE = ROOTFS_DIR / ".build_manifest.json"
+
+OFFLINE = False
 
 def load_package_config():
     """Carga la lista de paquetes desde packages.json."""
@@ -92,34 +117,162 @@ def setup_network_for_chroot():
         print(f"⚠️ Error al copiar /etc/resolv.conf: {e}. La instalación puede fallar.")
 
 
+def load_manifest():
+    """Lee el manifiesto de paquetes ya instalados en el rootfs."""
+    if MANIFEST_FILE.exists():
+        try:
+            with open(MANIFEST_FILE, 'r') as f:
+                manifest = json.load(f)
+            return {kind: set(manifest.get(kind, [])) for kind in ("apk", "pip", "npm")}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Manifiesto ilegible ({e}). Se reinstalará todo.")
+    return {"apk": set(), "pip": set(), "npm": set()}
+
+
+def save_manifest(manifest):
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump({kind: sorted(pkgs) for kind, pkgs in manifest.items()}, f, indent=4)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def update_cache_index():
+    """
+    Registra el sha256 de cada artefacto de la caché (paquetes apk y wheels).
+    Solo se recalcula el hash de los archivos nuevos o modificados.
+    """
+    index = {}
+    if CACHE_INDEX_FILE.exists():
+        with open(CACHE_INDEX_FILE, 'r') as f:
+            index = json.load(f)
+
+    fresh = {}
+    for kind in ("apk", "pip"):
+        for path in (CACHE_DIR / kind).rglob("*"):
+            if not path.is_file():
+                continue
+            rel = path.relative_to(CACHE_DIR).as_posix()
+            stat = path.stat()
+            known = index.get(rel)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                fresh[rel] = known
+            else:
+                fresh[rel] = {"sha256": file_sha256(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    with open(CACHE_INDEX_FILE, 'w') as f:
+        json.dump(fresh, f, indent=4)
+    print(f"🗂️  Índice de caché actualizado ({len(fresh)} artefactos).")
+
+
+def verify_cache():
+    """Comprueba la integridad de la caché antes de una construcción offline."""
+    if not CACHE_INDEX_FILE.exists():
+        print(f"🚨 Modo offline sin caché: no existe {CACHE_INDEX_FILE}.")
+        sys.exit(1)
+    with open(CACHE_INDEX_FILE, 'r') as f:
+        index = json.load(f)
+
+    corrupt = [rel for rel, meta in index.items()
+               if not (CACHE_DIR / rel).exists() or file_sha256(CACHE_DIR / rel) != meta["sha256"]]
+    if corrupt:
+        print(f"🚨 Caché corrupta o incompleta: {', '.join(corrupt[:10])}")
+        sys.exit(1)
+    print(f"✅ Caché verificada ({len(index)} artefactos).")
+
+
+@contextmanager
+def mounted_cache():
+    """Monta (bind) la caché del host dentro del chroot durante la instalación."""
+    mounted = []
+    try:
+        for kind in CACHE_SUBDIRS:
+            host_dir = CACHE_DIR / kind
+            chroot_dir = ROOTFS_DIR / CHROOT_CACHE_DIR.lstrip("/") / kind
+            host_dir.mkdir(parents=True, exist_ok=True)
+            chroot_dir.mkdir(parents=True, exist_ok=True)
+            subprocess.run(["mount", "--bind", host_dir.as_posix(), chroot_dir.as_posix()], check=True)
+            mounted.append(chroot_dir)
+        yield
+    finally:
+        for chroot_dir in reversed(mounted):
+            subprocess.run(["umount", chroot_dir.as_posix()], check=False)
+
+
+def run_in_chroot(command):
+    subprocess.run(["chroot", ROOTFS_DIR.as_posix(), "sh", "-c", command], check=True)
+
+
 def install_packages():
-    """Instala las herramientas y dependencias de lenguaje dentro del rootfs usando chroot."""
-    print("🛠️ Instalando paquetes de sistema (apk)...")
-    
-    # 1. Instalar paquetes esenciales de Alpine
-    # 🔴 CORRECCIÓN: Se añade g++ (compilador C++)
-    packages = "python3 py3-pip python3-dev nodejs npm gcc g++ libc-dev" 
-    apk_cmd = f"apk add --no-cache {packages}"
-    
-    subprocess.run(["chroot", ROOTFS_DIR.as_posix(), "sh", "-c", "apk update"], check=True)
-    subprocess.run(["chroot", ROOTFS_DIR.as_posix(), "sh", "-c", apk_cmd], check=True)
-    
-    # 2. INSTALACIÓN DE PAQUETES PYTHON MONOLÍTICOS
-    if COMMON_PYTHON_PACKAGES:
-        print("📦 Instalando paquetes comunes de Python (pip)...")
-        # Corrección para PEP 668: Usar --break-system-packages
-        pip_install_cmd = f"python3 -m pip install --break-system-packages {COMMON_PYTHON_PACKAGES}"
-        subprocess.run(["chroot", ROOTFS_DIR.as_posix(), "sh", "-c", pip_install_cmd], check=True)
-    else:
-        print("⚠️ Saltando instalación de paquetes Python (lista vacía).")
-    
-    # 3. INSTALACIÓN DE PAQUETES NODE.JS MONOLÍTICOS
-    if COMMON_NODE_PACKAGES:
-        print("📦 Instalando paquetes comunes de Node.js (npm)...")
-        npm_install_cmd = f"npm install -g --prefix /usr/local {COMMON_NODE_PACKAGES}"
-        subprocess.run(["chroot", ROOTFS_DIR.as_posix(), "sh", "-c", npm_install_cmd], check=True)
-    else:
-        print("⚠️ Saltando instalación de paquetes Node.js (lista vacía).")
+    """
+    Instala las herramientas y dependencias de lenguaje dentro del rootfs usando chroot.
+    Solo se instalan los paquetes que el manifiesto no registra, y todas las
+    descargas pasan por la caché persistente del host.
+    """
+    manifest = load_manifest()
+    apk_cache = f"{CHROOT_CACHE_DIR}/apk"
+    pip_cache = f"{CHROOT_CACHE_DIR}/pip"
+    npm_cache = f"{CHROOT_CACHE_DIR}/npm"
+
+    wanted = {
+        "apk": set(SYSTEM_PACKAGES.split()),
+        "pip": set(COMMON_PYTHON_PACKAGES.split()),
+        "npm": set(COMMON_NODE_PACKAGES.split()),
+    }
+    missing = {kind: sorted(wanted[kind] - manifest[kind]) for kind in wanted}
+
+    if not any(missing.values()):
+        print("✅ Todos los paquetes ya están instalados según el manifiesto.")
+        return
+
+    with mounted_cache():
+        # 1. Instalar paquetes esenciales de Alpine
+        if missing["apk"]:
+            print(f"🛠️ Instalando paquetes de sistema (apk): {' '.join(missing['apk'])}")
+            if OFFLINE:
+                run_in_chroot(f"apk add --no-network --cache-dir {apk_cache} {' '.join(missing['apk'])}")
+            else:
+                run_in_chroot(f"apk update --cache-dir {apk_cache}")
+                run_in_chroot(f"apk add --cache-dir {apk_cache} {' '.join(missing['apk'])}")
+            manifest["apk"].update(missing["apk"])
+            save_manifest(manifest)
+
+        # 2. INSTALACIÓN DE PAQUETES PYTHON MONOLÍTICOS (desde wheels cacheadas)
+        if missing["pip"]:
+            print(f"📦 Instalando paquetes comunes de Python (pip): {' '.join(missing['pip'])}")
+            if not OFFLINE:
+                run_in_chroot(
+                    f"python3 -m pip wheel --find-links {pip_cache} --wheel-dir {pip_cache} {' '.join(missing['pip'])}"
+                )
+            # Corrección para PEP 668: Usar --break-system-packages
+            run_in_chroot(
+                f"python3 -m pip install --break-system-packages --no-index --find-links {pip_cache} "
+                f"{' '.join(missing['pip'])}"
+            )
+            manifest["pip"].update(missing["pip"])
+            save_manifest(manifest)
+        elif not COMMON_PYTHON_PACKAGES:
+            print("⚠️ Saltando instalación de paquetes Python (lista vacía).")
+
+        # 3. INSTALACIÓN DE PAQUETES NODE.JS MONOLÍTICOS (caché de tarballs de npm)
+        if missing["npm"]:
+            print(f"📦 Instalando paquetes comunes de Node.js (npm): {' '.join(missing['npm'])}")
+            offline_flag = " --offline" if OFFLINE else ""
+            run_in_chroot(
+                f"npm install -g --prefix /usr/local --cache {npm_cache}{offline_flag} {' '.join(missing['npm'])}"
+            )
+            manifest["npm"].update(missing["npm"])
+            save_manifest(manifest)
+        elif not COMMON_NODE_PACKAGES:
+            print("⚠️ Saltando instalación de paquetes Node.js (lista vacía).")
+
+    if not OFFLINE:
+        update_cache_index()
     
     print("✅ Instalación de lenguajes y librerías comunes completada.")
 
@@ -193,11 +346,18 @@ def create_oci_config():
     print("✅ config.json generado y modificado para ejecución Rootless.")
 
 def main():
+    global OFFLINE
     print("🚀 Construyendo rootfs monolítico (Python, Node.js, C)...\\n")
     
-    skip_download = "--skip-download" in sys.argv
+    # --offline: construye solo desde la caché local (gateways sin conexión)
+    OFFLINE = "--offline" in sys.argv
+    skip_download = "--skip-download" in sys.argv or OFFLINE
     
     load_package_config() 
+
+    if OFFLINE:
+        print("🔌 Modo offline: se usará únicamente la caché de paquetes.")
+        verify_cache()
     
     if not skip_download:
         download_rootfs()
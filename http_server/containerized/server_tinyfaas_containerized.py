@@ -3,7 +3,7 @@ import subprocess
 import sys
 import uuid
 import json  
-from flask import Flask, request, jsonify, Response, render_template
+from flask import Flask, request, jsonify, Response, render_template, send_file
 from functools import wraps
 import shutil
 import time
@@ -16,6 +16,33 @@ import tempfile
 import atexit 
 from dotenv import load_dotenv 
 import threading # 👈 ¡NUEVO! Para la ejecución asíncrona
+import queue
+import itertools
+import http.client
+import ipaddress
+import socket
+import hashlib
+import re
+from contextlib import contextmanager
+import importlib.util
+import posixpath
+import select
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+# Código común de los servidores (liftr_common/, en la raíz del repositorio)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from liftr_common.admission import ADMISSION_KEYS, AdmissionControl, Overloaded, normalize_admission
+from liftr_common.blobs import blob_references, collect_blob_garbage, inline_blobs, read_blob
+from liftr_common.bundles import (bundle_module_name, bundle_path, bundle_references, bundle_stem,
+                                  collect_bundle_garbage, deploy_bundle, forget_bundle_modules, import_bundle)
+from liftr_common.history import HistoryStore, parse_history_filters
+from liftr_common.logrecords import LogRecord, compact_entry, log_json_default
+from liftr_common.metrics import FUNCTION_METRICS, record_metrics, render_prometheus
+from liftr_common.pipelines import normalize_pipeline
+from liftr_common.sampler import SystemSampler, parse_history_window
+from liftr_common.retention import (RETENTION_KEYS, archive_entries, enforce_archive_limit, expired_count,
+                                    list_archive_segments, normalize_retention, query_archives)
 
 # Cargar variables de entorno si existe un archivo .env
 load_dotenv()
@@ -59,37 +86,128 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 FUNCTIONS_FILE = DATA_DIR / "functions.json"
 LOGS_FILE = DATA_DIR / "logs.json"
+PIPELINES_FILE = DATA_DIR / "pipelines.json"
 
 functions = {}
 logs = {}
+pipelines = {}  # nombre -> {"name", "stages", "created_at"}
 
 # 📦 Configuración de Contenedores
 BASE_DIR = Path.home() / "faas-lab"
 ROOTFS_DIR = BASE_DIR / "rootfs"
 CRUN_BIN = shutil.which("crun") or "/usr/bin/crun" 
 
-# 🟢 Archivo de configuración para paquetes
+# 🟢 Archivo de configuración para paquetes (imagen base compartida)
 PACKAGES_CONFIG_FILE = Path("packages.json")
 
+# 🧱 Capas de dependencias por función (solo el delta sobre la imagen base)
+LAYERS_DIR = BASE_DIR / "layers"
+LAYER_MOUNT_POINT = "/opt/faas-layer"
+LAYER_BUILD_TIMEOUT = 600
+LAYER_GC_GRACE_SECONDS = 300  # Una capa recién publicada aún puede no estar asignada a su función
+BASE_PYTHONPATH = "/usr/lib/python3.12/site-packages:/usr/local/lib/python3.12/site-packages"
+BASE_NODE_PATH = "/usr/local/lib/node_modules"
+
+# 📨 Plano de datos de las invocaciones (directorio scratch en tmpfs)
+SCRATCH_ROOT = Path("/dev/shm") if os.access("/dev/shm", os.W_OK) else Path(tempfile.gettempdir())
+OUTPUTS_DIR = SCRATCH_ROOT / "faas-outputs"  # Salidas binarias pendientes de descarga
+OUTPUT_TTL_SECONDS = int(os.getenv("FAAS_OUTPUT_TTL", "3600"))  # Salidas nunca descargadas (tmpfs = RAM)
+PAYLOAD_MODES = ("argv", "stdin", "file")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 📊 Límites de cgroup por función y contabilidad de consumo
+CPU_PERIOD_US = 100000
+CONTAINER_STATS_FILE = ".faas_stats"  # Dentro del scratch (/mnt)
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+CGROUP_PARENT = "faas"  # cgroupsPath de cada contenedor: /faas/<id> (legible desde el host)
+CGROUP_STAT_FILES = (
+    "cpu.stat", "memory.peak", "io.stat",                       # cgroup v2
+    "cpuacct/cpuacct.usage", "memory/memory.max_usage_in_bytes"  # cgroup v1
+)
+# Envoltorio que ejecuta la función y, al terminar (aún dentro de su cgroup),
+# vuelca en el scratch las marcas de tiempo de inicio/fin del proceso y las
+# estadísticas del cgroup, conservando el código de salida original
+CONTAINER_WRAPPER = (
+    't0=$(date +%s.%N); "$@"; rc=$?; t1=$(date +%s.%N); '
+    '{ echo "## exec_start"; echo "$t0"; echo "## exec_end"; echo "$t1"; '
+    f'for f in {" ".join(CGROUP_STAT_FILES)}; do '
+    '[ -r /sys/fs/cgroup/$f ] && { echo "## $f"; cat /sys/fs/cgroup/$f; }; '
+    f'done; }} > /mnt/{CONTAINER_STATS_FILE} 2>/dev/null; '
+    'exit $rc'
+)
+
+# 🔌 Backends de ejecución (elegido por función al subirla)
+DEFAULT_BACKEND = "crun"
+SUBPROCESS_POOL_SIZE = 4                     # Workers calientes máximos por función
+SUBPROCESS_MAX_FILE_BYTES = 64 * 1024 * 1024  # RLIMIT_FSIZE de los workers
+SUBPROCESS_MAX_OPEN_FILES = 256
+INVOCATION_TIMEOUT = 30
+INIT_TIMEOUT = 120          # Límite para el init() de una función (carga de modelos, tablas...)
+WORKER_SHUTDOWN_GRACE = 2   # Segundos para que un worker ejecute shutdown() antes de matarlo
+
+# 🔁 Coalescencia de invocaciones idénticas en curso (singleflight, opcional por función)
+INFLIGHT_INVOCATIONS = {}  # (función, versión, hash de args) -> InFlightInvocation
+INFLIGHT_LOCK = threading.Lock()
+
+# ⏱️ Desglose de latencia por fase (reloj monotónico)
+FUNCTION_TIMINGS = {}   # func_name -> {'cold'|'warm' -> {fase -> agregados}}
+WARM_FUNCTIONS = set()  # Funciones ya invocadas desde su carga
+TIMINGS_LOCK = threading.Lock()
+
+# 🏗️ Trabajos de construcción en segundo plano (capas y rootfs base)
+BUILD_JOBS = {}
+BUILD_QUEUE = queue.Queue()
+BUILD_JOBS_LOCK = threading.Lock()
+FUNCTIONS_LOCK = threading.Lock()  # Altas y bajas de funciones frente a los trabajos de construcción
+BUILD_NICENESS = 10               # Las construcciones ceden CPU a las invocaciones
+ROOTFS_BUILD_TIMEOUT = 1800
+ROOTFS_VERSIONS_TO_KEEP = 2       # Versión activa + la anterior (contenedores en curso)
+
 # 📦 Configuración de Tareas Asíncronas 👈 ¡NUEVO!
 ASYNC_TASKS = {} 
+TASK_FINAL_STATES = ('completed', 'failed')
+TASK_TTL_SECONDS = int(os.getenv("FAAS_TASK_TTL", "3600"))  # Tareas terminadas consultables
+
+# 🔔 Entrega push de resultados (long-poll, SSE y webhooks)
+TASK_CONDITION = threading.Condition()  # Protege ASYNC_TASKS y despierta a los long-polls
+TASK_EVENT_SUBSCRIBERS = []             # Una cola por cliente SSE conectado
+LONG_POLL_MAX_WAIT = 60                 # Segundos máximos de espera en /task/status?wait=
+SSE_KEEPALIVE_SECONDS = 15
+SSE_QUEUE_SIZE = 256
 
 # ========================================================
 # 💾 FUNCIONES DE PERSISTENCIA
 # ========================================================
 
 def load_state():
-    global functions, logs
+    global functions, logs, pipelines
     try:
         if os.path.exists(FUNCTIONS_FILE):
             with open(FUNCTIONS_FILE, 'r') as f:
                 functions = json.load(f) 
         if os.path.exists(LOGS_FILE):
             with open(LOGS_FILE, 'r') as f:
-                logs = json.load(f)
+                logs = {log_key: [LogRecord(entry) for entry in entries]
+                        for log_key, entries in json.load(f).items()}
+        if os.path.exists(PIPELINES_FILE):
+            with open(PIPELINES_FILE, 'r') as f:
+                pipelines = json.load(f)
     except Exception:
         functions = {}
         logs = {}
+        pipelines = {}
+
+    # Las construcciones en segundo plano no sobreviven a un reinicio
+    for func_name in [k for k, data in functions.items() if data.get("status") == "building"]:
+        print(f"ADVERTENCIA: La construcción de '{func_name}' se interrumpió. Vuelva a subir la función.")
+        del functions[func_name]
+
+    # Primera ejecución con SQLite: se importa el historial existente de logs.json
+    HISTORY.backfill(logs)
+    # Lo que exceda la retención se archiva ya, para que el estado siguiente sea acotado
+    apply_retention()
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
         
 def save_state():
     try:
@@ -100,88 +218,391 @@ def save_state():
             json.dump(functions_to_save, f, indent=4)
         
         with open(LOGS_FILE, 'w') as f:
-            json.dump(logs, f, indent=4)
+            json.dump(logs, f, indent=4, default=log_json_default)
+
+        with open(PIPELINES_FILE, 'w') as f:
+            json.dump(pipelines, f, indent=4)
     except Exception as e:
         print(f"Error al guardar el estado: {e}")
 
 
 # ========================================================
-# 🟢 FUNCIÓN: Actualización y Reconstrucción del RootFS
+# 🧱 CAPAS DE DEPENDENCIAS INCREMENTALES
 # ========================================================
 
-def update_and_rebuild_rootfs(new_python_reqs=None, new_node_packages=None):
+def parse_dependency_list(content):
+    """Devuelve las líneas útiles de un requirements.txt o listado de paquetes npm."""
+    return [
+        line.strip() for line in content.splitlines()
+        if line.strip() and not line.strip().startswith('#')
+    ]
+
+
+def package_name(spec, runtime):
+    """Nombre del paquete sin versión: 'numpy==1.26' -> 'numpy', '@scope/pkg@1' -> '@scope/pkg'."""
+    if runtime == "node":
+        at = spec.find('@', 1)
+        return (spec[:at] if at > 0 else spec).lower()
+    return re.split(r'[<>=!~\[;\s]', spec, maxsplit=1)[0].strip().lower().replace('_', '-')
+
+
+def load_base_packages(runtime):
+    """Paquetes que ya trae la imagen base según packages.json."""
+    if not PACKAGES_CONFIG_FILE.exists():
+        return set()
+    with open(PACKAGES_CONFIG_FILE, 'r') as f:
+        config = json.load(f)
+    key = "common_python_packages" if runtime == "python" else "common_node_packages"
+    return {package_name(p, runtime) for p in config.get(key, "").split()}
+
+
+def compute_layer_delta(runtime, dependency_content):
+    """Filtra los requisitos que la imagen base ya satisface (sin versión fijada)."""
+    base = load_base_packages(runtime)
+    delta = []
+    for spec in parse_dependency_list(dependency_content):
+        name = package_name(spec, runtime)
+        pinned = name != spec.lower().replace('_', '-')
+        if name in base and not pinned:
+            continue
+        delta.append(spec)
+    return sorted(set(delta))
+
+
+def layer_key(runtime, specs):
+    digest = hashlib.sha256(json.dumps([runtime, specs]).encode("utf-8")).hexdigest()
+    return f"{runtime}-{digest[:16]}"
+
+
+def layer_is_ready(key):
+    return (LAYERS_DIR / key / ".ready").exists()
+
+
+def ensure_dependency_layer(runtime, specs):
     """
-    Lee, actualiza packages.json con nuevos requisitos, y reconstruye el rootfs.
+    Construye (o reutiliza) la capa con los paquetes `specs` instalados sobre la
+    imagen base. Cada conjunto de dependencias vive en su propio directorio
+    direccionado por contenido, por lo que el rootfs compartido nunca se modifica.
+    """
+    key = layer_key(runtime, specs)
+    layer_dir = LAYERS_DIR / key
+    if layer_is_ready(key):
+        print(f"♻️  Reutilizando capa de dependencias {key}.")
+        return key
+
+    LAYERS_DIR.mkdir(parents=True, exist_ok=True)
+    build_dir = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=LAYERS_DIR))
+    os.chmod(build_dir, 0o755)
+    scratch = f"{LAYER_MOUNT_POINT}/.tmp"
+
+    if runtime == "python":
+        command = ["python3", "-m", "pip", "install", "--no-cache-dir", "--disable-pip-version-check",
+                   "--target", f"{LAYER_MOUNT_POINT}/python"] + specs
+    else:
+        command = ["npm", "install", "--no-save", "--no-audit", "--no-fund",
+                   "--prefix", f"{LAYER_MOUNT_POINT}/node"] + specs
+    env = {"HOME": scratch, "TMPDIR": scratch, "npm_config_cache": f"{scratch}/npm"}
+    (build_dir / ".tmp").mkdir()
+
+    print(f"⏳ Construyendo capa {key} con: {' '.join(specs)}")
+    try:
+        out, err, code = run_in_container(command, [(build_dir.as_posix(), LAYER_MOUNT_POINT)],
+                                          env=env, timeout=LAYER_BUILD_TIMEOUT, niceness=BUILD_NICENESS)
+        if code != 0:
+            raise Exception(f"Fallo al instalar la capa {key}. Código: {code}. Error: {(err or out)[-500:]}")
+
+        shutil.rmtree(build_dir / ".tmp", ignore_errors=True)
+        (build_dir / ".ready").write_text(json.dumps({"runtime": runtime, "packages": specs}))
+        try:
+            os.rename(build_dir, layer_dir)  # Publicación atómica de la capa
+        except OSError:
+            # Otra subida construyó la misma capa a la vez: nos quedamos con la suya
+            shutil.rmtree(build_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    print(f"✅ Capa {key} lista.")
+    return key
+
+
+def prune_unused_layers():
+    """
+    Elimina las capas que ya no referencia ninguna función ni ningún trabajo de
+    construcción en cola o en curso, y que no se acaban de publicar.
+    """
+    if not LAYERS_DIR.exists():
+        return
+    in_use = {data.get("layer") for data in list(functions.values())}
+    with BUILD_JOBS_LOCK:
+        in_use.update(job.get("layer") for job in BUILD_JOBS.values()
+                      if job["status"] in ("queued", "running"))
+    cutoff = time.time() - LAYER_GC_GRACE_SECONDS
+    for layer_dir in LAYERS_DIR.iterdir():
+        if layer_dir.name in in_use or layer_dir.name.startswith('.'):
+            continue
+        try:
+            if layer_dir.stat().st_mtime > cutoff:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(layer_dir, ignore_errors=True)
+
+
+def layer_mounts_and_env(func_data):
+    """Montaje (solo lectura) y variables de entorno de la capa de una función."""
+    key = func_data.get("layer")
+    if not key:
+        return [], {}
+    layer_dir = LAYERS_DIR / key
+    if not layer_is_ready(key):
+        raise FileNotFoundError(f"La capa de dependencias '{key}' no existe. Vuelva a subir la función.")
+    env = {
+        "PYTHONPATH": f"{LAYER_MOUNT_POINT}/python:{BASE_PYTHONPATH}",
+        "NODE_PATH": f"{LAYER_MOUNT_POINT}/node/node_modules:{BASE_NODE_PATH}",
+    }
+    return [(layer_dir.as_posix(), LAYER_MOUNT_POINT, "ro")], env
+
+
+# ========================================================
+# 📦 PAQUETES DE FUNCIÓN (zip/tar con manifiesto, bytecode precompilado)
+# ========================================================
+
+BUNDLES_DIR = os.path.join(DATA_DIR, "bundles")
+BUNDLE_RUNTIMES = {"python": ".py", "node": ".js", "c": ".c"}
+BUNDLE_MOUNT_ROOT = "/opt/faas-bundle"  # En PYTHONPATH: el paquete se importa como BUNDLE_PACKAGE
+BUNDLE_PACKAGE = "function"
+BUNDLE_MOUNT_POINT = f"{BUNDLE_MOUNT_ROOT}/{BUNDLE_PACKAGE}"
+# Lectura, validación, despliegue e importación de paquetes en liftr_common.bundles
+
+
+def referenced_bundles():
+    """Digests de los paquetes que usa alguna función registrada o pendiente de construir su capa."""
+    pending = [job["function_metadata"] for job in list(BUILD_JOBS.values())
+               if job.get("function_metadata") and job["status"] in ("queued", "running")]
+    return bundle_references(list(functions.values()) + pending)
+
+
+def c_bundle_binary(entry):
+    """Ejecutable de un paquete C: junto al punto de entrada y sin extensión ('src/main.c' -> 'src/main')."""
+    return posixpath.splitext(entry)[0]
+
+
+def build_c_bundle(root, bundle):
+    """Compila una sola vez, al desplegar, todos los .c del paquete (en lugar de en cada invocación)."""
+    if bundle["runtime"] != "c":
+        return
+    command = ["sh", "-c", 'cd /mnt && gcc -O2 -o "$0" $(find . -name "*.c")', c_bundle_binary(bundle["entry"])]
+    out, err, code = run_in_container(command, [(root, "/mnt")])
+    if code != 0:
+        raise ValueError(f"Fallo de compilación C. Código: {code}. Error: {err or out}")
+
+
+def bundle_command(bundle):
+    """Comando del contenedor para el punto de entrada del paquete montado en BUNDLE_MOUNT_POINT."""
+    if bundle["runtime"] == "python":
+        # Como módulo del paquete: imports relativos y .pyc del despliegue
+        return ["python3", "-m", f"{BUNDLE_PACKAGE}.{bundle_module_name(bundle['entry'])}"]
+    if bundle["runtime"] == "node":
+        return ["node", f"{BUNDLE_MOUNT_POINT}/{bundle['entry']}"]
+    return [f"{BUNDLE_MOUNT_POINT}/{c_bundle_binary(bundle['entry'])}"]
+
+
+def bundle_worker_spec(func_data):
+    """Datos del paquete que necesita el worker de 'subprocess' para importarlo (None si no lo es)."""
+    bundle = func_data.get("bundle")
+    if not bundle:
+        return None
+    return {"root": bundle_path(BUNDLES_DIR, bundle["digest"]), "module": bundle_module_name(bundle["entry"])}
+
+
+# ========================================================
+# 🏗️ TRABAJOS DE CONSTRUCCIÓN EN SEGUNDO PLANO
+# ========================================================
+
+def run_privileged(command, **kwargs):
+    """Ejecuta un comando con sudo salvo que el servidor ya corra como root."""
+    prefix = [] if os.geteuid() == 0 else ["sudo"]
+    return subprocess.run(prefix + command, **kwargs)
+
+
+def submit_build_job(kind, **params):
+    """Encola una construcción y devuelve su descripción (incluye el job_id)."""
+    job_id = str(uuid.uuid4())
+    job = {
+        "job_id": job_id,
+        "kind": kind,  # 'layer' o 'rootfs'
+        "status": "queued",
+        "progress": "En cola.",
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "log": [],
+        **params,
+    }
+    with BUILD_JOBS_LOCK:
+        BUILD_JOBS[job_id] = job
+    BUILD_QUEUE.put(job_id)
+    return job
+
+
+def public_job_view(job):
+    """Campos del trabajo que se exponen por la API (sin rutas internas)."""
+    hidden = ("function_metadata", "staging_dir", "log")
+    view = {k: v for k, v in job.items() if k not in hidden}
+    view["log_tail"] = job["log"][-20:]
+    return view
+
+
+def set_job_progress(job, message):
+    job["progress"] = message
+    job["log"].append(message)
+    del job["log"][:-200]
+
+
+def owns_function(job):
+    """Si la función del trabajo sigue existiendo y su última subida es la de este trabajo."""
+    return functions.get(job["function_name"], {}).get("build_job") == job["job_id"]
+
+
+def run_layer_job(job):
+    """Construye la capa de la función y, solo si termina bien, activa la nueva versión."""
+    func_name = job["function_name"]
+    staging_dir = Path(job["staging_dir"])
+    func_dir = staging_dir.parent
+
+    set_job_progress(job, f"Instalando {' '.join(job['packages'])} en la capa {job['layer']}...")
+    try:
+        ensure_dependency_layer(job["runtime"], job["packages"])
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        with FUNCTIONS_LOCK:
+            discard = (owns_function(job) and functions[func_name].get("status") == "building")
+            if discard:
+                # La función nunca llegó a estar activa: se descarta por completo
+                del functions[func_name]
+                shutil.rmtree(func_dir, ignore_errors=True)
+        if discard:
+            save_state()
+            publish_admin_event("function", {"action": "deleted", "function": func_name})
+        raise
+
+    # Publicar el código preparado y cambiar la definición de la función de una vez, salvo
+    # que mientras tanto se haya eliminado o sustituido por una subida posterior
+    set_job_progress(job, "Capa lista. Activando la nueva versión de la función...")
+    with FUNCTIONS_LOCK:
+        if not owns_function(job):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            set_job_progress(job, "La función se eliminó o se volvió a subir: versión descartada.")
+            return
+        for item in staging_dir.iterdir():
+            os.replace(item, func_dir / item.name)
+        staging_dir.rmdir()
+        functions[func_name] = job["function_metadata"]
+
+    retire_function_runtime(func_name)
+    save_state()
+    prune_unused_layers()
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+    publish_admin_event("function", {"action": "deployed", "function": func_name, "info": function_info(func_name)})
+
+
+def activate_rootfs(new_dir):
+    """
+    Apunta ROOTFS_DIR a `new_dir` con un rename atómico del enlace simbólico.
+    Los contenedores en curso siguen usando la versión anterior, que se conserva.
+    """
+    if ROOTFS_DIR.exists() and not ROOTFS_DIR.is_symlink():
+        # Primera reconstrucción: el rootfs original pasa a ser una versión más
+        run_privileged(["mv", ROOTFS_DIR.as_posix(), (BASE_DIR / "rootfs-initial").as_posix()], check=True)
+
+    tmp_link = BASE_DIR / f".rootfs-link-{uuid.uuid4().hex[:8]}"
+    run_privileged(["ln", "-s", new_dir.name, tmp_link.as_posix()], check=True)
+    run_privileged(["mv", "-T", tmp_link.as_posix(), ROOTFS_DIR.as_posix()], check=True)
+
+    versions = sorted(
+        (d for d in BASE_DIR.glob("rootfs-*") if d.is_dir() and not d.is_symlink()),
+        key=lambda d: d.stat().st_mtime, reverse=True
+    )
+    for old_dir in versions[ROOTFS_VERSIONS_TO_KEEP:]:
+        if old_dir.resolve() != new_dir.resolve():
+            run_privileged(["rm", "-rf", old_dir.as_posix()], check=False)
+
+
+def add_base_packages(python_packages, node_packages):
+    """
+    Escribe en un archivo aparte packages.json ampliado con los paquetes nuevos y
+    devuelve su ruta. Solo sustituye a packages.json si el nuevo rootfs se activa.
     """
-    if not new_python_reqs and not new_node_packages:
-        return 
-    
-    print(f"⚠️  Actualizando configuración de paquetes...")
-    
     config = {}
     if PACKAGES_CONFIG_FILE.exists():
         with open(PACKAGES_CONFIG_FILE, 'r') as f:
             config = json.load(f)
-            
-    has_changes = False
-            
-    # --- PROCESAR PYTHON (requirements.txt) ---
-    if new_python_reqs:
-        current_reqs_str = config.get("common_python_packages", "")
-        current_reqs = set(current_reqs_str.split()) if current_reqs_str else set()
-        
-        new_req_list = [
-            r.split('==')[0].split('<')[0].split('>')[0].strip()
-            for r in new_python_reqs.splitlines() 
-            if r.strip() and not r.startswith('#')
-        ]
-        
-        all_reqs = current_reqs | set(new_req_list)
-        
-        if len(all_reqs) > len(current_reqs):
-            config["common_python_packages"] = " ".join(all_reqs)
-            print("✅ packages.json actualizado con nuevos requisitos de Python.")
-            has_changes = True
-    
-    # --- PROCESAR NODE.JS (packages.json o listado simple) ---
-    if new_node_packages:
-        current_node_str = config.get("common_node_packages", "")
-        current_node = set(current_node_str.split()) if current_node_str else set()
-        
-        new_node_list = [
-            r.strip()
-            for r in new_node_packages.splitlines() 
-            if r.strip() and not r.startswith('#')
-        ]
-        
-        all_node_packages = current_node | set(new_node_list)
-        
-        if len(all_node_packages) > len(current_node):
-            config["common_node_packages"] = " ".join(all_node_packages)
-            print("✅ packages.json actualizado con nuevos paquetes de Node.js.")
-            has_changes = True
-
-    # 2. Reconstruir el RootFS solo si hay cambios
-    if has_changes:
-        with open(PACKAGES_CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-        
-        print("⏳ Iniciando reconstrucción del RootFS (utilizando --skip-download)...")
+    for key, new_packages in (("common_python_packages", python_packages),
+                              ("common_node_packages", node_packages)):
+        current = config.get(key, "").split()
+        config[key] = " ".join(current + [p for p in new_packages if p not in current])
+    candidate = PACKAGES_CONFIG_FILE.with_name(f".packages-{uuid.uuid4().hex[:8]}.json")
+    with open(candidate, 'w') as f:
+        json.dump(config, f, indent=4)
+    return candidate
+
+
+def run_rootfs_job(job):
+    """
+    Reconstruye la imagen base en un directorio nuevo (copia de la activa, de modo
+    que el manifiesto de build_rootfs_local.py solo instala lo que falta) y la
+    activa al terminar. Las invocaciones siguen usando el rootfs actual mientras tanto.
+    """
+    packages_config = add_base_packages(job.get("python_packages", []), job.get("node_packages", []))
+    try:
+        new_dir = BASE_DIR / f"rootfs-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        set_job_progress(job, f"Copiando el rootfs activo a {new_dir.name}...")
+        run_privileged(["cp", "-a", "--reflink=auto", ROOTFS_DIR.resolve().as_posix(), new_dir.as_posix()], check=True)
+
+        command = ["nice", "-n", str(BUILD_NICENESS), sys.executable, "build_rootfs_local.py",
+                   "--skip-download", "--rootfs-dir", new_dir.as_posix(),
+                   "--packages-config", packages_config.as_posix()]
+        prefix = [] if os.geteuid() == 0 else ["sudo"]
+        process = subprocess.Popen(prefix + command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        killer = threading.Timer(ROOTFS_BUILD_TIMEOUT, process.kill)
+        killer.start()
         try:
-            result = subprocess.run(
-                ["sudo", sys.executable, "build_rootfs_local.py", "--skip-download"], 
-                capture_output=True, text=True, check=True, timeout=600 
-            )
-            print("✅ Reconstrucción del RootFS completada.")
-            print(result.stdout[-500:]) 
-        except subprocess.TimeoutExpired:
-            raise Exception("Fallo en la reconstrucción del RootFS: Tiempo de espera agotado (10 minutos).")
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Fallo de reconstrucción de RootFS. STDOUT: {e.stdout}")
-            print(f"❌ Fallo de reconstrucción de RootFS. STDERR: {e.stderr}")
-            raise Exception(f"Fallo de reconstrucción de RootFS. Código de salida: {e.returncode}")
-    else:
-        print("✅ No hay nuevos paquetes para instalar. Omite la reconstrucción del RootFS.")
+            for line in process.stdout:
+                if line.strip():
+                    set_job_progress(job, line.strip())
+            code = process.wait()
+        finally:
+            killer.cancel()
+
+        if code != 0:
+            run_privileged(["rm", "-rf", new_dir.as_posix()], check=False)
+            raise Exception(f"Fallo de reconstrucción de RootFS. Código de salida: {code}")
+
+        activate_rootfs(new_dir)
+        # La imagen activa ya incluye los paquetes: desde ahora cuentan como base
+        os.replace(packages_config, PACKAGES_CONFIG_FILE)
+        set_job_progress(job, f"RootFS {new_dir.name} activado.")
+    finally:
+        if packages_config.exists():
+            packages_config.unlink()
+
+
+def build_job_worker():
+    """Procesa la cola de construcciones de una en una, fuera de los hilos HTTP."""
+    handlers = {"layer": run_layer_job, "rootfs": run_rootfs_job}
+    while True:
+        job = BUILD_JOBS[BUILD_QUEUE.get()]
+        job["status"] = "running"
+        job["started_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            handlers[job["kind"]](job)
+            job["status"] = "completed"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            set_job_progress(job, f"Error: {e}")
+            print(f"❌ Trabajo de construcción {job['job_id']} fallido: {e}")
+        job["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
 
 
 # ========================================================
@@ -200,7 +621,160 @@ def cleanup_temp_configs():
 atexit.register(cleanup_temp_configs)
 
 
-def create_temp_config(container_id, command, mounts):
+class PhaseTimer:
+    """Cronometra las fases de una invocación con time.perf_counter()."""
+
+    def __init__(self):
+        self.phases = {}
+        self.marks = {}  # Instantes de reloj de pared para cruzar con el contenedor
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, elapsed_ms):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def mark(self, name):
+        self.marks[name] = time.time()
+
+    def as_dict(self):
+        return {name: round(ms, 3) for name, ms in self.phases.items()}
+
+
+def split_container_phases(timer, sections):
+    """
+    Reparte el tiempo de 'crun run' usando las marcas que deja el envoltorio:
+    arranque del contenedor, ejecución (intérprete + código) y salida del contenedor.
+    """
+    try:
+        exec_start = float(sections["exec_start"][0])
+        exec_end = float(sections["exec_end"][0])
+        launch, returned = timer.marks["crun_launch"], timer.marks["crun_return"]
+    except (KeyError, IndexError, ValueError):
+        return  # 'date' sin %N o proceso abortado: solo queda el total de la fase 'run'
+    timer.add("container_start", max(exec_start - launch, 0) * 1000)
+    timer.add("exec", max(exec_end - exec_start, 0) * 1000)
+    timer.add("container_exit", max(returned - exec_end, 0) * 1000)
+
+
+def record_invocation_timings(func_name, timer):
+    """Agrega las fases de la invocación por función, separando arranques en frío y en caliente."""
+    with TIMINGS_LOCK:
+        start_type = "warm" if func_name in WARM_FUNCTIONS else "cold"
+        WARM_FUNCTIONS.add(func_name)
+        per_type = FUNCTION_TIMINGS.setdefault(func_name, {}).setdefault(start_type, {})
+        for name, ms in list(timer.phases.items()) + [("total", sum(
+                ms for n, ms in timer.phases.items() if n not in ("container_start", "exec", "container_exit")))]:
+            stats = per_type.setdefault(name, {"count": 0, "total_ms": 0.0, "min_ms": ms, "max_ms": ms})
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["min_ms"] = min(stats["min_ms"], ms)
+            stats["max_ms"] = max(stats["max_ms"], ms)
+    return start_type
+
+
+def reset_function_timings(func_name):
+    """Una nueva versión de la función vuelve a empezar en frío."""
+    with TIMINGS_LOCK:
+        WARM_FUNCTIONS.discard(func_name)
+        FUNCTION_TIMINGS.pop(func_name, None)
+
+
+def build_oci_resources(limits):
+    """Traduce los límites de la función ('cpus', 'memory_mb', 'pids') a linux.resources de OCI."""
+    resources = {}
+    if limits.get("cpus"):
+        resources["cpu"] = {"quota": int(limits["cpus"] * CPU_PERIOD_US), "period": CPU_PERIOD_US}
+    if limits.get("memory_mb"):
+        memory_bytes = int(limits["memory_mb"]) * 1024 * 1024
+        resources["memory"] = {"limit": memory_bytes, "swap": memory_bytes}  # Sin swap extra
+    if limits.get("pids"):
+        resources["pids"] = {"limit": int(limits["pids"])}
+    return resources
+
+
+def read_container_stats(stats_path):
+    """Lee el volcado del envoltorio como {sección: [líneas]}."""
+    sections = {}
+    if not stats_path.exists():
+        return sections
+
+    current = None
+    for line in stats_path.read_text().splitlines():
+        if line.startswith("## "):
+            current = sections.setdefault(line[3:], [])
+        elif current is not None and line.strip():
+            current.append(line.strip())
+    return sections
+
+
+def read_host_cgroup_stats(container_id):
+    """
+    Las mismas secciones que vuelca el envoltorio, leídas desde el host. Sirve cuando
+    el envoltorio no llegó a escribirlas (plazo vencido o cancelación): hay que leerlas
+    antes de 'crun delete', que elimina el cgroup.
+    """
+    sections = {}
+    for name in CGROUP_STAT_FILES:
+        controller, _, filename = name.rpartition("/")  # cgroup v1: un árbol por controlador
+        try:
+            lines = (CGROUP_ROOT / controller / CGROUP_PARENT / container_id / filename).read_text().splitlines()
+        except OSError:
+            continue
+        sections[name] = [line.strip() for line in lines if line.strip()]
+    return sections
+
+
+def parse_cgroup_stats(sections):
+    """Tiempo de CPU, pico de memoria y bytes de E/S a partir del volcado del envoltorio."""
+    if not any(name in sections for name in CGROUP_STAT_FILES):
+        return None
+
+    usage = {}
+    cpu_stat = dict(l.split() for l in sections.get("cpu.stat", []) if len(l.split()) == 2)
+    if "usage_usec" in cpu_stat:
+        usage["cpu_time_ms"] = int(cpu_stat["usage_usec"]) / 1000
+        usage["cpu_user_ms"] = int(cpu_stat.get("user_usec", 0)) / 1000
+        usage["cpu_system_ms"] = int(cpu_stat.get("system_usec", 0)) / 1000
+    elif sections.get("cpuacct/cpuacct.usage"):
+        usage["cpu_time_ms"] = int(sections["cpuacct/cpuacct.usage"][0]) / 1e6
+
+    peak = sections.get("memory.peak") or sections.get("memory/memory.max_usage_in_bytes")
+    if peak:
+        usage["peak_memory_bytes"] = int(peak[0])
+
+    if "io.stat" in sections:
+        read_bytes = write_bytes = 0
+        for line in sections["io.stat"]:
+            fields = dict(f.split("=", 1) for f in line.split()[1:] if "=" in f)
+            read_bytes += int(fields.get("rbytes", 0))
+            write_bytes += int(fields.get("wbytes", 0))
+        usage["io_read_bytes"] = read_bytes
+        usage["io_write_bytes"] = write_bytes
+
+    return usage
+
+
+def parse_limits_form(form):
+    """Lee los límites opcionales del formulario de subida. Lanza ValueError si no son válidos."""
+    limits = {}
+    for field, key, cast in (("cpu_limit", "cpus", float),
+                             ("memory_limit_mb", "memory_mb", int),
+                             ("pids_limit", "pids", int)):
+        value = form.get(field)
+        if value:
+            limits[key] = cast(value)
+            if limits[key] <= 0:
+                raise ValueError(f"{field} debe ser positivo.")
+    return limits
+
+
+def create_temp_config(container_id, command, mounts, env=None, resources=None):
     base_config_path = ROOTFS_DIR / "config.json"
     if not base_config_path.exists():
         raise FileNotFoundError(f"El archivo config.json base no se encontró en: {base_config_path}")
@@ -215,12 +789,21 @@ def create_temp_config(container_id, command, mounts):
     # CORRECCIÓN DE PERMISOS
     config['process']['cwd'] = "/mnt" 
     
+    # Cada montaje es (origen, destino) u (origen, destino, "ro")
     oci_mounts = [
-        {"destination": dst, "type": "bind", "source": src, "options": ["rbind", "rprivate"]} 
-        for src, dst in mounts
+        {"destination": dst, "type": "bind", "source": src, "options": ["rbind", "rprivate", *opts]} 
+        for src, dst, *opts in mounts
     ]
     config['mounts'] = config.get('mounts', []) + oci_mounts
 
+    if env:
+        process_env = [e for e in config['process'].get('env', []) if e.split('=', 1)[0] not in env]
+        config['process']['env'] = process_env + [f"{k}={v}" for k, v in env.items()]
+
+    if resources:
+        config.setdefault('linux', {}).setdefault('resources', {}).update(resources)
+    config.setdefault('linux', {})['cgroupsPath'] = f"/{CGROUP_PARENT}/{container_id}"
+
     temp_dir = Path(tempfile.gettempdir()) / container_id
     temp_dir.mkdir(exist_ok=True)
     
@@ -250,26 +833,79 @@ def build_c_function(src_path: Path, dest_path: Path):
     print("✅ Compilado correctamente.")
 
 
-def run_in_container(command, mounts=None):
+def stream_process_output(cmd, cwd, stdin_data, timeout, niceness, on_line):
+    """
+    Como subprocess.run, pero entrega cada línea de stdout a `on_line` según llega.
+    Devuelve (stderr, código de salida); si vence el plazo total lanza TimeoutExpired.
+    """
+    process = subprocess.Popen(cmd, cwd=cwd, text=True, bufsize=1,
+                               stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               preexec_fn=(lambda: os.nice(niceness)) if niceness else None)
+    # stderr se vacía en paralelo para que un volcado grande no bloquee al proceso
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+    killer = threading.Timer(timeout, lambda: (timed_out.set(), process.kill()))
+    killer.start()
+    try:
+        if stdin_data is not None:
+            process.stdin.write(stdin_data)
+            process.stdin.close()
+        for line in process.stdout:
+            if line.strip():
+                on_line(line.rstrip("\n"))
+        code = process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        killer.cancel()
+        stderr_reader.join(timeout=1)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return "".join(stderr_chunks).strip(), code
+
+
+def run_in_container(command, mounts=None, env=None, timeout=30, niceness=0, stdin_data=None,
+                     resources=None, timer=None, on_line=None, cgroup_stats=None):
+    """
+    Ejecuta `command` en un contenedor crun de un solo uso y devuelve (stdout, stderr, código).
+    Si el contenedor no termina por sí mismo y se pasa el dict `cgroup_stats`, este recibe
+    las estadísticas de su cgroup leídas desde el host antes de eliminarlo.
+    """
     mounts = mounts or []
+    timer = timer or PhaseTimer()
     container_id = "faas-task-" + str(uuid.uuid4()).split('-')[0] 
     
-    bundle_path = create_temp_config(container_id, command, mounts)
+    with timer.phase("config"):
+        bundle_path = create_temp_config(container_id, command, mounts, env, resources)
     
-    cmd = [
-        "sh", "-c",
-        f"cd {bundle_path} && {CRUN_BIN} run {container_id}" 
-    ]
+    # crun se lanza sin shell intermedio: el bundle es el directorio de trabajo
+    cmd = [CRUN_BIN, "run", container_id]
+    exited = False  # El contenedor terminó por sí mismo (sin plazo vencido ni cancelación)
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        out = result.stdout.strip()
-        err = result.stderr.strip()
-        code = result.returncode
+        timer.mark("crun_launch")
+        with timer.phase("run"):
+            if on_line is None:
+                result = subprocess.run(cmd, cwd=bundle_path, input=stdin_data,
+                                        stdin=None if stdin_data is not None else subprocess.DEVNULL,
+                                        capture_output=True, text=True, timeout=timeout,
+                                        preexec_fn=(lambda: os.nice(niceness)) if niceness else None)
+                out, err, code = result.stdout.strip(), result.stderr.strip(), result.returncode
+            else:
+                # Salida por partes: cada línea de stdout se entrega según llega
+                out = ""
+                err, code = stream_process_output(cmd, bundle_path, stdin_data, timeout, niceness, on_line)
+        exited = True
+        timer.mark("crun_return")
     
     except subprocess.TimeoutExpired:
         out = ""
-        err = "Timeout: La función excedió el límite de tiempo de ejecución (30s)."
+        err = f"Timeout: La función excedió el límite de tiempo de ejecución ({timeout}s)."
         code = 124 
     except Exception as e:
         out = ""
@@ -277,96 +913,1341 @@ def run_in_container(command, mounts=None):
         err = err_msg
         code = 125
     finally:
-        subprocess.run([CRUN_BIN, "delete", container_id], stderr=subprocess.DEVNULL)
-        if container_id in TEMP_CONFIG_FILES:
-            temp_config_path = TEMP_CONFIG_FILES.pop(container_id)
-            try:
-                shutil.rmtree(temp_config_path.parent) 
-            except OSError:
-                 pass
+        with timer.phase("cleanup"):
+            if not exited:
+                # Matar al cliente crun no detiene el contenedor: se mata por su id
+                subprocess.run([CRUN_BIN, "kill", container_id, "KILL"], stderr=subprocess.DEVNULL)
+                if cgroup_stats is not None:
+                    cgroup_stats.update(read_host_cgroup_stats(container_id))
+            subprocess.run([CRUN_BIN, "delete", "-f", container_id], stderr=subprocess.DEVNULL)
+            if container_id in TEMP_CONFIG_FILES:
+                temp_config_path = TEMP_CONFIG_FILES.pop(container_id)
+                try:
+                    shutil.rmtree(temp_config_path.parent) 
+                except OSError:
+                     pass
         
     return out, err, code
 
 # ========================================================
-# ⚙️ FUNCIONES DE EJECUCIÓN (Lógica extraída para DRY) 👈 ¡NUEVO!
+# 🔌 BACKENDS DE EJECUCIÓN
+# ========================================================
+
+class ExecutionFailed(Exception):
+    """Fallo de la función con datos para su entrada de error (p. ej. 'resources' consumidos)."""
+
+    def __init__(self, message, extras=None):
+        super().__init__(message)
+        self.extras = extras or {}
+
+
+class ExecutionBackend(ABC):
+    """
+    Interfaz común de los backends. `invoke` ejecuta la función con `args` usando
+    `scratch_dir` como directorio de intercambio y devuelve (resultado, extras),
+    donde extras se añade a la entrada de log; si la ejecución falla, lanza excepción.
+    Con `on_item` el resultado se entrega por partes, un elemento por llamada.
+    """
+    name = None
+    runtimes = ()
+
+    @abstractmethod
+    def invoke(self, func_name, func_data, args, scratch_dir, timer, on_item=None):
+        """Ejecuta una invocación y devuelve (resultado, extras)."""
+
+    def retire(self, func_name):
+        """Libera el estado caliente de una función (nueva versión o borrado)."""
+
+    def prewarm(self, func_name, func_data):
+        """
+        Prepara la función antes de su primera invocación ejecutando su `init()`.
+        Devuelve los ms de init (None si el backend no mantiene estado caliente).
+        """
+        return None
+
+
+class CrunBackend(ExecutionBackend):
+    """Aislamiento completo: un contenedor crun por invocación sobre el rootfs Alpine."""
+    name = "crun"
+    runtimes = (".py", ".js", ".c")
+
+    def invoke(self, func_name, func_data, args, scratch_dir, timer, on_item=None):
+        t_phase = time.perf_counter()
+        abs_func_path = Path(func_data["file_path"])
+        file_ext = func_data["file_ext"]
+        payload_mode = func_data.get("payload_mode", "argv")
+        bundle = func_data.get("bundle")
+
+        if not bundle:
+            temp_func_path = scratch_dir / abs_func_path.name
+            shutil.copy(abs_func_path, temp_func_path)
+            os.chmod(temp_func_path, 0o755)
+
+        # La capa de dependencias propia (si existe) se monta encima de la imagen base
+        layer_mounts, env = layer_mounts_and_env(func_data)
+        mounts = [(scratch_dir.as_posix(), "/mnt")] + layer_mounts
+
+        env = {**env, "FAAS_INPUT_FILE": "/mnt/input.json", "FAAS_OUTPUT_BIN": "/mnt/output.bin"}
+        if (scratch_dir / "input.bin").exists():
+            env["FAAS_INPUT_BIN"] = "/mnt/input.bin"
+        if on_item is not None:
+            env["PYTHONUNBUFFERED"] = "1"  # Cada print llega en cuanto se escribe (C: fflush)
+        if bundle:
+            # Paquete desplegado: se monta tal cual, sin copias por invocación (.pyc y binario C ya generados)
+            mounts.append((bundle_path(BUNDLES_DIR, bundle["digest"]), BUNDLE_MOUNT_POINT, "ro"))
+            env["PYTHONPATH"] = ":".join(filter(None, [BUNDLE_MOUNT_ROOT, env.get("PYTHONPATH")]))
+
+        stdin_data = None
+        argv = []
+        if payload_mode == "argv":
+            argv = [str(a) for a in args]
+        elif payload_mode == "stdin":
+            stdin_data = json.dumps({"args": args})
+        else:
+            with open(scratch_dir / "input.json", 'w') as f:
+                json.dump({"args": args}, f)
+
+        if bundle:
+            command = bundle_command(bundle) + argv
+        elif file_ext == ".py":
+            command = ["python3", f"/mnt/{abs_func_path.name}"] + argv
+        elif file_ext == ".js":
+            command = ["node", f"/mnt/{abs_func_path.name}"] + argv
+        elif file_ext == ".c":
+            executable_name = abs_func_path.stem
+            command = [f"/mnt/{executable_name}"] + argv
+        else:
+            raise ValueError(f"Extensión de archivo no soportada: {file_ext}")
+        
+        # Límites de cgroup de la función y envoltorio que mide su consumo real
+        command = ["sh", "-c", CONTAINER_WRAPPER, "faas"] + command
+        resources = build_oci_resources(func_data.get("limits") or {})
+        timer.add("prepare", (time.perf_counter() - t_phase) * 1000)
+
+        if file_ext == ".c" and not bundle:
+            with timer.phase("compile"):
+                build_c_function(temp_func_path, temp_func_path)
+
+        on_line = (lambda line: on_item(parse_output_line(line))) if on_item is not None else None
+        host_stats = {}
+        out, err, code = run_in_container(command, mounts, env, stdin_data=stdin_data,
+                                          resources=resources, timer=timer, timeout=INVOCATION_TIMEOUT,
+                                          on_line=on_line, cgroup_stats=host_stats)
+
+        with timer.phase("parse"):
+            sections = read_container_stats(scratch_dir / CONTAINER_STATS_FILE)
+            split_container_phases(timer, sections)
+
+            # El consumo se informa también si la función falla o agota su plazo
+            extras = {}
+            try:
+                usage = parse_cgroup_stats(sections or host_stats)
+            except (OSError, ValueError) as e:
+                usage = None
+                print(f"⚠️ Estadísticas de cgroup ilegibles para {func_name}: {e}")
+            if usage is not None:
+                extras["resources"] = usage
+            
+            if code != 0:
+                raise ExecutionFailed(f"Fallo de ejecución. Código de salida: {code}. Error: {err or out}", extras)
+
+            # El resultado puede dejarse en /mnt/output.json para no mezclarlo con prints
+            output_json = scratch_dir / "output.json"
+            if on_item is not None:
+                result = None  # Ya entregado línea a línea
+            elif output_json.exists():
+                with open(output_json, 'r') as f:
+                    result = json.load(f)
+            else:
+                try:
+                    result = json.loads(out)
+                except json.JSONDecodeError:
+                    result = out 
+        return result, extras
+
+
+class InProcessBackend(ExecutionBackend):
+    """
+    Sin aislamiento y con la menor latencia: el módulo se importa una vez en el
+    propio servidor y `main(*args)` se llama directamente. Solo para código confiable.
+    El `init()` opcional se ejecuta una vez por carga y `shutdown()` al retirarlo.
+    """
+    name = "inprocess"
+    runtimes = (".py",)
+
+    def __init__(self):
+        self._modules = {}  # func_name -> {"path", "mtime", "module", "init_ms", "initialized"}
+        self._lock = threading.Lock()
+
+    def _load(self, func_name, func_data):
+        file_path = func_data["file_path"]
+        mtime = os.stat(file_path).st_mtime
+        with self._lock:
+            cached = self._modules.get(func_name)
+            if cached and (cached["path"], cached["mtime"]) == (file_path, mtime):
+                return cached
+            if func_data.get("bundle"):
+                module = import_bundle(BUNDLES_DIR, func_data["bundle"])
+            else:
+                spec = importlib.util.spec_from_file_location(f"faas_inprocess_{func_name}", file_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            if not callable(getattr(module, 'main', None)):
+                forget_bundle_modules(module)
+                raise AttributeError("El código no define la función de entrada requerida: 'def main(*args)'.")
+            self._modules[func_name] = {"path": file_path, "mtime": mtime, "module": module,
+                                        "lock": threading.Lock(), "initialized": False}
+            return self._modules[func_name]
+
+    def _initialize(self, state):
+        """Ejecuta init() si está pendiente; devuelve los ms si se ejecutó ahora."""
+        if state["initialized"]:
+            return None
+        with state["lock"]:
+            if state["initialized"]:
+                return None
+            init_ms = None
+            if callable(getattr(state["module"], 'init', None)):
+                t_init = time.perf_counter()
+                state["module"].init()
+                init_ms = round((time.perf_counter() - t_init) * 1000, 3)
+            state["initialized"] = True
+            return init_ms
+
+    def invoke(self, func_name, func_data, args, scratch_dir, timer, on_item=None):
+        with timer.phase("prepare"):
+            state = self._load(func_name, func_data)
+        init_ms = self._initialize(state)
+        if init_ms is not None:
+            timer.add("init", init_ms)
+        with timer.phase("exec"):
+            cpu_start = time.thread_time()
+            result = state["module"].main(*args)
+            if on_item is not None:
+                for item in stream_items(result):
+                    on_item(item)
+                result = None
+            cpu_ms = round((time.thread_time() - cpu_start) * 1000, 3)
+        extras = {"resources": {"cpu_time_ms": cpu_ms}}
+        if init_ms is not None:
+            extras["init_ms"] = init_ms
+        return result, extras
+
+    def prewarm(self, func_name, func_data):
+        return self._initialize(self._load(func_name, func_data))
+
+    def retire(self, func_name):
+        with self._lock:
+            state = self._modules.pop(func_name, None)
+        if state:
+            forget_bundle_modules(state["module"])
+        if state and state["initialized"] and callable(getattr(state["module"], 'shutdown', None)):
+            try:
+                state["module"].shutdown()
+            except Exception as e:
+                print(f"⚠️ shutdown() de {func_name} falló: {e}")
+
+
+# Bucle del worker del backend 'subprocess'. El canal de respuesta es una copia
+# del stdout original; el fd 1 se redirige a /dev/null y los print() de la función
+# se capturan, de modo que nada puede corromper el protocolo (una línea JSON por llamada).
+# Las restricciones (argv[1]) las aplica el propio worker al arrancar, antes de leer
+# ninguna petición: en un preexec_fn, tras fork() de un servidor con hilos, podría bloquearse.
+SUBPROCESS_WORKER_SOURCE = r'''
+import contextlib, ctypes, importlib, importlib.util, io, json, os, resource, sys, time, traceback
+
+def restrict(limits):
+    # rlimits (memoria, archivos, core) y PR_SET_NO_NEW_PRIVS: sin ganar privilegios vía setuid
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limits["max_open_files"], limits["max_open_files"]))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (limits["max_file_bytes"], limits["max_file_bytes"]))
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    if ctypes.CDLL(None, use_errno=True).prctl(38, 1, 0, 0, 0) != 0:
+        raise OSError(ctypes.get_errno(), "PR_SET_NO_NEW_PRIVS")
+
+restrict(json.loads(sys.argv[1]))
+reply_channel = os.fdopen(os.dup(1), "w", buffering=1)
+os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+base_env = dict(os.environ)  # Cada llamada parte de este entorno: nada se hereda de la anterior
+modules = {}
+initialized = {}
+
+def stream_items(result):
+    # Resultado por partes: cada elemento de un iterable; cualquier otro valor es un único elemento
+    if isinstance(result, (str, bytes, dict)) or not hasattr(result, "__iter__"):
+        return [result]
+    return result
+
+def load(path, bundle=None):
+    mtime = os.stat(path).st_mtime
+    cached = modules.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    if bundle:
+        # Paquete desplegado: el punto de entrada es un submódulo (imports relativos, .pyc ya generados)
+        package = "faas_bundle_%d" % len(modules)
+        spec = importlib.util.spec_from_loader(package, None, is_package=True)
+        spec.submodule_search_locations.append(bundle["root"])
+        sys.modules[package] = importlib.util.module_from_spec(spec)
+        module = importlib.import_module(package + "." + bundle["module"])
+    else:
+        spec = importlib.util.spec_from_file_location("func", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    modules[path] = (mtime, module)
+    return module
+
+def prepare(path, bundle=None):
+    # init() una vez por carga del módulo; devuelve (módulo, ms de init o None)
+    module = load(path, bundle)
+    if initialized.get(path) is module:
+        return module, None
+    init_ms = None
+    if callable(getattr(module, "init", None)):
+        start = time.perf_counter()
+        module.init()
+        init_ms = round((time.perf_counter() - start) * 1000, 3)
+    initialized[path] = module
+    return module, init_ms
+
+for line in sys.stdin:
+    request = json.loads(line)
+    init_ms = None
+    if request.get("op") == "init":
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, init_ms = prepare(request["file"], request.get("bundle"))
+            reply = {"ok": True, "init_ms": init_ms}
+        except BaseException as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        reply_channel.write(json.dumps(reply) + "\n")
+        continue
+    os.chdir(request["scratch"])
+    os.environ.clear()
+    os.environ.update(base_env)
+    os.environ.update(request["env"])
+    captured = io.StringIO()
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        with contextlib.redirect_stdout(captured):
+            module, init_ms = prepare(request["file"], request.get("bundle"))
+            result = module.main(*request["args"])
+            if request.get("stream"):
+                for item in stream_items(result):
+                    reply_channel.write(json.dumps({"item": item}, default=str) + "\n")
+                result = None
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            result = str(result)
+        reply = {"ok": True, "result": result}
+    except BaseException as e:
+        reply = {"ok": False, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc(limit=5)}
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    reply["init_ms"] = init_ms
+    reply["stdout"] = captured.getvalue()[-4096:]
+    reply["resources"] = {
+        "cpu_time_ms": round((after.ru_utime - before.ru_utime + after.ru_stime - before.ru_stime) * 1000, 3),
+        "peak_memory_bytes": after.ru_maxrss * 1024,
+    }
+    os.chdir("/")
+    reply_channel.write(json.dumps(reply) + "\n")
+
+# stdin cerrado: el servidor retira el worker; shutdown() de los módulos inicializados
+for module in initialized.values():
+    if callable(getattr(module, "shutdown", None)):
+        try:
+            module.shutdown()
+        except Exception:
+            pass
+'''
+
+
+def worker_restrictions(limits):
+    """Restricciones que el worker se aplica a sí mismo al arrancar (restrict() en su código)."""
+    restrictions = {"max_open_files": SUBPROCESS_MAX_OPEN_FILES, "max_file_bytes": SUBPROCESS_MAX_FILE_BYTES}
+    if limits.get("memory_mb"):
+        restrictions["memory_bytes"] = int(limits["memory_mb"]) * 1024 * 1024
+    return restrictions
+
+
+class SubprocessWorker:
+    """Proceso Python persistente que ejecuta las llamadas de una función."""
+
+    def __init__(self, limits):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", "-c", SUBPROCESS_WORKER_SOURCE, json.dumps(worker_restrictions(limits))],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0,
+            cwd="/", env={"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "LANG": "C.UTF-8"},
+            start_new_session=True
+        )
+        self._buffer = b""
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        """Retiro ordenado: al cerrar stdin el worker ejecuta los shutdown() y termina."""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=WORKER_SHUTDOWN_GRACE)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def call(self, request, timeout, on_item=None):
+        """Envía la llamada y espera la respuesta; las líneas {"item"} previas van a `on_item`."""
+        self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while True:
+            while b"\n" not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timeout: La función excedió el límite de tiempo de ejecución ({timeout}s).")
+                ready, _, _ = select.select([fd], [], [], remaining)
+                if ready:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        raise RuntimeError("El worker terminó inesperadamente (¿límite de memoria excedido?).")
+                    self._buffer += chunk
+            line, _, self._buffer = self._buffer.partition(b"\n")
+            reply = json.loads(line)
+            if on_item is not None and "ok" not in reply:
+                on_item(reply["item"])
+                continue
+            return reply
+
+
+class SubprocessPool:
+    """Pool acotado de workers calientes de una función."""
+
+    def __init__(self, limits, max_workers):
+        self.limits = limits
+        self.max_workers = max_workers
+        self.closed = False
+        self._idle = []
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive():
+                        return worker
+                    self._count -= 1
+                if self._count < self.max_workers:
+                    self._count += 1
+                    break
+                self._cond.wait()
+        try:
+            return SubprocessWorker(self.limits)
+        except Exception:
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, worker, healthy=True):
+        with self._cond:
+            if healthy and not self.closed and worker.alive():
+                self._idle.append(worker)
+                self._cond.notify()
+                return
+            self._count -= 1
+            self._cond.notify()
+        if healthy:
+            worker.close()
+        else:
+            worker.kill()
+
+    def stats(self):
+        with self._cond:
+            return {"workers": self._count, "idle": len(self._idle)}
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for worker in idle:
+            worker.close()
+
+
+class SubprocessBackend(ExecutionBackend):
+    """
+    Aislamiento ligero sin root: workers Python precalentados y reutilizados, con
+    rlimits y no_new_privs. Los argumentos viajan como JSON (sin argv ni shell).
+    """
+    name = "subprocess"
+    runtimes = (".py",)
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool_for(self, func_name, func_data):
+        with self._lock:
+            pool = self._pools.get(func_name)
+            if pool is None:
+                pool = SubprocessPool(func_data.get("limits") or {}, SUBPROCESS_POOL_SIZE)
+                self._pools[func_name] = pool
+            return pool
+
+    def invoke(self, func_name, func_data, args, scratch_dir, timer, on_item=None):
+        pool = self.pool_for(func_name, func_data)
+        env = {"FAAS_OUTPUT_BIN": (scratch_dir / "output.bin").as_posix()}
+        if (scratch_dir / "input.bin").exists():
+            env["FAAS_INPUT_BIN"] = (scratch_dir / "input.bin").as_posix()
+
+        with timer.phase("prepare"):
+            worker = pool.acquire()
+        healthy = False
+        init_ms = None
+        t_call = time.perf_counter()
+        try:
+            reply = worker.call({"file": func_data["file_path"], "bundle": bundle_worker_spec(func_data),
+                                 "args": args, "stream": on_item is not None,
+                                 "scratch": scratch_dir.as_posix(), "env": env}, INVOCATION_TIMEOUT, on_item)
+            init_ms = reply.get("init_ms")
+            healthy = True
+        finally:
+            pool.release(worker, healthy)
+            # El init() de un worker nuevo se informa aparte de la ejecución
+            call_ms = (time.perf_counter() - t_call) * 1000
+            if init_ms is not None:
+                timer.add("init", init_ms)
+                call_ms -= init_ms
+            timer.add("exec", call_ms)
+
+        if not reply["ok"]:
+            raise Exception(f"Fallo de ejecución. Error: {reply['error']}")
+        extras = {"resources": reply["resources"]}
+        if init_ms is not None:
+            extras["init_ms"] = init_ms
+        return reply["result"], extras
+
+    def prewarm(self, func_name, func_data):
+        """Arranca un worker del pool y ejecuta en él el init() de la función."""
+        pool = self.pool_for(func_name, func_data)
+        worker = pool.acquire()
+        healthy = False
+        try:
+            reply = worker.call({"op": "init", "file": func_data["file_path"],
+                                 "bundle": bundle_worker_spec(func_data)}, INIT_TIMEOUT)
+            healthy = True
+        finally:
+            pool.release(worker, healthy)
+        if not reply["ok"]:
+            raise Exception(f"Fallo en init(): {reply['error']}")
+        return reply["init_ms"]
+
+    def retire(self, func_name):
+        with self._lock:
+            pool = self._pools.pop(func_name, None)
+        if pool:
+            pool.close()
+
+    def worker_stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {func_name: pool.stats() for func_name, pool in pools.items()}
+
+
+EXECUTION_BACKENDS = {
+    backend.name: backend for backend in (CrunBackend(), SubprocessBackend(), InProcessBackend())
+}
+
+
+def prewarm_functions():
+    """Ejecuta al arrancar el init() de las funciones marcadas con 'prewarm'."""
+    for func_name, func_data in list(functions.items()):
+        if not func_data.get("prewarm") or func_data.get("status", "ready") != "ready":
+            continue
+        backend = EXECUTION_BACKENDS[func_data.get("backend", DEFAULT_BACKEND)]
+        try:
+            init_ms = backend.prewarm(func_name, func_data)
+            print(f"🔥 {func_name} precalentada ({backend.name}, init: {init_ms} ms)")
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar {func_name}: {e}")
+
+
+def retire_function_runtime(func_name):
+    """Descarta el estado caliente de una función: mediciones, workers y módulos cargados."""
+    reset_function_timings(func_name)
+    for backend in EXECUTION_BACKENDS.values():
+        backend.retire(func_name)
+
+
+@atexit.register
+def retire_all_functions():
+    """Al salir, los workers y módulos calientes ejecutan su shutdown()."""
+    for backend in EXECUTION_BACKENDS.values():
+        for func_name in list(functions):
+            backend.retire(func_name)
+
+
+# ========================================================
+# ⚙️ FUNCIONES DE EJECUCIÓN (Lógica extraída para DRY) 👈 ¡NUEVO!
+# ========================================================
+
+def create_scratch_dir():
+    """Directorio por invocación en tmpfs, montado en /mnt dentro del contenedor."""
+    scratch_dir = Path(tempfile.mkdtemp(prefix="faas-", dir=SCRATCH_ROOT))
+    os.chmod(scratch_dir, 0o777)
+    return scratch_dir
+
+
+def read_invocation_request(scratch_dir):
+    """
+    Extrae los argumentos de la invocación y, si la hay, guarda la entrada binaria
+    en `scratch_dir/input.bin` copiándola por bloques (sin cargarla entera en memoria).
+
+    Formatos admitidos:
+      - application/json: {"args": [...], "callback_url": ...}
+      - application/octet-stream: cuerpo binario, args como JSON en ?args=
+      - multipart/form-data: archivo 'data', args como JSON en el campo 'args'
+    """
+    if request.mimetype == 'application/octet-stream':
+        params = request.args
+        with open(scratch_dir / "input.bin", 'wb') as f:
+            shutil.copyfileobj(request.stream, f, COPY_CHUNK_SIZE)
+    elif request.mimetype == 'multipart/form-data':
+        params = request.form
+        data_file = request.files.get('data')
+        if data_file:
+            data_file.save(scratch_dir / "input.bin", buffer_size=COPY_CHUNK_SIZE)
+    else:
+        data = request.get_json(silent=True)
+        params = data if data and isinstance(data, dict) else {}
+        return params.get('args', []), params.get('callback_url')
+
+    args = json.loads(params.get('args', '[]'))
+    return args, params.get('callback_url')
+
+
+def stream_items(result):
+    """Resultado por partes: cada elemento de un iterable; cualquier otro valor es un único elemento."""
+    if isinstance(result, (str, bytes, dict)) or not hasattr(result, "__iter__"):
+        return [result]
+    return result
+
+
+def parse_output_line(line):
+    """Línea de stdout de una función con 'stream': JSON si lo es, si no el texto tal cual."""
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return line
+
+
+def _execute_function_logic(func_name, args, task_id, start_time_str, scratch_dir=None, timer=None,
+                            on_item=None):
+    """
+    Contiene la lógica central de ejecución con el backend elegido por la función
+    (crun por defecto). Devuelve el diccionario de entrada (log entry) o lanza una excepción.
+
+    La entrada llega según el 'payload_mode' de la función: argv (por defecto),
+    stdin (JSON) o file (/mnt/input.json). Los binarios grandes se intercambian como
+    archivos en el scratch de tmpfs (/mnt/input.bin y /mnt/output.bin), que la
+    función puede leer/escribir con mmap sin pasar por argv ni por stdout.
+
+    Cada fase se cronometra en `timer` (también cuando la ejecución falla).
+
+    Las funciones con 'stream' entregan sus elementos a `on_item` según se producen
+    (la entrada no lleva 'result'); sin `on_item` (tareas async) se reúnen en una lista.
+    """
+    timer = timer or PhaseTimer()
+    tmpdir_path = scratch_dir or create_scratch_dir()
+    entry = None
+
+    try:
+        func_data = functions[func_name]
+        backend = EXECUTION_BACKENDS[func_data.get("backend", DEFAULT_BACKEND)]
+        collected = [] if func_data.get("stream") and on_item is None else None
+        result, extras = backend.invoke(func_name, func_data, args, tmpdir_path, timer,
+                                        on_item=collected.append if collected is not None else on_item)
+        if collected is not None:
+            result = collected
+
+        e_time = time.time()
+        entry = {
+            "id": task_id, 
+            "args": args, 
+            "result": result, 
+            "status": "success",
+            "time_start": start_time_str,
+            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "backend": backend.name,
+            **extras
+        }
+        if on_item is not None:
+            del entry["result"]
+
+        # La salida binaria se mueve (rename en el mismo tmpfs, sin copia) fuera del scratch
+        output_bin = tmpdir_path / "output.bin"
+        if output_bin.exists():
+            OUTPUTS_DIR.mkdir(exist_ok=True)
+            os.replace(output_bin, OUTPUTS_DIR / f"{task_id}.bin")
+            entry["output_binary"] = {
+                "size": (OUTPUTS_DIR / f"{task_id}.bin").stat().st_size,
+                "url": f"/task/output/{task_id}"
+            }
+        return entry
+    finally:
+        shutil.rmtree(tmpdir_path, ignore_errors=True)
+        start_type = record_invocation_timings(func_name, timer)
+        if entry is not None:
+            entry["start_type"] = start_type
+            entry["timings_ms"] = timer.as_dict()
+
+
+# ========================================================
+# 📈 MÉTRICAS POR FUNCIÓN (contadores e histogramas de buckets fijos)
+# ========================================================
+# FunctionMetrics y el registro por función están en liftr_common.metrics
+
+
+def render_metrics():
+    """Métricas en formato de exposición de texto de Prometheus."""
+    return render_prometheus(ADMISSION_CONTROL.rejections)
+
+
+@contextmanager
+def observed_invocation(func_name, cache_hit=False):
+    """Registra en las métricas la latencia del bloque y si terminó con excepción."""
+    t_call = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000, error=True, cache_hit=cache_hit)
+        raise
+    record_metrics(func_name, (time.perf_counter() - t_call) * 1000, cache_hit=cache_hit)
+
+# ========================================================
+# 📉 MUESTREO DEL SISTEMA EN SEGUNDO PLANO (ring buffer de series temporales)
+# ========================================================
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("FAAS_SAMPLE_INTERVAL", "2"))
+SAMPLE_HISTORY_SIZE = int(os.getenv("FAAS_SAMPLE_HISTORY", "1800"))  # 1 h a 2 s por muestra
+# SystemSampler está en liftr_common.sampler; aquí solo el estado propio de cada función
+
+
+def function_worker_stats():
+    """Estado por función para el muestreador: backend, workers del pool y tareas async activas."""
+    pools = EXECUTION_BACKENDS["subprocess"].worker_stats()
+    active = {}
+    for task in list(ASYNC_TASKS.values()):
+        if task['status'] in ('queued', 'running'):
+            active[task['function_name']] = active.get(task['function_name'], 0) + 1
+    stats = {}
+    for func_name, func_data in list(functions.items()):
+        metrics = FUNCTION_METRICS.get(func_name)
+        stats[func_name] = {
+            "backend": func_data.get("backend", DEFAULT_BACKEND),
+            "status": func_data.get("status", "ready"),
+            "async_active": active.get(func_name, 0),
+            "calls": metrics.calls if metrics else 0,
+            "errors": metrics.errors if metrics else 0,
+        }
+        if func_name in pools:
+            stats[func_name]["workers"] = pools[func_name]
+    return stats
+
+
+SAMPLER = SystemSampler(SAMPLE_INTERVAL_SECONDS, SAMPLE_HISTORY_SIZE, function_worker_stats)
+
+# ========================================================
+# 📡 EVENTOS DE ADMINISTRACIÓN (SSE incremental para el panel)
+# ========================================================
+
+ADMIN_EVENT_TYPES = ("invocation", "status", "function", "task")
+ADMIN_EVENT_QUEUE_SIZE = 1024
+ADMIN_SSE_KEEPALIVE_SECONDS = 15
+ADMIN_EVENT_SUBSCRIBERS = []  # Un AdminSubscriber por panel conectado
+ADMIN_EVENTS_LOCK = threading.Lock()
+ADMIN_EVENT_SEQUENCE = itertools.count(1)
+
+
+class AdminSubscriber:
+    """Cola acotada de un panel conectado. Si se llena, el panel recibe un 'snapshot' nuevo."""
+
+    def __init__(self, types):
+        self.types = types
+        self.events = queue.Queue(maxsize=ADMIN_EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def drain(self):
+        self.overflowed = False
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+def function_info(func_name):
+    """Metadatos publicables de la función."""
+    return dict(functions.get(func_name, {}))
+
+
+def publish_admin_event(kind, data):
+    """Entrega un evento a los paneles suscritos sin bloquear nunca al que lo emite."""
+    with ADMIN_EVENTS_LOCK:
+        subscribers = [s for s in ADMIN_EVENT_SUBSCRIBERS if kind in s.types]
+    if not subscribers:
+        return
+    event = (next(ADMIN_EVENT_SEQUENCE), kind, data)
+    for subscriber in subscribers:
+        try:
+            subscriber.events.put_nowait(event)
+        except queue.Full:
+            subscriber.overflowed = True
+
+
+def publish_invocation(log_key, entry):
+    """Nueva entrada de log; 'count' es el total acumulado (idempotente para el panel)."""
+    publish_admin_event("invocation", {"function": log_key, "entry": entry,
+                                       "count": len(logs.get(log_key, ()))})
+
+
+def uptime_text():
+    """Tiempo desde el arranque del sistema, como '1d 2h 3m 4s'."""
+    uptime_seconds = time.time() - psutil.boot_time()
+    days, remainder = divmod(uptime_seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(days)}d {int(hours)}h {int(minutes)}m {int(seconds)}s"
+
+
+def status_event(sample):
+    """Muestra del sistema para el panel, con el uptime (el panel solo consulta /admin/status al cargar)."""
+    return {**sample, "uptime": uptime_text()} if sample else None
+
+
+def admin_snapshot():
+    """Estado completo con el que el panel arranca (y se resincroniza)."""
+    return {
+        "functions": {func_name: function_info(func_name) for func_name in list(functions)},
+        "invocations": {log_key: len(entries) for log_key, entries in list(logs.items())},
+        "status": status_event(SAMPLER.latest()),
+    }
+
+
+def format_admin_event(kind, data, event_id=None):
+    lines = f"event: {kind}\n"
+    if event_id is not None:
+        lines += f"id: {event_id}\n"
+    return lines + f"data: {json.dumps(data, default=log_json_default)}\n\n"
+
+
+# ========================================================
+# 🧱 ALMACÉN DE BLOBS (args/resultados grandes fuera del log, por contenido)
+# ========================================================
+
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs")
+# Escritura, lectura y recolección de blobs en liftr_common.blobs
+
+
+def referenced_blobs():
+    """Digests referenciados por las entradas de log que siguen retenidas."""
+    return blob_references(logs)
+
+# ========================================================
+# 🗄️ HISTORIAL DE EJECUCIONES EN SQLITE (WAL, indexado, con agregados)
+# ========================================================
+
+HISTORY_DB_FILE = DATA_DIR / "history.db"
+# HistoryStore, los filtros de consulta y entry_timestamp están en liftr_common.history
+
+HISTORY = HistoryStore(HISTORY_DB_FILE, json_default=log_json_default)
+
+# ========================================================
+# ♻️ RETENCIÓN DE LOGS Y ARCHIVOS COMPRIMIDOS POR DÍA
+# ========================================================
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Política global (0 = sin límite); cada función puede sobrescribirla al subirse
+RETENTION_DEFAULTS = {
+    "max_entries": int(os.getenv("FAAS_RETENTION_MAX_ENTRIES", "1000")),
+    "max_age": int(os.getenv("FAAS_RETENTION_MAX_AGE", str(7 * 24 * 3600))),  # segundos
+    "max_bytes": int(os.getenv("FAAS_RETENTION_MAX_BYTES", str(1024 * 1024))),
+}
+ARCHIVE_MAX_BYTES = int(os.getenv("FAAS_ARCHIVE_MAX_BYTES", str(256 * 1024 * 1024)))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("FAAS_RETENTION_INTERVAL", "60"))
+RETENTION_LOCK = threading.Lock()
+# Los segmentos por día, su consulta y la política de caducidad están en liftr_common.retention
+
+
+def retention_policy(log_key):
+    """Política efectiva: la global con las sobrescrituras de la función (si las tiene)."""
+    policy = dict(RETENTION_DEFAULTS)
+    policy.update((functions.get(log_key) or {}).get("retention") or {})
+    return policy
+
+
+def apply_retention():
+    """
+    Rota a los archivos las entradas que exceden la política de cada log, las retira
+    del estado en memoria, del historial SQLite y de los blobs, y acota los archivos.
+    """
+    with RETENTION_LOCK:
+        now = time.time()
+        rotated = {}
+        for log_key, entries in list(logs.items()):
+            count = expired_count(entries, retention_policy(log_key), now, log_json_default)
+            if not count:
+                continue
+            expired = entries[:count]
+            try:
+                archive_entries(ARCHIVE_DIR, log_key, [inline_blobs(BLOBS_DIR, entry) for entry in expired])
+            except OSError as e:
+                print(f"ADVERTENCIA: no se pudo archivar el log de '{log_key}': {e}")
+                continue
+            # Solo se recorta el principio: las invocaciones concurrentes añaden al final
+            del entries[:count]
+            HISTORY.forget_ids([entry.get("id") for entry in expired if entry.get("id")])
+            rotated[log_key] = count
+        if rotated:
+            save_state()
+            collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+        return {"rotated": rotated, "archive_segments_removed": enforce_archive_limit(ARCHIVE_DIR, ARCHIVE_MAX_BYTES)}
+
+
+def retention_worker():
+    while True:
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            summary = apply_retention()
+            if summary["rotated"]:
+                print(f"Retención: entradas archivadas {summary['rotated']}.")
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al aplicar la retención de logs: {e}")
+        try:
+            sweep_expired_outputs()
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al retirar salidas binarias caducadas: {e}")
+
+
+def retention_report():
+    segments = list_archive_segments(ARCHIVE_DIR)
+    return {
+        "defaults": RETENTION_DEFAULTS,
+        "policies": {log_key: retention_policy(log_key) for log_key in list(logs)},
+        "archive": {"segments": len(segments), "bytes": sum(s["bytes"] for s in segments),
+                    "max_bytes": ARCHIVE_MAX_BYTES},
+    }
+
+
+# ========================================================
+# 🚦 CONTROL DE ADMISIÓN (concurrencia, colas con plazo y límites por llamante)
+# ========================================================
+
+# Límite global de ejecuciones simultáneas y de invocaciones esperando turno (0 = sin límite)
+GLOBAL_MAX_CONCURRENCY = int(os.getenv("FAAS_MAX_CONCURRENCY", str(4 * (os.cpu_count() or 1))))
+GLOBAL_QUEUE_SIZE = int(os.getenv("FAAS_GLOBAL_QUEUE_SIZE", "256"))
+# Política por función (cada función puede sobrescribirla al subirse):
+# max_concurrency 0 = solo cuenta el límite global; rate_limit en invocaciones/s por llamante (0 = sin límite)
+ADMISSION_DEFAULTS = {
+    "max_concurrency": int(os.getenv("FAAS_FUNCTION_MAX_CONCURRENCY", "0")),
+    "queue_size": int(os.getenv("FAAS_QUEUE_SIZE", "64")),
+    "queue_timeout": float(os.getenv("FAAS_QUEUE_TIMEOUT", "10")),  # segundos
+    "rate_limit": float(os.getenv("FAAS_RATE_LIMIT", "0")),
+    "rate_burst": int(os.getenv("FAAS_RATE_BURST", "0")),           # 0 = max(1, rate_limit)
+}
+# AdmissionControl (limitadores, token buckets por llamante y rechazos) está en liftr_common.admission
+
+
+def function_admission(func_name):
+    """Política de admisión propia de la función (None si usa la global)."""
+    return (functions.get(func_name) or {}).get("admission")
+
+
+ADMISSION_CONTROL = AdmissionControl(ADMISSION_DEFAULTS, GLOBAL_MAX_CONCURRENCY, GLOBAL_QUEUE_SIZE,
+                                     function_admission)
+
+
+# Identidad del llamante para los límites de ritmo: cabecera propia o, si no, la IP
+CALLER_HEADER = "X-Client-Id"
+
+
+def request_caller():
+    return request.headers.get(CALLER_HEADER) or request.remote_addr or "anonymous"
+
+
+def overloaded_response(error):
+    """429 inmediato con Retry-After: el cliente reintenta en lugar de acumular espera."""
+    return jsonify({"status": "error", "message": str(error), "reason": error.reason,
+                    "retry_after": error.retry_after}), 429, {"Retry-After": str(error.retry_after)}
+
+
+def admitted(admission_key, f, *args, **kwargs):
+    """Ejecuta el endpoint ocupando una plaza de admisión de `admission_key`."""
+    try:
+        admission = ADMISSION_CONTROL.admit(admission_key, request_caller())
+    except Overloaded as e:
+        return overloaded_response(e)
+    try:
+        response = f(*args, **kwargs)
+    except BaseException:
+        admission.release()
+        raise
+    # Una respuesta por partes (NDJSON) ocupa la plaza hasta que termina de enviarse
+    if isinstance(response, Response) and response.is_streamed:
+        response.call_on_close(admission.release)
+    else:
+        admission.release()
+    return response
+
+
+def admission_controlled(f):
+    """Envuelve un endpoint de invocación con el control de admisión de la función."""
+    @wraps(f)
+    def decorated(func_name, *args, **kwargs):
+        if func_name not in functions:
+            return f(func_name, *args, **kwargs)
+        return admitted(func_name, f, func_name, *args, **kwargs)
+    return decorated
+
+
+def pipeline_admission_controlled(f):
+    """
+    Control de admisión de un pipeline, como una invocación más ('pipeline:<nombre>'):
+    ocupa una plaza global y se le aplican el ritmo y los límites por defecto.
+    """
+    @wraps(f)
+    def decorated(pipeline_name, *args, **kwargs):
+        if pipeline_name not in pipelines:
+            return f(pipeline_name, *args, **kwargs)
+        return admitted(f"pipeline:{pipeline_name}", f, pipeline_name, *args, **kwargs)
+    return decorated
+
+# ========================================================
+# 🔁 COALESCENCIA DE INVOCACIONES (singleflight)
+# ========================================================
+
+class InFlightInvocation:
+    """Ejecución en curso a la que se adjuntan las invocaciones duplicadas."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+        self.follower_ids = []
+        self.linked_outputs = set()  # Adjuntas con su propio enlace a la salida binaria
+
+
+def function_version(func_data):
+    """Identifica la versión del código: una nueva subida nunca se coalesce con la anterior."""
+    return f"{func_data.get('created_at')}:{os.stat(func_data['file_path']).st_mtime_ns}"
+
+
+def execute_coalesced(func_name, args, task_id, start_time_str, scratch_dir=None, timer=None, on_item=None):
+    """
+    Igual que `_execute_function_logic`, pero si la función tiene 'coalesce' activado y
+    ya hay en curso una invocación con la misma versión y los mismos args, espera a
+    esa ejecución y devuelve su resultado en lugar de arrancar otro contenedor.
+    La entrada del líder indica cuántas invocaciones se le adjuntaron ('coalesced').
+    Las invocaciones con entrada binaria (input.bin) o por partes nunca se coalescen.
+    """
+    func_data = functions[func_name]
+    if not func_data.get("coalesce") or on_item is not None or \
+            (scratch_dir and (scratch_dir / "input.bin").exists()):
+        with observed_invocation(func_name):
+            return _execute_function_logic(func_name, args, task_id, start_time_str, scratch_dir, timer, on_item)
+
+    args_hash = hashlib.sha256(json.dumps(args, sort_keys=True).encode('utf-8')).hexdigest()
+    key = (func_name, function_version(func_data), args_hash)
+    with INFLIGHT_LOCK:
+        flight = INFLIGHT_INVOCATIONS.get(key)
+        leader = flight is None
+        if leader:
+            flight = INFLIGHT_INVOCATIONS[key] = InFlightInvocation()
+        else:
+            flight.follower_ids.append(task_id)
+
+    if not leader:
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        timer = timer or PhaseTimer()
+        # Las invocaciones adjuntas cuentan como aciertos: no ejecutan la función
+        with observed_invocation(func_name, cache_hit=True):
+            with timer.phase("coalesced_wait"):
+                flight.done.wait()
+            if flight.error is not None:
+                raise Exception(f"{flight.error} (invocación coalescida)")
+        # Tiempos propios: la espera, no las fases ni el consumo de la ejecución del líder
+        entry = {**flight.entry, "id": task_id, "time_start": start_time_str,
+                 "time_end": datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                 "coalesced_with": flight.entry["id"], "start_type": "coalesced",
+                 "timings_ms": timer.as_dict()}
+        for key_name in ("coalesced", "resources", "init_ms"):
+            entry.pop(key_name, None)
+        if "output_binary" in entry:
+            if task_id in flight.linked_outputs:
+                entry["output_binary"] = {**entry["output_binary"], "url": f"/task/output/{task_id}"}
+            else:
+                del entry["output_binary"]
+        return entry
+
+    try:
+        with observed_invocation(func_name):
+            flight.entry = _execute_function_logic(func_name, args, task_id, start_time_str, scratch_dir, timer)
+        return flight.entry
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        # done se activa siempre: una adjunta nunca queda esperando (con su plaza de admisión)
+        try:
+            with INFLIGHT_LOCK:
+                del INFLIGHT_INVOCATIONS[key]
+            if flight.entry is not None:
+                flight.entry["coalesced"] = len(flight.follower_ids)
+                # Cada invocación adjunta recibe su propio enlace a la salida binaria (mismo tmpfs)
+                if "output_binary" in flight.entry:
+                    for follower_id in flight.follower_ids:
+                        try:
+                            os.link(OUTPUTS_DIR / f"{task_id}.bin", OUTPUTS_DIR / f"{follower_id}.bin")
+                            flight.linked_outputs.add(follower_id)
+                        except OSError as e:
+                            print(f"⚠️ Salida binaria no disponible para la invocación adjunta {follower_id}: {e}")
+        finally:
+            flight.done.set()
+
+
+def send_binary_output(task_id):
+    """
+    Envía la salida binaria y la retira del tmpfs. El archivo se desenlaza nada más
+    abrirlo: el espacio se libera cuando el servidor cierra el descriptor al terminar.
+    """
+    output_path = OUTPUTS_DIR / f"{task_id}.bin"
+    output_file = open(output_path, 'rb')
+    output_path.unlink()
+    return send_file(output_file, mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f"{task_id}.bin")
+
+
+def sweep_expired_outputs():
+    """
+    Retira las tareas asíncronas terminadas hace más de TASK_TTL_SECONDS (con su salida
+    binaria) y las salidas que nadie descargó en OUTPUT_TTL_SECONDS, que ocupan RAM en tmpfs.
+    """
+    now = time.time()
+    with TASK_CONDITION:
+        expired = [task_id for task_id, task_info in ASYNC_TASKS.items()
+                   if task_info['status'] in TASK_FINAL_STATES
+                   and now - task_info.get('finished_at', now) > TASK_TTL_SECONDS]
+        for task_id in expired:
+            del ASYNC_TASKS[task_id]
+    removed = 0
+    for task_id in expired:
+        try:
+            (OUTPUTS_DIR / f"{task_id}.bin").unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if OUTPUTS_DIR.exists():
+        for output_path in OUTPUTS_DIR.iterdir():
+            try:
+                if now - output_path.stat().st_mtime > OUTPUT_TTL_SECONDS:
+                    output_path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return {"tasks_expired": len(expired), "outputs_removed": removed}
+
+
+# ========================================================
+# 🔔 ENTREGA PUSH DE RESULTADOS ASÍNCRONOS
 # ========================================================
 
-def _execute_function_logic(func_name, args, task_id, start_time_str):
+# /function/async no tiene autenticación: los callbacks solo pueden ir a loopback o a los
+# hosts/redes de esta lista (separados por comas: "hooks.local,10.0.5.0/24,10.0.6.7")
+WEBHOOK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("FAAS_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
+
+def webhook_host_allowed(hostname, address):
+    """Destino permitido: loopback, un nombre de la lista o una dirección dentro de sus redes."""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.is_loopback or hostname.lower() in WEBHOOK_ALLOWED_HOSTS:
+        return True
+    for allowed in WEBHOOK_ALLOWED_HOSTS:
+        try:
+            if ip in ipaddress.ip_network(allowed, strict=False):
+                return True
+        except ValueError:
+            continue  # Es un nombre de host, no una red
+    return False
+
+
+def resolve_callback_url(url):
     """
-    Contiene la lógica central de ejecución dentro del contenedor. 
-    Devuelve el diccionario de entrada (log entry) o lanza una excepción.
+    (scheme, netloc, host, port, dirección) del callback, con el host ya resuelto por DNS.
+    Todas las direcciones a las que resuelve deben estar permitidas (ValueError si no);
+    la conexión se hace a la dirección comprobada, no a una nueva resolución.
     """
-    func_data = functions[func_name]
-    abs_func_path = Path(func_data["file_path"])
-    file_ext = func_data["file_ext"]
-    
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir_path = Path(tmpdir)
-        os.chmod(tmpdir_path, 0o777) 
-        
-        temp_func_path = tmpdir_path / abs_func_path.name
-        shutil.copy(abs_func_path, temp_func_path)
-        os.chmod(temp_func_path, 0o755)
-
-        mounts = [(tmpdir_path.as_posix(), "/mnt")]
-        command = None
-
-        if file_ext == ".py":
-            python_command = ["python3", f"/mnt/{abs_func_path.name}"] + [str(a) for a in args]
-            command = [
-                "sh", "-c", 
-                f"PYTHONPATH=/usr/local/lib/python3.12/site-packages { ' '.join(python_command) }"
-            ]
-        elif file_ext == ".js":
-            command = ["node", f"/mnt/{abs_func_path.name}"] + [str(a) for a in args]
-        elif file_ext == ".c":
-            build_c_function(temp_func_path, temp_func_path)
-            executable_name = abs_func_path.stem
-            command = [f"/mnt/{executable_name}"] + [str(a) for a in args]
-        else:
-            raise ValueError(f"Extensión de archivo no soportada: {file_ext}")
-        
-        out, err, code = run_in_container(command, mounts)
-        
-        if code != 0:
-            raise Exception(f"Fallo de ejecución. Código de salida: {code}. Error: {err or out}")
-            
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url debe ser una URL http(s) válida.")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (ValueError, OSError) as e:
+        raise ValueError(f"callback_url no se puede resolver: {e}")
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(webhook_host_allowed(parts.hostname, address) for address in addresses):
+        raise ValueError("callback_url debe apuntar a loopback o a un host de FAAS_WEBHOOK_ALLOWED_HOSTS.")
+    return parts.scheme, parts.netloc, parts.hostname, port, addresses[0]
+
+
+class WebhookClient:
+    """
+    Cliente HTTP mínimo para los callbacks de tareas asíncronas.
+    Reutiliza conexiones keep-alive por host y entrega los POST desde hilos
+    propios, de modo que un webhook lento nunca bloquea al worker de la función.
+    """
+
+    def __init__(self, workers=2, max_idle_per_host=4, timeout=5):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}  # (scheme, netloc) -> [HTTPConnection libres]
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = workers
+        self._started = False
+
+    def post_json(self, url, payload):
+        """Encola el envío; los hilos de entrega se arrancan en el primer uso."""
+        with self._lock:
+            if not self._started:
+                for _ in range(self._workers):
+                    threading.Thread(target=self._deliver_loop, daemon=True).start()
+                self._started = True
+        self._queue.put((url, payload))
+
+    def _acquire(self, target):
+        scheme, netloc, host, port, address = target
+        with self._lock:
+            idle = self._idle.get(target)
+            if idle:
+                return idle.pop()
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(netloc, timeout=self.timeout)
+        # Host y SNI siguen siendo el nombre, pero el socket va a la dirección ya comprobada
+        conn._create_connection = lambda _, *args, **kwargs: socket.create_connection((address, port), *args, **kwargs)
+        return conn
+
+    def _release(self, target, conn):
+        with self._lock:
+            idle = self._idle.setdefault(target, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, url, body):
+        target = resolve_callback_url(url)  # Se comprueba de nuevo: el DNS puede haber cambiado
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        # Un reintento con conexión nueva por si el servidor cerró la keep-alive
+        for attempt in range(2):
+            conn = self._acquire(target)
+            try:
+                conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(target, conn)
+                return response.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if attempt == 1:
+                    raise
+
+    def _deliver_loop(self):
+        while True:
+            url, payload = self._queue.get()
+            try:
+                status = self._send(url, json.dumps(payload).encode("utf-8"))
+                if 300 <= status < 400:
+                    # Las redirecciones no se siguen: podrían llevar a un destino no permitido
+                    print(f"⚠️ Webhook {url} respondió con una redirección ({status}); no se sigue.")
+                elif status >= 400:
+                    print(f"⚠️ Webhook {url} respondió con código {status}.")
+            except Exception as e:
+                print(f"⚠️ Fallo al entregar el webhook {url}: {e}")
+
+
+WEBHOOK_CLIENT = WebhookClient()
+
+
+def finish_async_task(task_id, updates):
+    """
+    Marca la tarea como terminada y entrega el resultado en el acto:
+    despierta a los long-polls, emite el evento SSE y dispara el webhook.
+    """
+    with TASK_CONDITION:
+        task_info = ASYNC_TASKS[task_id]
+        task_info.update(updates)
+        task_info['finished_at'] = time.time()
+        TASK_CONDITION.notify_all()
+        subscribers = list(TASK_EVENT_SUBSCRIBERS)
+
+    event = {
+        "task_id": task_id,
+        "function_name": task_info['function_name'],
+        "status": task_info['status'],
+        "time_end": task_info.get('time_end'),
+    }
+    for subscriber in subscribers:
         try:
-            result = json.loads(out)
-        except json.JSONDecodeError:
-            result = out 
+            subscriber.put_nowait(event)
+        except queue.Full:
+            pass  # Cliente SSE demasiado lento: se descarta el evento para él
+    publish_admin_event("task", event)
 
-        e_time = time.time()
-        entry = {
-            "id": task_id, 
-            "args": args, 
-            "result": result, 
-            "status": "success",
-            "time_start": start_time_str,
-            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")
-        }
-        return entry
+    callback_url = task_info.get('callback_url')
+    if callback_url:
+        WEBHOOK_CLIENT.post_json(callback_url, task_info['execution_log'])
 
 
-def async_function_worker(task_id, func_name, args, start_time_str):
+def async_function_worker(task_id, func_name, args, start_time_str, scratch_dir=None, admission=None):
     """
     Ejecuta la lógica de la función en un hilo separado y almacena el resultado.
     """
     global logs, ASYNC_TASKS
+
+    # Turno en el control de admisión (sin plazo: la tarea sigue 'queued' mientras espera)
+    if admission:
+        admission.start()
     
     # Marcamos la tarea como en ejecución
-    ASYNC_TASKS[task_id]['status'] = 'running'
+    with TASK_CONDITION:
+        ASYNC_TASKS[task_id]['status'] = 'running'
+    publish_admin_event("task", {"task_id": task_id, "function_name": func_name, "status": "running"})
 
+    timer = PhaseTimer()
     try:
-        entry = _execute_function_logic(func_name, args, task_id, start_time_str)
-        
-        # Actualizar ASYNC_TASKS
-        ASYNC_TASKS[task_id].update({
+        entry = execute_coalesced(func_name, args, task_id, start_time_str, scratch_dir, timer)
+        updates = {
             'status': 'completed',
             'result': entry['result'],
             'time_end': entry['time_end'],
             'execution_log': entry
-        })
+        }
             
     except Exception as e:
         e_time = time.time()
@@ -378,20 +2259,30 @@ def async_function_worker(task_id, func_name, args, start_time_str):
             "error": error_msg, 
             "status": "error",
             "time_start": start_time_str,
-            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "timings_ms": timer.as_dict(),
+            **getattr(e, "extras", {})
         }
         
-        # Actualizar ASYNC_TASKS
-        ASYNC_TASKS[task_id].update({
+        updates = {
             'status': 'failed',
             'error': error_msg,
             'time_end': entry['time_end'],
             'execution_log': entry
-        })
+        }
+    finally:
+        if admission:
+            admission.release()
+
+    # Actualizar ASYNC_TASKS y notificar a quien espera el resultado
+    finish_async_task(task_id, updates)
 
     # Guardar el registro de ejecución en el log global
-    logs.setdefault(func_name, []).append(entry)
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(func_name, []).append(log_entry)
     save_state()
+    HISTORY.record(func_name, log_entry)
+    publish_invocation(func_name, log_entry)
 
 
 # ========================================================
@@ -401,26 +2292,77 @@ def async_function_worker(task_id, func_name, args, start_time_str):
 @app.route('/admin/upload', methods=['POST'])
 @requires_auth
 def upload_function():
-    if 'code' not in request.files:
-        return jsonify({"status": "error", "message": "Falta el archivo 'code'."}), 400
+    # 'code': un único archivo (.py/.js/.c); 'bundle': zip/tar con manifest.json, varios archivos y datos
+    bundle_file = request.files.get('bundle')
+    if 'code' not in request.files and not bundle_file:
+        return jsonify({"status": "error", "message": "Falta el archivo 'code' (o el paquete 'bundle')."}), 400
         
-    func_file = request.files['code']
+    func_file = bundle_file or request.files['code']
     file_name = func_file.filename
-    func_name = request.form.get('name', Path(file_name).stem) 
+    func_name = request.form.get('name', bundle_stem(file_name) if bundle_file else Path(file_name).stem)
     
     if not func_name:
         return jsonify({"status": "error", "message": "El nombre de la función es obligatorio."}), 400
     
+    payload_mode = request.form.get('payload_mode', 'argv')
+    if payload_mode not in PAYLOAD_MODES:
+        return jsonify({"status": "error", "message": f"payload_mode debe ser uno de: {', '.join(PAYLOAD_MODES)}."}), 400
+
+    try:
+        limits = parse_limits_form(request.form)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Límites de recursos inválidos: {e}"}), 400
+
+    # prewarm: init() al subir la función y al arrancar el servidor (backends con estado caliente)
+    prewarm = request.form.get('prewarm', '').lower() in ('1', 'true', 'yes', 'on')
+
+    # Retención propia de la función (si no se indica, se aplica la global)
+    try:
+        retention = normalize_retention({key: request.form.get(f"retention_{key}") for key in RETENTION_KEYS})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Límites de concurrencia, cola y ritmo propios (si no se indican, se aplican los globales)
+    try:
+        admission = normalize_admission({key: request.form.get(key) for key in ADMISSION_KEYS})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Coalescencia: las invocaciones idénticas simultáneas comparten una sola ejecución
+    coalesce = request.form.get('coalesce', '').lower() in ('1', 'true', 'yes', 'on')
+
+    # Resultado por partes: elementos del iterable que devuelve main (inprocess/subprocess)
+    # o líneas de stdout (crun), enviados según se producen
+    stream = request.form.get('stream', '').lower() in ('1', 'true', 'yes', 'on')
+
+    # El paquete se despliega (desempaquetado, compilado y de solo lectura) antes de validar
+    # su punto de entrada contra el backend; si no se llega a usar, lo retira el recolector
+    bundle = None
+    if bundle_file:
+        try:
+            bundle = deploy_bundle(BUNDLES_DIR, bundle_file.read(), BUNDLE_RUNTIMES, build=build_c_bundle)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Paquete inválido: {e}"}), 400
+        file_name = bundle["entry"]
+
+    # Backend: crun (aislamiento completo), subprocess (workers calientes) o inprocess (confiable)
+    backend_name = request.form.get('backend', DEFAULT_BACKEND)
+    backend = EXECUTION_BACKENDS.get(backend_name)
+    if backend is None:
+        return jsonify({"status": "error", "message": f"backend debe ser uno de: {', '.join(EXECUTION_BACKENDS)}."}), 400
+    if Path(file_name).suffix not in backend.runtimes:
+        return jsonify({"status": "error", "message": f"El backend {backend_name} solo admite: {', '.join(backend.runtimes)}."}), 400
+    if backend_name != "crun" and (request.files.get('dependencies') or (bundle and bundle["dependencies"])):
+        return jsonify({"status": "error", "message": f"El backend {backend_name} usa el entorno Python del servidor; las dependencias solo se admiten con crun."}), 400
+
     func_dir = FUNCTIONS_DIR / func_name
     os.makedirs(func_dir, exist_ok=True)
     
-    # Guardamos el archivo de la función
-    func_path = func_dir / file_name
-    func_file.save(func_path)
-    
     file_ext = Path(file_name).suffix
     dependency_content = None
     dependency_file_name = None
+    layer = None
+    layer_packages = []
     
     message_suffix = "."
 
@@ -434,70 +2376,392 @@ def upload_function():
 
     # 2. Buscar el archivo de dependencias en el request bajo el campo 'dependencies'
     dep_file = request.files.get('dependencies')
-    print(dep_file) 
     
     if expected_dep_file and dep_file and dep_file.filename == expected_dep_file:
-        dependency_file_name = expected_dep_file
-        
         # Leer el contenido
         dependency_content = dep_file.read().decode('utf-8')
-        dep_file.seek(0) # Resetear puntero para el save
-        
-        # Guardar el archivo en el directorio de la función
-        dep_path = func_dir / dependency_file_name
-        dep_file.save(dep_path)
+    elif expected_dep_file and bundle and bundle["dependencies"]:
+        # Dependencias declaradas en el manifiesto del paquete
+        dependency_content = "\n".join(bundle["dependencies"]) + "\n"
+
+    if dependency_content is not None:
+        dependency_file_name = expected_dep_file
         
-        # 3. LLAMADA CLAVE: Actualizar la configuración y reconstruir el rootfs
-        try:
-            if file_ext == ".py":
-                update_and_rebuild_rootfs(new_python_reqs=dependency_content)
-            elif file_ext == ".js":
-                update_and_rebuild_rootfs(new_node_packages=dependency_content)
-                
-            message_suffix = ". RootFS reconstruido. ¡La(s) nueva(s) librería(s) están listas para usarse!"
-        except Exception as e:
-             # Si falla la reconstrucción, eliminamos la función cargada
-             shutil.rmtree(func_dir, ignore_errors=True)
-             return jsonify({"status": "error", "message": f"Fallo al cargar la función. Falló la reconstrucción de la imagen: {str(e)}"}), 500
+        # 3. Calcular el delta de paquetes respecto a la imagen base
+        runtime = "python" if file_ext == ".py" else "node"
+        layer_packages = compute_layer_delta(runtime, dependency_content)
+        if layer_packages:
+            layer = layer_key(runtime, layer_packages)
+            message_suffix = f". Capa de dependencias {layer} lista con: {' '.join(layer_packages)}."
+        else:
+            message_suffix = ". Las dependencias ya están incluidas en la imagen base."
+
+    function_metadata = {
+        "name": func_name,
+        "file_path": (os.path.join(bundle_path(BUNDLES_DIR, bundle["digest"]), bundle["entry"]) if bundle
+                      else (func_dir / file_name).resolve().as_posix()),
+        "file_ext": file_ext, 
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dependencies": dependency_file_name, 
+        "layer": layer,
+        "layer_packages": layer_packages,
+        "payload_mode": payload_mode,
+        "limits": limits,
+        "backend": backend_name,
+        "coalesce": coalesce,
+        "stream": stream,
+        "bundle": bundle,
+        "prewarm": prewarm,
+        "retention": retention,
+        "admission": admission,
+        "status": "ready",
+    }
 
+    # 4. Si la capa aún no existe, se construye en segundo plano. El código se deja
+    #    en un directorio de preparación y la versión anterior (si la hay) sigue activa.
+    if layer and not layer_is_ready(layer):
+        staging_dir = func_dir / f".staging-{uuid.uuid4().hex[:8]}"
+        staging_dir.mkdir()
+        if not bundle:
+            func_file.save(staging_dir / file_name)
+        (staging_dir / dependency_file_name).write_text(dependency_content)
+
+        with FUNCTIONS_LOCK:
+            job = submit_build_job(
+                "layer", function_name=func_name, runtime=runtime, packages=layer_packages, layer=layer,
+                staging_dir=staging_dir.as_posix(), function_metadata=function_metadata
+            )
+            created = func_name not in functions
+            if created:
+                functions[func_name] = {**function_metadata, "status": "building", "build_job": job["job_id"]}
+            else:
+                # La versión activa sigue sirviendo; solo este trabajo podrá sustituirla
+                functions[func_name]["build_job"] = job["job_id"]
+        save_state()
+        if created:
+            publish_admin_event("function", {"action": "building", "function": func_name, "info": function_info(func_name)})
+
+        return jsonify({
+            "status": "building",
+            "message": f"Función {func_name} ({file_ext}) en construcción: se instalará {' '.join(layer_packages)}.",
+            "job_id": job["job_id"],
+            "job_status_url": f"/admin/jobs/{job['job_id']}"
+        }), 202
 
     try:
-        abs_func_path = Path(func_path).resolve().as_posix()
-        
-        functions[func_name] = {
-            "name": func_name,
-            "file_path": abs_func_path,
-            "file_ext": file_ext, 
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "dependencies": dependency_file_name, 
-        }
+        # Guardamos el archivo de la función (y sus dependencias)
+        if not bundle:
+            func_file.save(func_dir / file_name)
+        if dependency_file_name:
+            (func_dir / dependency_file_name).write_text(dependency_content)
+
+        with FUNCTIONS_LOCK:
+            functions[func_name] = function_metadata
+        retire_function_runtime(func_name)
+        if prewarm:
+            init_ms = backend.prewarm(func_name, function_metadata)
+            if init_ms is not None:
+                message_suffix += f" init(): {init_ms} ms."
         
         save_state()
+        prune_unused_layers()
+        collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+        publish_admin_event("function", {"action": "deployed", "function": func_name, "info": function_info(func_name)})
         return jsonify({"status": "success", "message": f"Función cargada: {func_name} ({file_ext}){message_suffix}"}), 201
     
     except Exception as e:
+        functions.pop(func_name, None)
+        retire_function_runtime(func_name)
+        save_state()
         shutil.rmtree(func_dir, ignore_errors=True)
+        collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
         return jsonify({"status": "error", "message": f"Fallo en la carga de la función: {str(e)}"}), 500
 
+
+@app.route('/admin/jobs', methods=['GET'])
+@requires_auth
+def list_build_jobs():
+    with BUILD_JOBS_LOCK:
+        jobs = [public_job_view(job) for job in BUILD_JOBS.values()]
+    return jsonify(jobs)
+
+
+@app.route('/admin/jobs/<job_id>', methods=['GET'])
+@requires_auth
+def get_build_job(job_id):
+    job = BUILD_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Trabajo no encontrado: {job_id}"}), 404
+    return jsonify(public_job_view(job))
+
+
+@app.route('/admin/rootfs/rebuild', methods=['POST'])
+@requires_auth
+def rebuild_base_rootfs():
+    """Encola la reconstrucción de la imagen base, opcionalmente con paquetes nuevos."""
+    data = request.get_json(silent=True) or {}
+    job = submit_build_job(
+        "rootfs",
+        python_packages=parse_dependency_list(data.get("python_packages", "")),
+        node_packages=parse_dependency_list(data.get("node_packages", ""))
+    )
+    return jsonify({
+        "status": "queued",
+        "message": "Reconstrucción del RootFS encolada. Las funciones siguen usando la imagen actual.",
+        "job_id": job["job_id"],
+        "job_status_url": f"/admin/jobs/{job['job_id']}"
+    }), 202
+
+
+def function_unavailable(func_name):
+    """Respuesta de error si la función no existe o su construcción no ha terminado."""
+    if func_name not in functions:
+        return jsonify({"status": "error", "message": f"Función no cargada: {func_name}"}), 404
+    if functions[func_name].get("status") == "building":
+        return jsonify({
+            "status": "error",
+            "message": f"Función en construcción: {func_name}",
+            "job_status_url": f"/admin/jobs/{functions[func_name].get('build_job')}"
+        }), 409
+    return None
+
+# ========================================================
+# 📤 RESPUESTAS POR PARTES (NDJSON)
+# ========================================================
+
+STREAM_QUEUE_SIZE = 64  # Elementos en tránsito hacia un cliente lento (contrapresión)
+
+
+class StreamCancelled(Exception):
+    """El cliente cerró la conexión de una respuesta por partes."""
+
+
+def stream_function_response(func_name, args, task_id, start_time_str, scratch_dir):
+    """
+    Cuerpo NDJSON de una función con 'stream'. La ejecución corre en un hilo y cada
+    elemento se envía como {"seq", "item"} según llega; la última línea es la entrada
+    de log con "done": true. La cola acotada frena a la función si el cliente es lento
+    y la desconexión del cliente cancela la ejecución.
+    """
+    items = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+    stream = {"items": 0, "first_item_ms": None}
+    t_start = time.perf_counter()
+
+    def offer(message):
+        while not cancelled.is_set():
+            try:
+                items.put(message, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def on_item(item):
+        if stream["first_item_ms"] is None:
+            stream["first_item_ms"] = round((time.perf_counter() - t_start) * 1000, 3)
+        if not offer(("item", item)):
+            raise StreamCancelled("Stream cancelado: el cliente cerró la conexión.")
+        stream["items"] += 1
+
+    def produce():
+        timer = PhaseTimer()
+        try:
+            entry = execute_coalesced(func_name, args, task_id, start_time_str, scratch_dir, timer, on_item)
+        except Exception as e:
+            entry = {
+                "id": task_id,
+                "args": args,
+                "error": str(e),
+                "status": "error",
+                "time_start": start_time_str,
+                "time_end": datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                "timings_ms": timer.as_dict(),
+                **getattr(e, "extras", {})
+            }
+        entry["stream"] = stream
+        log_entry = compact_entry(BLOBS_DIR, entry)
+        logs.setdefault(func_name, []).append(log_entry)
+        save_state()
+        HISTORY.record(func_name, log_entry)
+        publish_invocation(func_name, log_entry)
+        offer(("done", entry))
+
+    threading.Thread(target=produce, name=f"faas-stream-{task_id[:8]}", daemon=True).start()
+
+    seq = 0
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "done":
+                yield json.dumps({**value, "done": True}, default=str) + "\n"
+                return
+            yield json.dumps({"seq": seq, "item": value}, default=str) + "\n"
+            seq += 1
+    finally:
+        cancelled.set()
+
+
+# ========================================================
+# 🔗 PIPELINES (DAG de funciones ejecutado en el servidor)
+# ========================================================
+
+def run_pipeline(pipeline_name, args):
+    """
+    Ejecuta las etapas en el servidor: cada una es una invocación normal de su función
+    (con su backend, sus límites y coalescencia) y los resultados intermedios pasan a
+    la etapa siguiente sin volver al cliente. Devuelve una única entrada de log con
+    los tiempos de cada etapa. Las salidas binarias de las etapas se descartan.
+    """
+    stages = pipelines[pipeline_name]["stages"]
+    results = {}
+    stage_timings = {}
+    current = None
+
+    s_time = time.time()
+    start_time = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry = {"id": str(uuid.uuid4()), "pipeline": pipeline_name, "args": args, "time_start": start_time}
+
+    try:
+        for stage in stages:
+            current = stage["name"]
+            func_name = stage["function"]
+            if func_name not in functions:
+                raise Exception(f"Función no cargada: {func_name}")
+            if functions[func_name].get("status") == "building":
+                raise Exception(f"Función en construcción: {func_name}")
+            stage_args = [results[i] for i in stage["inputs"]] if stage["inputs"] else args
+
+            stage_id = str(uuid.uuid4())
+            t_stage = time.perf_counter()
+            try:
+                stage_entry = execute_coalesced(func_name, stage_args, stage_id, start_time)
+            finally:
+                stage_timings[current] = round((time.perf_counter() - t_stage) * 1000, 3)
+            if "output_binary" in stage_entry:
+                try:
+                    (OUTPUTS_DIR / f"{stage_id}.bin").unlink()
+                except OSError:
+                    pass
+            results[current] = stage_entry["result"]
+
+        # El resultado es el de la etapa final; si el DAG tiene varias, se agrupan por nombre
+        consumed = {i for stage in stages for i in stage["inputs"]}
+        sinks = [stage["name"] for stage in stages if stage["name"] not in consumed]
+        entry["result"] = results[sinks[0]] if len(sinks) == 1 else {name: results[name] for name in sinks}
+        entry["status"] = "success"
+    except Exception as e:
+        entry["error"] = str(e)
+        entry["failed_stage"] = current
+        entry["status"] = "error"
+
+    entry["time_end"] = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry["stages_ms"] = stage_timings
+    return entry
+
+
+@app.route('/admin/pipelines', methods=['POST'])
+@requires_auth
+def register_pipeline():
+    """Registra (o reemplaza) un pipeline: {"name": ..., "stages": [...]}."""
+    data = request.get_json(silent=True) or {}
+    pipeline_name = data.get("name")
+    if not pipeline_name:
+        return jsonify({"status": "error", "message": "El nombre del pipeline es obligatorio."}), 400
+
+    try:
+        stages = normalize_pipeline(data.get("stages"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Pipeline inválido: {e}"}), 400
+
+    missing = sorted({stage["function"] for stage in stages if stage["function"] not in functions})
+    if missing:
+        return jsonify({"status": "error", "message": f"Funciones no cargadas: {', '.join(missing)}"}), 404
+
+    pipelines[pipeline_name] = {
+        "name": pipeline_name,
+        "stages": stages,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_state()
+    return jsonify({"status": "success", "message": f"Pipeline registrado: {pipeline_name}", "stages": stages})
+
+
+@app.route('/admin/pipelines', methods=['GET'])
+@requires_auth
+def list_pipelines():
+    return jsonify(pipelines)
+
+
+@app.route('/admin/pipelines/<pipeline_name>', methods=['DELETE'])
+@requires_auth
+def delete_pipeline(pipeline_name):
+    if pipeline_name not in pipelines:
+        return jsonify({"status": "error", "message": f"Pipeline no encontrado: {pipeline_name}"}), 404
+    del pipelines[pipeline_name]
+    logs.pop(f"pipeline:{pipeline_name}", None)
+    HISTORY.forget(f"pipeline:{pipeline_name}")
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+    save_state()
+    return jsonify({"status": "success", "message": f"Pipeline eliminado: {pipeline_name}"})
+
+
+@app.route('/pipeline/<pipeline_name>', methods=['POST'])
+@pipeline_admission_controlled
+def execute_pipeline(pipeline_name):
+    if pipeline_name not in pipelines:
+        return jsonify({"status": "error", "message": f"Pipeline no encontrado: {pipeline_name}"}), 404
+
+    data = request.get_json(silent=True)
+    args = data.get('args', []) if data and isinstance(data, dict) else []
+
+    t_pipeline = time.perf_counter()
+    entry = run_pipeline(pipeline_name, args)
+    record_metrics(f"pipeline:{pipeline_name}", (time.perf_counter() - t_pipeline) * 1000,
+                   error=entry["status"] == "error")
+
+    # Los logs del pipeline se guardan junto a los de las funciones, con prefijo
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(f"pipeline:{pipeline_name}", []).append(log_entry)
+    save_state()
+    HISTORY.record(f"pipeline:{pipeline_name}", log_entry)
+    publish_invocation(f"pipeline:{pipeline_name}", log_entry)
+
+    return jsonify(entry)
+
+
 # ========================================================
 # 🌐 ENDPOINT DE EJECUCIÓN SÍNCRONA 👈 ¡NUEVO ENDPOINT!
 # ========================================================
 
 @app.route('/function/sync/<func_name>', methods=['POST'])
+@admission_controlled
 def execute_function_sync(func_name):
-    if func_name not in functions:
-        return jsonify({"status": "error", "message": f"Función no cargada: {func_name}"}), 404
-        
-    data = request.get_json(silent=True)
-    args = data.get('args', []) if data and isinstance(data, dict) else []
+    unavailable = function_unavailable(func_name)
+    if unavailable:
+        return unavailable
+
+    scratch_dir = create_scratch_dir()
+    try:
+        args, _ = read_invocation_request(scratch_dir)
+    except (ValueError, TypeError) as e:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": f"Argumentos inválidos: {e}"}), 400
     
     s_time = time.time()
     start_time_str = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f") 
     task_id = str(uuid.uuid4()) # Usamos un ID único para el log
 
+    # Función con 'stream': respuesta NDJSON con cada elemento según se produce
+    if functions[func_name].get("stream"):
+        return Response(stream_function_response(func_name, args, task_id, start_time_str, scratch_dir),
+                        mimetype="application/x-ndjson",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    timer = PhaseTimer()
     try:
         # Llama a la lógica de ejecución síncrona
-        entry = _execute_function_logic(func_name, args, task_id, start_time_str)
+        entry = execute_coalesced(func_name, args, task_id, start_time_str, scratch_dir, timer)
         
     except Exception as e:
         e_time = time.time()
@@ -507,12 +2771,22 @@ def execute_function_sync(func_name):
             "error": str(e), 
             "status": "error",
             "time_start": start_time_str,
-            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+            "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "timings_ms": timer.as_dict(),
+            **getattr(e, "extras", {})
         }
     
     # Log y respuesta para ejecución síncrona
-    logs.setdefault(func_name, []).append(entry)
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(func_name, []).append(log_entry)
     save_state()
+    HISTORY.record(func_name, log_entry)
+    publish_invocation(func_name, log_entry)
+
+    # Si el cliente pide binario y la función lo produjo, se envía directamente
+    if "output_binary" in entry and \
+            request.accept_mimetypes.best == 'application/octet-stream':
+        return send_binary_output(task_id)
     
     return jsonify(entry)
 
@@ -522,29 +2796,52 @@ def execute_function_sync(func_name):
 
 @app.route('/function/async/<func_name>', methods=['POST'])
 def execute_function_async(func_name):
-    if func_name not in functions:
-        return jsonify({"status": "error", "message": f"Función no cargada: {func_name}"}), 404
-        
-    data = request.get_json(silent=True)
-    args = data.get('args', []) if data and isinstance(data, dict) else []
+    unavailable = function_unavailable(func_name)
+    if unavailable:
+        return unavailable
+
+    # El scratch se crea aquí para que la entrada binaria sobreviva a la petición
+    scratch_dir = create_scratch_dir()
+    try:
+        args, callback_url = read_invocation_request(scratch_dir)
+    except (ValueError, TypeError) as e:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": f"Argumentos inválidos: {e}"}), 400
+
+    if callback_url:
+        try:
+            resolve_callback_url(callback_url)
+        except ValueError as e:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    # La tarea ocupa sitio en la cola de admisión desde ya; espera su turno en el worker
+    try:
+        admission = ADMISSION_CONTROL.reserve(func_name, request_caller())
+    except Overloaded as e:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return overloaded_response(e)
     
     s_time = time.time()
     start_time_str = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f") 
     task_id = str(uuid.uuid4())
 
     # Inicializar el estado de la tarea
-    ASYNC_TASKS[task_id] = {
-        'task_id': task_id,
-        'function_name': func_name,
-        'status': 'queued',
-        'time_start': start_time_str,
-        'args': args
-    }
+    with TASK_CONDITION:
+        ASYNC_TASKS[task_id] = {
+            'task_id': task_id,
+            'function_name': func_name,
+            'status': 'queued',
+            'time_start': start_time_str,
+            'args': args,
+            'callback_url': callback_url
+        }
+    publish_admin_event("task", {"task_id": task_id, "function_name": func_name, "status": "queued"})
     
     # Iniciar el hilo de ejecución
     thread = threading.Thread(
         target=async_function_worker, 
-        args=(task_id, func_name, args, start_time_str)
+        args=(task_id, func_name, args, start_time_str, scratch_dir, admission)
     )
     thread.start()
     
@@ -553,7 +2850,9 @@ def execute_function_async(func_name):
         "status": "queued",
         "message": "Función iniciada en modo asíncrono.",
         "task_id": task_id,
-        "check_status_url": f"/task/status/{task_id}"
+        "check_status_url": f"/task/status/{task_id}",
+        "wait_url": f"/task/status/{task_id}?wait={LONG_POLL_MAX_WAIT}",
+        "events_url": f"/task/events?task_id={task_id}"
     }), 202
 
 
@@ -565,10 +2864,18 @@ def execute_function_async(func_name):
 def get_task_status(task_id):
     if task_id not in ASYNC_TASKS:
         return jsonify({"status": "error", "message": f"ID de tarea no encontrado: {task_id}"}), 404
-        
-    task_info = ASYNC_TASKS[task_id]
+
+    # Long-poll opcional: ?wait=<segundos> bloquea hasta que la tarea termine
+    wait = request.args.get('wait', type=float)
+    with TASK_CONDITION:
+        task_info = ASYNC_TASKS[task_id]
+        if wait and wait > 0:
+            TASK_CONDITION.wait_for(
+                lambda: task_info['status'] in TASK_FINAL_STATES,
+                timeout=min(wait, LONG_POLL_MAX_WAIT)
+            )
     
-    if task_info['status'] in ['completed', 'failed']:
+    if task_info['status'] in TASK_FINAL_STATES:
         # Devolver el log de ejecución completo
         response = task_info.get('execution_log', task_info)
         # Opcional: del ASYNC_TASKS[task_id] para liberar memoria si la tarea es muy antigua
@@ -583,6 +2890,66 @@ def get_task_status(task_id):
             "message": f"Tarea en curso. Estado: {task_info['status']}"
         })
 
+
+@app.route('/task/events', methods=['GET'])
+def stream_task_events():
+    """
+    Stream Server-Sent Events con la finalización de las tareas asíncronas.
+    Filtros opcionales: ?task_id=<id> y ?function=<nombre>.
+    """
+    task_filter = request.args.get('task_id')
+    func_filter = request.args.get('function')
+    subscriber = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def generate():
+        # Se registra al empezar a enviar: si el cliente se va antes, nunca queda suscrito
+        with TASK_CONDITION:
+            TASK_EVENT_SUBSCRIBERS.append(subscriber)
+            # Si la tarea pedida ya terminó, se emite su evento de inmediato
+            finished = [
+                t for t in ASYNC_TASKS.values()
+                if task_filter and t['task_id'] == task_filter and t['status'] in TASK_FINAL_STATES
+            ]
+        try:
+            yield ": conectado\n\n"
+            pending = [
+                {"task_id": t['task_id'], "function_name": t['function_name'],
+                 "status": t['status'], "time_end": t.get('time_end')}
+                for t in finished
+            ]
+            while True:
+                if pending:
+                    event = pending.pop(0)
+                else:
+                    try:
+                        event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+
+                if task_filter and event['task_id'] != task_filter:
+                    continue
+                if func_filter and event['function_name'] != func_filter:
+                    continue
+                yield f"event: task\nid: {event['task_id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            with TASK_CONDITION:
+                TASK_EVENT_SUBSCRIBERS.remove(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/task/output/<task_id>', methods=['GET'])
+def get_task_output(task_id):
+    """Descarga (una única vez) la salida binaria de una invocación."""
+    if re.fullmatch(r'[0-9a-f-]{36}', task_id):
+        try:
+            return send_binary_output(task_id)
+        except FileNotFoundError:
+            pass  # Nunca existió o ya se descargó
+    return jsonify({"status": "error", "message": f"Salida binaria no encontrada: {task_id}"}), 404
+
 # ========================================================
 # 🌐 RESTO DE ENDPOINTS (ADMIN)
 # ========================================================
@@ -606,14 +2973,23 @@ def list_functions():
 def delete_function(func_name):
     if func_name in functions:
         try:
-            func_dir = Path(functions[func_name]['file_path']).parent
-            shutil.rmtree(func_dir)
+            with FUNCTIONS_LOCK:
+                functions.pop(func_name, None)
+            # El código de un paquete vive en BUNDLES_DIR; el directorio propio siempre es este
+            func_dir = FUNCTIONS_DIR / func_name
+            shutil.rmtree(func_dir, ignore_errors=True)
             
-            del functions[func_name]
+            FUNCTION_METRICS.pop(func_name, None)
             if func_name in logs:
                 del logs[func_name]
+            HISTORY.forget(func_name)
+            collect_blob_garbage(BLOBS_DIR, referenced_blobs)
             
             save_state()
+            prune_unused_layers()
+            retire_function_runtime(func_name)
+            collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+            publish_admin_event("function", {"action": "deleted", "function": func_name})
             return jsonify({"status": "success", "message": f"Función eliminada: {func_name}"})
         except Exception as e:
             return jsonify({"status": "error", "message": f"Error al eliminar la función: {str(e)}"}), 500
@@ -621,34 +2997,230 @@ def delete_function(func_name):
         return jsonify({"status": "error", "message": f"Función no encontrada: {func_name}"}), 404
 
 
+@app.route('/admin/events', methods=['GET'])
+@requires_auth
+def stream_admin_events():
+    """
+    Stream SSE del panel: un 'snapshot' inicial y después solo eventos incrementales
+    (invocation, status, function, task). Filtro opcional: ?types=invocation,status.
+    """
+    requested = request.args.get('types')
+    types = set(requested.split(',')) if requested else set(ADMIN_EVENT_TYPES)
+    if not types <= set(ADMIN_EVENT_TYPES):
+        return jsonify({"status": "error", "message": f"types debe contener solo: {', '.join(ADMIN_EVENT_TYPES)}."}), 400
+
+    subscriber = AdminSubscriber(types)
+
+    def generate():
+        # Se registra al empezar a enviar: si el cliente se va antes, nunca queda suscrito
+        with ADMIN_EVENTS_LOCK:
+            ADMIN_EVENT_SUBSCRIBERS.append(subscriber)
+        try:
+            snapshot = admin_snapshot()
+            last_sample_ts = snapshot["status"]["ts"] if snapshot["status"] else 0
+            yield format_admin_event("snapshot", snapshot)
+            last_sent = time.monotonic()
+            while True:
+                if subscriber.overflowed:
+                    # El panel no dio abasto: se descartan los eventos pendientes y se resincroniza
+                    subscriber.drain()
+                    yield format_admin_event("snapshot", admin_snapshot())
+                    last_sent = time.monotonic()
+                try:
+                    event_id, kind, data = subscriber.events.get(timeout=SAMPLE_INTERVAL_SECONDS)
+                    yield format_admin_event(kind, data, event_id)
+                    last_sent = time.monotonic()
+                except queue.Empty:
+                    pass
+
+                # Las muestras del sistema se leen del muestreador, sin tocar psutil
+                sample = SAMPLER.latest()
+                if "status" in types and sample and sample["ts"] > last_sample_ts:
+                    last_sample_ts = sample["ts"]
+                    yield format_admin_event("status", status_event(sample))
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= ADMIN_SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+        finally:
+            with ADMIN_EVENTS_LOCK:
+                ADMIN_EVENT_SUBSCRIBERS.remove(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route('/admin/status', methods=['GET'])
 @requires_auth
 def get_server_status():
-    uptime_seconds = time.time() - psutil.boot_time()
-    days, remainder = divmod(uptime_seconds, 86400)
-    hours, remainder = divmod(remainder, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    uptime_str = f"{int(days)}d {int(hours)}h {int(minutes)}m {int(seconds)}s"
+    try:
+        window = parse_history_window(request.args.get('history'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "'history' debe ser un número de segundos mayor que 0."}), 400
 
+    # Se responde con la última muestra del muestreador, sin llamar a psutil aquí
+    sample = SAMPLER.latest()
     status_data = {
         "status": "ok",
-        "uptime": uptime_str,
-        "cpu_percent": psutil.cpu_percent(interval=None),
-        "ram_percent": psutil.virtual_memory().percent,
+        "uptime": uptime_text(),
+        "cpu_percent": sample["cpu_percent"],
+        "ram_percent": sample["ram_percent"],
         "loaded_functions": len(functions),
-        "async_tasks_running": len([t for t in ASYNC_TASKS.values() if t['status'] in ['queued', 'running']])
+        "async_tasks_running": sum(stats["async_active"] for stats in sample["functions"].values()),
+        "sample": sample
     }
+    if window is not None:
+        status_data["history"] = SAMPLER.history(window)
     return jsonify(status_data)
 
 
+@app.route('/metrics', methods=['GET'])
+@requires_auth
+def get_metrics():
+    """Contadores e histogramas por función en formato de exposición de Prometheus."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/admin/history', methods=['GET'])
+@requires_auth
+def query_history():
+    """Historial filtrado: ?function=&status=&since=&until=&limit=&offset= (más reciente primero)."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(HISTORY.query(filters))
+
+
+@app.route('/admin/history/aggregate', methods=['GET'])
+@requires_auth
+def aggregate_history():
+    """Agregados por ventana de tiempo: ?function=&since=&until=&bucket=<segundos>."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(HISTORY.aggregate(filters))
+
+
+@app.route('/admin/blobs/<digest>', methods=['GET'])
+@requires_auth
+def get_blob(digest):
+    """JSON completo de unos args/resultado guardados fuera del log."""
+    data = read_blob(BLOBS_DIR, digest)
+    if data is None:
+        return jsonify({"status": "error", "message": f"Blob no encontrado: {digest}"}), 404
+    return Response(data, mimetype="application/json")
+
+
+@app.route('/admin/blobs/gc', methods=['POST'])
+@requires_auth
+def run_blob_gc():
+    return jsonify({"status": "success", **collect_blob_garbage(BLOBS_DIR, referenced_blobs)})
+
+
+@app.route('/admin/admission', methods=['GET'])
+@requires_auth
+def get_admission():
+    """Límites efectivos, ocupación actual y rechazos del control de admisión."""
+    return jsonify(ADMISSION_CONTROL.report(list(functions)))
+
+
+@app.route('/admin/retention', methods=['GET'])
+@requires_auth
+def get_retention():
+    """Políticas de retención efectivas y ocupación de los archivos."""
+    return jsonify(retention_report())
+
+
+@app.route('/admin/retention/run', methods=['POST'])
+@requires_auth
+def run_retention():
+    return jsonify({"status": "success", **apply_retention()})
+
+
+@app.route('/admin/archives', methods=['GET'])
+@requires_auth
+def list_archives():
+    return jsonify([{k: v for k, v in segment.items() if k != "path"} for segment in list_archive_segments(ARCHIVE_DIR)])
+
+
+@app.route('/admin/archives/query', methods=['GET'])
+@requires_auth
+def query_archived_history():
+    """Consulta sobre los segmentos archivados: mismos filtros que /admin/history."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(query_archives(ARCHIVE_DIR, filters))
+
+
+@app.route('/admin/archives/<function>/<day>', methods=['GET'])
+@requires_auth
+def export_archive(function, day):
+    """Descarga un segmento (jsonl.gz) tal cual, para exportarlo."""
+    for segment in list_archive_segments(ARCHIVE_DIR):
+        if segment["function"] == function and segment["day"] == day:
+            return send_file(os.path.abspath(segment["path"]), mimetype="application/gzip", as_attachment=True,
+                             download_name=f"{function}-{day}.jsonl.gz")
+    return jsonify({"status": "error", "message": f"Segmento no encontrado: {function}/{day}"}), 404
+
+
 @app.route('/admin/logs/<func_name>', methods=['GET'])
 @requires_auth
 def get_function_logs(func_name):
     if func_name in logs:
-        return jsonify(logs[func_name])
+        return jsonify([dict(entry) for entry in logs[func_name]])
     else:
         return jsonify({"status": "error", "message": f"Logs no encontrados para: {func_name}"}), 404
 
+
+def summarize_timings(per_type):
+    """Media, mínimo y máximo (ms) por fase para cada tipo de arranque."""
+    return {
+        start_type: {
+            name: {
+                "count": stats["count"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                "min_ms": round(stats["min_ms"], 3),
+                "max_ms": round(stats["max_ms"], 3),
+            }
+            for name, stats in phases.items()
+        }
+        for start_type, phases in per_type.items()
+    }
+
+
+@app.route('/admin/timings', methods=['GET'])
+@app.route('/admin/timings/<func_name>', methods=['GET'])
+@requires_auth
+def get_function_timings(func_name=None):
+    """Desglose de latencia por fase (frío/caliente) de las invocaciones en contenedor."""
+    with TIMINGS_LOCK:
+        if func_name is None:
+            return jsonify({name: summarize_timings(per_type) for name, per_type in FUNCTION_TIMINGS.items()})
+        if func_name not in FUNCTION_TIMINGS:
+            return jsonify({"status": "error", "message": f"Sin mediciones para: {func_name}"}), 404
+        return jsonify(summarize_timings(FUNCTION_TIMINGS[func_name]))
+
+# ========================================================
+# 🧵 SERVICIOS EN SEGUNDO PLANO
+# ========================================================
+
+def start_background_services():
+    """
+    Arranca los hilos del servidor: construcciones de capas y rootfs, muestreo del
+    sistema, escritor del historial (crea data/history.db) y retención. Importar el
+    módulo no arranca ninguno.
+    """
+    threading.Thread(target=build_job_worker, name="faas-builds", daemon=True).start()
+    SAMPLER.start()
+    HISTORY.start()
+    atexit.register(HISTORY.close)
+    threading.Thread(target=retention_worker, name="faas-retention", daemon=True).start()
+
+
 # ========================================================
 # 🚀 MAIN
 # ========================================================
@@ -659,7 +3231,9 @@ if __name__ == "__main__":
         print("Por favor, ejecute primero: sudo python3 build_rootfs_local.py")
         sys.exit(1)
         
+    start_background_services()
     load_state() 
+    threading.Thread(target=prewarm_functions, daemon=True).start()
     
     print("TinyFaaS V3.1 HTTP Server (Containerized & Threaded) iniciado en http://127.0.0.1:8080")
     
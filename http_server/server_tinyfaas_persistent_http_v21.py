@@ -4,7 +4,7 @@ import sys
 import uuid
 import importlib.util
 import json  
-from flask import Flask, request, jsonify, Response, render_template
+from flask import Flask, request, jsonify, Response, render_template, send_file
 from functools import wraps
 import shutil
 import time
@@ -12,6 +12,27 @@ from datetime import datetime
 import psutil
 from flask_cors import CORS 
 import traceback 
+import threading
+import queue
+import itertools
+import atexit
+
+# Código común de los servidores (liftr_common/, en la raíz del repositorio)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from liftr_common.admission import ADMISSION_KEYS, AdmissionControl, Overloaded, normalize_admission
+from liftr_common.batching import MicroBatcher
+from liftr_common.blobs import blob_references, collect_blob_garbage, inline_blobs, read_blob
+from liftr_common.bundles import (bundle_path, bundle_references, bundle_stem, collect_bundle_garbage, deploy_bundle,
+                                  forget_bundle_modules, import_bundle)
+from liftr_common.history import HistoryStore, parse_history_filters
+from liftr_common.invocation import (EVENT_LOOP, FunctionResources, call_function, call_timeout,
+                                     context_entry_points, is_stream_function, iterate_stream)
+from liftr_common.logrecords import LogRecord, compact_entry, log_json_default
+from liftr_common.metrics import FUNCTION_METRICS, record_metrics, render_prometheus
+from liftr_common.pipelines import normalize_pipeline
+from liftr_common.sampler import SystemSampler, parse_history_window
+from liftr_common.retention import (RETENTION_KEYS, archive_entries, enforce_archive_limit, expired_count,
+                                    list_archive_segments, normalize_retention, query_archives)
 
 app = Flask(__name__)
 CORS(app) 
@@ -50,9 +71,26 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 FUNCTIONS_FILE = os.path.join(DATA_DIR, "functions.json")
 LOGS_FILE = os.path.join(DATA_DIR, "logs.json")
+PIPELINES_FILE = os.path.join(DATA_DIR, "pipelines.json")
 
 functions = {}
+RUNTIME_KEYS = ("module", "context_funcs")  # Estado de la carga actual: no se guarda ni se publica
 logs = {}
+pipelines = {}  # nombre -> {"name", "stages", "created_at"}
+batchers = {}   # nombre -> MicroBatcher (solo funciones con micro-batching activado)
+lifecycle = {}  # nombre -> {"module", "lock", "initialized"} del módulo cargado actualmente
+
+DEFAULT_BATCH_MAX_SIZE = 32
+
+# Plazo por invocación de las funciones 'async def main' (el cliente puede pedir uno menor)
+ASYNC_DEFAULT_TIMEOUT = 30
+ASYNC_MAX_TIMEOUT = 300
+
+# Broker para context.publish() (opcional; este servidor no usa MQTT por sí mismo)
+MQTT_BROKER = os.environ.get("FAAS_MQTT_BROKER", "")
+MQTT_PORT = int(os.environ.get("FAAS_MQTT_PORT", "1883"))
+mqtt_publisher = None
+MQTT_PUBLISHER_LOCK = threading.Lock()  # Solo serializa la primera conexión al broker
 
 # ========================================================
 # 💾 FUNCIONES DE PERSISTENCIA Y ENTORNO
@@ -60,7 +98,7 @@ logs = {}
 
 def load_state():
     """Carga el estado de TinyFaaS desde archivos JSON al inicio. Ahora es más robusto."""
-    global functions, logs
+    global functions, logs, pipelines
     
     try:
         if os.path.exists(FUNCTIONS_FILE):
@@ -68,11 +106,16 @@ def load_state():
                 functions = json.load(f)
         if os.path.exists(LOGS_FILE):
             with open(LOGS_FILE, 'r') as f:
-                logs = json.load(f)
+                logs = {log_key: [LogRecord(entry) for entry in entries]
+                        for log_key, entries in json.load(f).items()}
+        if os.path.exists(PIPELINES_FILE):
+            with open(PIPELINES_FILE, 'r') as f:
+                pipelines = json.load(f)
     except Exception as e:
         print(f"ADVERTENCIA: Fallo al leer archivos de estado JSON ({e}). Reiniciando el estado.")
         functions = {}
         logs = {}
+        pipelines = {}
         
     try:
         functions_to_keep = {}
@@ -80,6 +123,10 @@ def load_state():
             if isinstance(data, dict) and "file_path" in data:
                 try:
                     load_function_module(func_name, data["file_path"])
+                    if data.get("prewarm"):
+                        init_ms = ensure_initialized(func_name)
+                        print(f"Función '{func_name}' precalentada (init: {init_ms} ms).")
+                    configure_batcher(func_name)
                     functions_to_keep[func_name] = functions[func_name]
                 except Exception as e:
                     print(f"ADVERTENCIA: No se pudo recargar el módulo '{func_name}' ({e}). Se omitirá.")
@@ -94,46 +141,109 @@ def load_state():
         print(f"Error al cargar el estado: {e}. Inicializando vacío.") 
         functions = {}
         logs = {}
+
+    # Primera ejecución con SQLite: se importa el historial existente de logs.json
+    HISTORY.backfill(logs)
+    # Lo que exceda la retención se archiva ya, para que el estado siguiente sea acotado
+    apply_retention()
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
         
 def save_state():
     try:
-        functions_to_save = {k: {key: v for key, v in data.items() if key != "module"} 
+        functions_to_save = {k: {key: v for key, v in data.items() if key not in RUNTIME_KEYS} 
                              for k, data in functions.items()}
                              
         with open(FUNCTIONS_FILE, 'w') as f:
             json.dump(functions_to_save, f, indent=4)
         
         with open(LOGS_FILE, 'w') as f:
-            json.dump(logs, f, indent=4)
+            json.dump(logs, f, indent=4, default=log_json_default)
+
+        with open(PIPELINES_FILE, 'w') as f:
+            json.dump(pipelines, f, indent=4)
     except Exception as e:
         print(f"Error al guardar el estado: {e}")
 
 # 🚀 FUNCIÓN CRÍTICA DE CARGA DE MÓDULO (Robustez mejorada)
 def load_function_module(func_name, file_path):
     """Carga dinámicamente el módulo Python de la función, verificando el contrato."""
-    spec = importlib.util.spec_from_file_location(func_name, file_path)
-    if spec is None:
-        raise FileNotFoundError(f"No se encontró el archivo en: {file_path}")
-        
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[func_name] = module
-    
-    try:
-        spec.loader.exec_module(module)
-        
-        if not hasattr(module, 'main') or not callable(module.main):
+    bundle = functions[func_name].get("bundle")
+    if bundle:
+        # Paquete desplegado: se importa desde su directorio inmutable, con los .pyc ya generados
+        module = import_bundle(BUNDLES_DIR, bundle)
+        if not callable(getattr(module, 'main', None)):
+            forget_bundle_modules(module)
             raise AttributeError("El código no define la función de entrada requerida: 'def main(*args)'.")
-            
-    except Exception as e:
-        if func_name in sys.modules:
-            del sys.modules[func_name]
-        raise 
+    else:
+        spec = importlib.util.spec_from_file_location(func_name, file_path)
+        if spec is None:
+            raise FileNotFoundError(f"No se encontró el archivo en: {file_path}")
+
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[func_name] = module
+
+        try:
+            spec.loader.exec_module(module)
+
+            if not hasattr(module, 'main') or not callable(module.main):
+                raise AttributeError("El código no define la función de entrada requerida: 'def main(*args)'.")
+
+        except Exception as e:
+            if func_name in sys.modules:
+                del sys.modules[func_name]
+            raise
     
+    # La versión anterior (si la hay) cierra sus recursos antes de ser reemplazada
+    shutdown_function(func_name)
     functions[func_name]["module"] = module 
+    functions[func_name]["context_funcs"] = context_entry_points(module)
+    lifecycle[func_name] = {"module": module, "lock": threading.Lock(), "initialized": False}
     
     if func_name not in logs:
         logs[func_name] = []
 
+# 🔄 CICLO DE VIDA: init() una vez por carga del módulo y shutdown() al retirarlo
+def ensure_initialized(func_name):
+    """
+    Ejecuta el `init()` opcional del módulo si aún no se ha hecho para esta carga.
+    Devuelve los ms empleados si se ejecutó ahora (None si ya estaba inicializado),
+    de modo que el coste de init se informa aparte de la latencia de la invocación.
+    """
+    state = lifecycle[func_name]
+    if state["initialized"]:
+        return None
+    with state["lock"]:
+        if state["initialized"]:
+            return None
+        init_ms = None
+        if callable(getattr(state["module"], 'init', None)):
+            t_init = time.perf_counter()
+            call_function(state["module"].init, timeout=ASYNC_DEFAULT_TIMEOUT)
+            init_ms = round((time.perf_counter() - t_init) * 1000, 3)
+            functions[func_name]["init_ms"] = init_ms
+        state["initialized"] = True
+        return init_ms
+
+
+def shutdown_function(func_name):
+    """Llama al `shutdown()` opcional si el módulo llegó a inicializarse."""
+    state = lifecycle.pop(func_name, None)
+    if state:
+        forget_bundle_modules(state["module"])
+    if not state or not state["initialized"] or not callable(getattr(state["module"], 'shutdown', None)):
+        return
+    try:
+        call_function(state["module"].shutdown, timeout=ASYNC_DEFAULT_TIMEOUT)
+    except Exception as e:
+        print(f"ADVERTENCIA: shutdown() de '{func_name}' falló: {e}")
+
+
+@atexit.register
+def shutdown_all_functions():
+    for func_name in list(lifecycle):
+        shutdown_function(func_name)
+
 # 🚀 FUNCIÓN CRÍTICA DE INSTALACIÓN (Anti-Timeout)
 def install_requirements(requirements_path):
     """Instala dependencias si existe requirements.txt y no está vacío."""
@@ -155,6 +265,454 @@ def install_requirements(requirements_path):
     else:
         print("No se encontraron dependencias para instalar.")
 
+# ========================================================
+# 📦 PAQUETES DE FUNCIÓN (zip/tar con manifiesto, bytecode precompilado)
+# ========================================================
+
+BUNDLES_DIR = os.path.join(DATA_DIR, "bundles")
+BUNDLE_RUNTIMES = {"python": ".py"}  # Las funciones se ejecutan en el propio proceso
+# Lectura, validación, despliegue e importación de paquetes en liftr_common.bundles
+
+
+def referenced_bundles():
+    """Digests de los paquetes que usa alguna función registrada."""
+    return bundle_references(list(functions.values()))
+
+# ========================================================
+# 🧰 CONTEXTO DE FUNCIÓN (recursos compartidos entre invocaciones)
+# ========================================================
+
+# FunctionContext y los recursos por función están en liftr_common.invocation
+
+def context_functions(func_name):
+    """Puntos de entrada que declaran `context` en la carga actual (None si la función no consta)."""
+    return functions.get(func_name, {}).get("context_funcs")
+
+def get_mqtt_publisher():
+    """Cliente MQTT compartido, conectado la primera vez que una función publica."""
+    global mqtt_publisher
+    if mqtt_publisher is None:
+        # Lock propio: un broker lento no bloquea a quien solo usa la caché o la sesión HTTP
+        with MQTT_PUBLISHER_LOCK:
+            if mqtt_publisher is None:
+                if not MQTT_BROKER:
+                    raise RuntimeError("Publicador MQTT no configurado (variable FAAS_MQTT_BROKER).")
+                import paho.mqtt.client as mqtt
+                client = mqtt.Client(client_id=f"TinyFaaS_HTTP_{os.getpid()}")
+                client.connect(MQTT_BROKER, MQTT_PORT, 60)
+                client.loop_start()
+                mqtt_publisher = client
+    return mqtt_publisher
+
+
+FUNCTION_RESOURCES = FunctionResources(FUNCTIONS_DIR, get_mqtt_publisher, context_functions)
+
+# ========================================================
+# ⏳ FUNCIONES ASYNC (bucle asyncio compartido)
+# ========================================================
+
+# El bucle compartido, call_function e iterate_stream están en liftr_common.invocation
+
+# ========================================================
+# 📦 MICRO-BATCHING (opcional por función)
+# ========================================================
+
+# run_batch y MicroBatcher están en liftr_common.batching; aquí solo lo propio de este servidor
+
+def batch_module(func_name):
+    """Módulo de la función listo para un lote (init() ya ejecutado); si no, lanza el motivo."""
+    module = functions.get(func_name, {}).get("module")
+    if module is None:
+        raise RuntimeError(f"Función no cargada: {func_name}")
+    try:
+        ensure_initialized(func_name)
+    except Exception as e:
+        raise RuntimeError(f"Fallo en init(): {e}") from e
+    return module
+
+
+def record_batch(func_name, entries):
+    """Registra las entradas de un lote con un único guardado de estado."""
+    log_entries = [compact_entry(BLOBS_DIR, entry) for entry in entries]
+    logs.setdefault(func_name, []).extend(log_entries)
+    save_state()
+    for log_entry in log_entries:
+        HISTORY.record(func_name, log_entry)
+        publish_invocation(func_name, log_entry)
+
+
+def new_batcher(func_name, window_ms, max_size):
+    return MicroBatcher(func_name, window_ms, max_size, batch_module, record_batch, FUNCTION_RESOURCES,
+                        ASYNC_DEFAULT_TIMEOUT)
+
+
+def parse_batch_form(form):
+    """Lee 'batch_window_ms' / 'batch_max_size'; sin ventana, el micro-batching queda desactivado."""
+    window_ms = form.get('batch_window_ms')
+    if not window_ms:
+        return None
+    batch = {"window_ms": int(window_ms), "max_size": int(form.get('batch_max_size') or DEFAULT_BATCH_MAX_SIZE)}
+    if batch["window_ms"] <= 0 or batch["max_size"] <= 0:
+        raise ValueError("batch_window_ms y batch_max_size deben ser positivos.")
+    return batch
+
+
+def configure_batcher(func_name):
+    """(Re)crea el batcher de la función según sus metadatos, deteniendo el anterior."""
+    old = batchers.pop(func_name, None)
+    if old:
+        old.stop()
+    batch = functions.get(func_name, {}).get("batch")
+    if batch:
+        batchers[func_name] = new_batcher(func_name, batch["window_ms"], batch["max_size"])
+        batchers[func_name].start()
+
+# ========================================================
+# 📈 MÉTRICAS POR FUNCIÓN (contadores e histogramas de buckets fijos)
+# ========================================================
+# FunctionMetrics y el registro por función están en liftr_common.metrics
+
+
+def render_metrics():
+    """Métricas en formato de exposición de texto de Prometheus."""
+    return render_prometheus(ADMISSION_CONTROL.rejections)
+
+# ========================================================
+# 📉 MUESTREO DEL SISTEMA EN SEGUNDO PLANO (ring buffer de series temporales)
+# ========================================================
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("FAAS_SAMPLE_INTERVAL", "2"))
+SAMPLE_HISTORY_SIZE = int(os.getenv("FAAS_SAMPLE_HISTORY", "1800"))  # 1 h a 2 s por muestra
+# SystemSampler está en liftr_common.sampler; aquí solo el estado propio de cada función
+
+
+def function_worker_stats():
+    """Estado por función para el muestreador: init() hecho, invocaciones en lote pendientes y contadores."""
+    stats = {}
+    for func_name in list(functions):
+        state = lifecycle.get(func_name)
+        batcher = batchers.get(func_name)
+        metrics = FUNCTION_METRICS.get(func_name)
+        stats[func_name] = {
+            "initialized": bool(state and state["initialized"]),
+            "batch_pending": len(batcher.pending) if batcher else 0,
+            "calls": metrics.calls if metrics else 0,
+            "errors": metrics.errors if metrics else 0,
+        }
+    return stats
+
+
+SAMPLER = SystemSampler(SAMPLE_INTERVAL_SECONDS, SAMPLE_HISTORY_SIZE, function_worker_stats)
+
+# ========================================================
+# 📡 EVENTOS DE ADMINISTRACIÓN (SSE incremental para el panel)
+# ========================================================
+
+ADMIN_EVENT_TYPES = ("invocation", "status", "function", "task")
+ADMIN_EVENT_QUEUE_SIZE = 1024
+ADMIN_SSE_KEEPALIVE_SECONDS = 15
+ADMIN_EVENT_SUBSCRIBERS = []  # Un AdminSubscriber por panel conectado
+ADMIN_EVENTS_LOCK = threading.Lock()
+ADMIN_EVENT_SEQUENCE = itertools.count(1)
+
+
+class AdminSubscriber:
+    """Cola acotada de un panel conectado. Si se llena, el panel recibe un 'snapshot' nuevo."""
+
+    def __init__(self, types):
+        self.types = types
+        self.events = queue.Queue(maxsize=ADMIN_EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def drain(self):
+        self.overflowed = False
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+def function_info(func_name):
+    """Metadatos publicables de la función (sin el módulo cargado)."""
+    return {key: v for key, v in functions.get(func_name, {}).items() if key not in RUNTIME_KEYS}
+
+
+def publish_admin_event(kind, data):
+    """Entrega un evento a los paneles suscritos sin bloquear nunca al que lo emite."""
+    with ADMIN_EVENTS_LOCK:
+        subscribers = [s for s in ADMIN_EVENT_SUBSCRIBERS if kind in s.types]
+    if not subscribers:
+        return
+    event = (next(ADMIN_EVENT_SEQUENCE), kind, data)
+    for subscriber in subscribers:
+        try:
+            subscriber.events.put_nowait(event)
+        except queue.Full:
+            subscriber.overflowed = True
+
+
+def publish_invocation(log_key, entry):
+    """Nueva entrada de log; 'count' es el total acumulado (idempotente para el panel)."""
+    publish_admin_event("invocation", {"function": log_key, "entry": entry,
+                                       "count": len(logs.get(log_key, ()))})
+
+
+def uptime_text():
+    """Tiempo desde el arranque del sistema, como '1d 2h 3m 4s'."""
+    uptime_seconds = time.time() - psutil.boot_time()
+    days, remainder = divmod(uptime_seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(days)}d {int(hours)}h {int(minutes)}m {int(seconds)}s"
+
+
+def status_event(sample):
+    """Muestra del sistema para el panel, con el uptime (el panel solo consulta /admin/status al cargar)."""
+    return {**sample, "uptime": uptime_text()} if sample else None
+
+
+def admin_snapshot():
+    """Estado completo con el que el panel arranca (y se resincroniza)."""
+    return {
+        "functions": {func_name: function_info(func_name) for func_name in list(functions)},
+        "invocations": {log_key: len(entries) for log_key, entries in list(logs.items())},
+        "status": status_event(SAMPLER.latest()),
+    }
+
+
+def format_admin_event(kind, data, event_id=None):
+    lines = f"event: {kind}\n"
+    if event_id is not None:
+        lines += f"id: {event_id}\n"
+    return lines + f"data: {json.dumps(data, default=log_json_default)}\n\n"
+
+
+# ========================================================
+# 🧱 ALMACÉN DE BLOBS (args/resultados grandes fuera del log, por contenido)
+# ========================================================
+
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs")
+# Escritura, lectura y recolección de blobs en liftr_common.blobs
+
+
+def referenced_blobs():
+    """Digests referenciados por las entradas de log que siguen retenidas."""
+    return blob_references(logs)
+
+# ========================================================
+# 🗄️ HISTORIAL DE EJECUCIONES EN SQLITE (WAL, indexado, con agregados)
+# ========================================================
+
+HISTORY_DB_FILE = os.path.join(DATA_DIR, "history.db")
+# HistoryStore, los filtros de consulta y entry_timestamp están en liftr_common.history
+
+HISTORY = HistoryStore(HISTORY_DB_FILE, json_default=log_json_default)
+
+# ========================================================
+# ♻️ RETENCIÓN DE LOGS Y ARCHIVOS COMPRIMIDOS POR DÍA
+# ========================================================
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Política global (0 = sin límite); cada función puede sobrescribirla al subirse
+RETENTION_DEFAULTS = {
+    "max_entries": int(os.getenv("FAAS_RETENTION_MAX_ENTRIES", "1000")),
+    "max_age": int(os.getenv("FAAS_RETENTION_MAX_AGE", str(7 * 24 * 3600))),  # segundos
+    "max_bytes": int(os.getenv("FAAS_RETENTION_MAX_BYTES", str(1024 * 1024))),
+}
+ARCHIVE_MAX_BYTES = int(os.getenv("FAAS_ARCHIVE_MAX_BYTES", str(256 * 1024 * 1024)))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("FAAS_RETENTION_INTERVAL", "60"))
+RETENTION_LOCK = threading.Lock()
+# Los segmentos por día, su consulta y la política de caducidad están en liftr_common.retention
+
+
+def retention_policy(log_key):
+    """Política efectiva: la global con las sobrescrituras de la función (si las tiene)."""
+    policy = dict(RETENTION_DEFAULTS)
+    policy.update((functions.get(log_key) or {}).get("retention") or {})
+    return policy
+
+
+def apply_retention():
+    """
+    Rota a los archivos las entradas que exceden la política de cada log, las retira
+    del estado en memoria, del historial SQLite y de los blobs, y acota los archivos.
+    """
+    with RETENTION_LOCK:
+        now = time.time()
+        rotated = {}
+        for log_key, entries in list(logs.items()):
+            count = expired_count(entries, retention_policy(log_key), now, log_json_default)
+            if not count:
+                continue
+            expired = entries[:count]
+            try:
+                archive_entries(ARCHIVE_DIR, log_key, [inline_blobs(BLOBS_DIR, entry) for entry in expired])
+            except OSError as e:
+                print(f"ADVERTENCIA: no se pudo archivar el log de '{log_key}': {e}")
+                continue
+            # Solo se recorta el principio: las invocaciones concurrentes añaden al final
+            del entries[:count]
+            HISTORY.forget_ids([entry.get("id") for entry in expired if entry.get("id")])
+            rotated[log_key] = count
+        if rotated:
+            save_state()
+            collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+        return {"rotated": rotated, "archive_segments_removed": enforce_archive_limit(ARCHIVE_DIR, ARCHIVE_MAX_BYTES)}
+
+
+def retention_worker():
+    while True:
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            summary = apply_retention()
+            if summary["rotated"]:
+                print(f"Retención: entradas archivadas {summary['rotated']}.")
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al aplicar la retención de logs: {e}")
+
+
+def retention_report():
+    segments = list_archive_segments(ARCHIVE_DIR)
+    return {
+        "defaults": RETENTION_DEFAULTS,
+        "policies": {log_key: retention_policy(log_key) for log_key in list(logs)},
+        "archive": {"segments": len(segments), "bytes": sum(s["bytes"] for s in segments),
+                    "max_bytes": ARCHIVE_MAX_BYTES},
+    }
+
+
+# ========================================================
+# 🚦 CONTROL DE ADMISIÓN (concurrencia, colas con plazo y límites por llamante)
+# ========================================================
+
+# Límite global de ejecuciones simultáneas y de invocaciones esperando turno (0 = sin límite)
+GLOBAL_MAX_CONCURRENCY = int(os.getenv("FAAS_MAX_CONCURRENCY", "64"))
+GLOBAL_QUEUE_SIZE = int(os.getenv("FAAS_GLOBAL_QUEUE_SIZE", "256"))
+# Política por función (cada función puede sobrescribirla al subirse):
+# max_concurrency 0 = solo cuenta el límite global; rate_limit en invocaciones/s por llamante (0 = sin límite)
+ADMISSION_DEFAULTS = {
+    "max_concurrency": int(os.getenv("FAAS_FUNCTION_MAX_CONCURRENCY", "0")),
+    "queue_size": int(os.getenv("FAAS_QUEUE_SIZE", "64")),
+    "queue_timeout": float(os.getenv("FAAS_QUEUE_TIMEOUT", "10")),  # segundos
+    "rate_limit": float(os.getenv("FAAS_RATE_LIMIT", "0")),
+    "rate_burst": int(os.getenv("FAAS_RATE_BURST", "0")),           # 0 = max(1, rate_limit)
+}
+# AdmissionControl (limitadores, token buckets por llamante y rechazos) está en liftr_common.admission
+
+
+def function_admission(func_name):
+    """Política de admisión propia de la función (None si usa la global)."""
+    return (functions.get(func_name) or {}).get("admission")
+
+
+ADMISSION_CONTROL = AdmissionControl(ADMISSION_DEFAULTS, GLOBAL_MAX_CONCURRENCY, GLOBAL_QUEUE_SIZE,
+                                     function_admission)
+
+
+# Identidad del llamante para los límites de ritmo: cabecera propia o, si no, la IP
+CALLER_HEADER = "X-Client-Id"
+
+
+def request_caller():
+    return request.headers.get(CALLER_HEADER) or request.remote_addr or "anonymous"
+
+
+def overloaded_response(error):
+    """429 inmediato con Retry-After: el cliente reintenta en lugar de acumular espera."""
+    return jsonify({"status": "error", "message": str(error), "reason": error.reason,
+                    "retry_after": error.retry_after}), 429, {"Retry-After": str(error.retry_after)}
+
+
+def admitted(admission_key, f, *args, **kwargs):
+    """Ejecuta el endpoint ocupando una plaza de admisión de `admission_key`."""
+    try:
+        admission = ADMISSION_CONTROL.admit(admission_key, request_caller())
+    except Overloaded as e:
+        return overloaded_response(e)
+    try:
+        response = f(*args, **kwargs)
+    except BaseException:
+        admission.release()
+        raise
+    # Una respuesta por partes (NDJSON) ocupa la plaza hasta que termina de enviarse
+    if isinstance(response, Response) and response.is_streamed:
+        response.call_on_close(admission.release)
+    else:
+        admission.release()
+    return response
+
+
+def admission_controlled(f):
+    """Envuelve un endpoint de invocación con el control de admisión de la función."""
+    @wraps(f)
+    def decorated(func_name, *args, **kwargs):
+        if func_name not in functions:
+            return f(func_name, *args, **kwargs)
+        return admitted(func_name, f, func_name, *args, **kwargs)
+    return decorated
+
+
+def pipeline_admission_controlled(f):
+    """
+    Control de admisión de un pipeline, como una invocación más ('pipeline:<nombre>'):
+    ocupa una plaza global y se le aplican el ritmo y los límites por defecto.
+    """
+    @wraps(f)
+    def decorated(pipeline_name, *args, **kwargs):
+        if pipeline_name not in pipelines:
+            return f(pipeline_name, *args, **kwargs)
+        return admitted(f"pipeline:{pipeline_name}", f, pipeline_name, *args, **kwargs)
+    return decorated
+
+# ========================================================
+# 🔗 PIPELINES (DAG de funciones ejecutado en el servidor)
+# ========================================================
+
+def run_pipeline(pipeline_name, args, timeout=ASYNC_DEFAULT_TIMEOUT):
+    """
+    Ejecuta las etapas en este mismo proceso, pasando los resultados intermedios en
+    memoria. Devuelve una única entrada de log con los tiempos de cada etapa.
+    """
+    stages = pipelines[pipeline_name]["stages"]
+    results = {}
+    stage_timings = {}
+    current = None
+
+    s_time = time.time()
+    start_time = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry = {"id": str(uuid.uuid4()), "pipeline": pipeline_name, "args": args, "time_start": start_time}
+
+    try:
+        for stage in stages:
+            current = stage["name"]
+            module = functions.get(stage["function"], {}).get("module")
+            if module is None:
+                raise Exception(f"Función no cargada: {stage['function']}")
+            ensure_initialized(stage["function"])
+            context = FUNCTION_RESOURCES.context(stage["function"], entry["id"])
+            stage_args = [results[i] for i in stage["inputs"]] if stage["inputs"] else args
+
+            t_stage = time.perf_counter()
+            try:
+                results[current] = call_function(module.main, *stage_args, timeout=timeout, context=context)
+            finally:
+                stage_timings[current] = round((time.perf_counter() - t_stage) * 1000, 3)
+
+        # El resultado es el de la etapa final; si el DAG tiene varias, se agrupan por nombre
+        consumed = {i for stage in stages for i in stage["inputs"]}
+        sinks = [stage["name"] for stage in stages if stage["name"] not in consumed]
+        entry["result"] = results[sinks[0]] if len(sinks) == 1 else {name: results[name] for name in sinks}
+        entry["status"] = "success"
+    except Exception as e:
+        entry["error"] = str(e)
+        entry["failed_stage"] = current
+        entry["status"] = "error"
+
+    entry["time_end"] = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry["stages_ms"] = stage_timings
+    return entry
+
 # ========================================================
 # 🌐 ENDPOINTS DE ADMINISTRACIÓN (PROTEGIDOS)
 # ========================================================
@@ -168,48 +726,104 @@ def admin_gui():
 @app.route('/admin/upload', methods=['POST'])
 @requires_auth
 def upload_function():
-    if 'code' not in request.files:
-        return jsonify({"status": "error", "message": "Falta el archivo 'code'."}), 400
-        
-    func_file = request.files['code']
-    func_name = request.form.get('name', func_file.filename.replace('.py', ''))
+    # 'code': un único func.py; 'bundle': zip/tar con manifest.json, varios módulos y datos
+    bundle_file = request.files.get('bundle')
+    if 'code' not in request.files and not bundle_file:
+        return jsonify({"status": "error", "message": "Falta el archivo 'code' (o el paquete 'bundle')."}), 400
+
+    if bundle_file:
+        func_file = bundle_file
+        func_name = request.form.get('name', bundle_stem(bundle_file.filename))
+    else:
+        func_file = request.files['code']
+        func_name = request.form.get('name', func_file.filename.replace('.py', ''))
     
     if not func_name:
         return jsonify({"status": "error", "message": "El nombre de la función es obligatorio."}), 400
 
+    try:
+        batch = parse_batch_form(request.form)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Configuración de micro-batching inválida: {e}"}), 400
+
+    # prewarm: init() se ejecuta ya en la carga (y en cada reinicio), no en la primera invocación
+    prewarm = request.form.get('prewarm', '').lower() in ('1', 'true', 'yes', 'on')
+
+    # Retención propia de la función (si no se indica, se aplica la global)
+    try:
+        retention = normalize_retention({key: request.form.get(f"retention_{key}") for key in RETENTION_KEYS})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Límites de concurrencia, cola y ritmo propios (si no se indican, se aplican los globales)
+    try:
+        admission = normalize_admission({key: request.form.get(key) for key in ADMISSION_KEYS})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    bundle = None
+    if bundle_file:
+        try:
+            bundle = deploy_bundle(BUNDLES_DIR, bundle_file.read(), BUNDLE_RUNTIMES)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Paquete inválido: {e}"}), 400
+
     func_dir = os.path.join(FUNCTIONS_DIR, func_name)
     os.makedirs(func_dir, exist_ok=True)
     
-    func_path = os.path.join(func_dir, "func.py")
-    func_file.save(func_path)
+    if bundle:
+        func_path = os.path.join(bundle_path(BUNDLES_DIR, bundle["digest"]), bundle["entry"])
+    else:
+        func_path = os.path.join(func_dir, "func.py")
+        func_file.save(func_path)
     
     reqs_file = request.files.get('requirements')
     reqs_path = os.path.join(func_dir, "requirements.txt")
     
     if reqs_file:
         reqs_file.save(reqs_path)
+    elif bundle and bundle["dependencies"]:
+        with open(reqs_path, 'w') as f:
+            f.write("\n".join(bundle["dependencies"]) + "\n")
+    has_requirements = bool(reqs_file) or bool(bundle and bundle["dependencies"])
+    if has_requirements:
         try:
             install_requirements(reqs_path)
         except Exception as e:
             shutil.rmtree(func_dir, ignore_errors=True)
+            collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
             return jsonify({"status": "error", "message": f"Fallo al instalar dependencias: {str(e)}"}), 500
     
     try:
         functions[func_name] = {
             "name": func_name,
             "file_path": func_path,
-            "requirements_path": reqs_path if reqs_file else None,
+            "requirements_path": reqs_path if has_requirements else None,
+            "bundle": bundle,
             "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "batch": batch,
+            "prewarm": prewarm,
+            "retention": retention,
+            "admission": admission,
         }
         
         load_function_module(func_name, func_path)
+        FUNCTION_RESOURCES.release(func_name)
+        message = f"Función cargada: {func_name}"
+        if prewarm:
+            message += f" (init: {ensure_initialized(func_name)} ms)"
+        configure_batcher(func_name)
         
         save_state()
-        return jsonify({"status": "success", "message": f"Función cargada: {func_name}"})
+        collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+        publish_admin_event("function", {"action": "deployed", "function": func_name, "info": function_info(func_name)})
+        return jsonify({"status": "success", "message": message})
     
     except Exception as e:
         if func_name in functions:
             del functions[func_name]
+        configure_batcher(func_name)
+        shutdown_function(func_name)
             
         print("\n\n#####################################################")
         print(f"!!! FALLO CRÍTICO DE CARGA DE MÓDULO PARA: {func_name} !!!")
@@ -217,13 +831,14 @@ def upload_function():
         print("#####################################################\n")
         
         shutil.rmtree(func_dir, ignore_errors=True)
+        collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
         return jsonify({"status": "error", "message": f"Fallo en la carga del módulo: {str(e)}"}), 500
 
 
 @app.route('/admin/functions', methods=['GET'])
 @requires_auth
 def list_functions():
-    func_list = {k: {key: v for key, v in data.items() if key != "module"} 
+    func_list = {k: {key: v for key, v in data.items() if key not in RUNTIME_KEYS} 
                  for k, data in functions.items()}
     return jsonify(func_list)
 
@@ -237,10 +852,18 @@ def delete_function(func_name):
             shutil.rmtree(func_dir)
             
             del functions[func_name]
+            FUNCTION_METRICS.pop(func_name, None)
+            configure_batcher(func_name)
+            shutdown_function(func_name)
+            FUNCTION_RESOURCES.release(func_name)
             if func_name in logs:
                 del logs[func_name]
+            HISTORY.forget(func_name)
+            collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+            collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
             
             save_state()
+            publish_admin_event("function", {"action": "deleted", "function": func_name})
             return jsonify({"status": "success", "message": f"Función eliminada: {func_name}"})
         except Exception as e:
             return jsonify({"status": "error", "message": f"Error al eliminar la función: {str(e)}"}), 500
@@ -248,40 +871,275 @@ def delete_function(func_name):
         return jsonify({"status": "error", "message": f"Función no encontrada: {func_name}"}), 404
 
 
+@app.route('/admin/events', methods=['GET'])
+@requires_auth
+def stream_admin_events():
+    """
+    Stream SSE del panel: un 'snapshot' inicial y después solo eventos incrementales
+    (invocation, status, function, task). Filtro opcional: ?types=invocation,status.
+    """
+    requested = request.args.get('types')
+    types = set(requested.split(',')) if requested else set(ADMIN_EVENT_TYPES)
+    if not types <= set(ADMIN_EVENT_TYPES):
+        return jsonify({"status": "error", "message": f"types debe contener solo: {', '.join(ADMIN_EVENT_TYPES)}."}), 400
+
+    subscriber = AdminSubscriber(types)
+
+    def generate():
+        # Se registra al empezar a enviar: si el cliente se va antes, nunca queda suscrito
+        with ADMIN_EVENTS_LOCK:
+            ADMIN_EVENT_SUBSCRIBERS.append(subscriber)
+        try:
+            snapshot = admin_snapshot()
+            last_sample_ts = snapshot["status"]["ts"] if snapshot["status"] else 0
+            yield format_admin_event("snapshot", snapshot)
+            last_sent = time.monotonic()
+            while True:
+                if subscriber.overflowed:
+                    # El panel no dio abasto: se descartan los eventos pendientes y se resincroniza
+                    subscriber.drain()
+                    yield format_admin_event("snapshot", admin_snapshot())
+                    last_sent = time.monotonic()
+                try:
+                    event_id, kind, data = subscriber.events.get(timeout=SAMPLE_INTERVAL_SECONDS)
+                    yield format_admin_event(kind, data, event_id)
+                    last_sent = time.monotonic()
+                except queue.Empty:
+                    pass
+
+                # Las muestras del sistema se leen del muestreador, sin tocar psutil
+                sample = SAMPLER.latest()
+                if "status" in types and sample and sample["ts"] > last_sample_ts:
+                    last_sample_ts = sample["ts"]
+                    yield format_admin_event("status", status_event(sample))
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= ADMIN_SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+        finally:
+            with ADMIN_EVENTS_LOCK:
+                ADMIN_EVENT_SUBSCRIBERS.remove(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route('/admin/status', methods=['GET'])
 @requires_auth
 def get_server_status():
-    uptime_seconds = time.time() - psutil.boot_time()
-    days, remainder = divmod(uptime_seconds, 86400)
-    hours, remainder = divmod(remainder, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    uptime_str = f"{int(days)}d {int(hours)}h {int(minutes)}m {int(seconds)}s"
+    try:
+        window = parse_history_window(request.args.get('history'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "'history' debe ser un número de segundos mayor que 0."}), 400
 
+    # Se responde con la última muestra del muestreador, sin llamar a psutil aquí
+    sample = SAMPLER.latest()
     status_data = {
         "status": "ok",
-        "uptime": uptime_str,
-        "cpu_percent": psutil.cpu_percent(interval=None),
-        "ram_percent": psutil.virtual_memory().percent,
+        "uptime": uptime_text(),
+        "cpu_percent": sample["cpu_percent"],
+        "ram_percent": sample["ram_percent"],
         # 🟢 Este valor es el que usa el frontend.
-        "loaded_functions": len(functions)
+        "loaded_functions": len(functions),
+        "sample": sample
     }
+    if window is not None:
+        status_data["history"] = SAMPLER.history(window)
     return jsonify(status_data)
 
 
+@app.route('/metrics', methods=['GET'])
+@requires_auth
+def get_metrics():
+    """Contadores e histogramas por función en formato de exposición de Prometheus."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/admin/history', methods=['GET'])
+@requires_auth
+def query_history():
+    """Historial filtrado: ?function=&status=&since=&until=&limit=&offset= (más reciente primero)."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(HISTORY.query(filters))
+
+
+@app.route('/admin/history/aggregate', methods=['GET'])
+@requires_auth
+def aggregate_history():
+    """Agregados por ventana de tiempo: ?function=&since=&until=&bucket=<segundos>."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(HISTORY.aggregate(filters))
+
+
+@app.route('/admin/blobs/<digest>', methods=['GET'])
+@requires_auth
+def get_blob(digest):
+    """JSON completo de unos args/resultado guardados fuera del log."""
+    data = read_blob(BLOBS_DIR, digest)
+    if data is None:
+        return jsonify({"status": "error", "message": f"Blob no encontrado: {digest}"}), 404
+    return Response(data, mimetype="application/json")
+
+
+@app.route('/admin/blobs/gc', methods=['POST'])
+@requires_auth
+def run_blob_gc():
+    return jsonify({"status": "success", **collect_blob_garbage(BLOBS_DIR, referenced_blobs)})
+
+
+@app.route('/admin/admission', methods=['GET'])
+@requires_auth
+def get_admission():
+    """Límites efectivos, ocupación actual y rechazos del control de admisión."""
+    return jsonify(ADMISSION_CONTROL.report(list(functions)))
+
+
+@app.route('/admin/retention', methods=['GET'])
+@requires_auth
+def get_retention():
+    """Políticas de retención efectivas y ocupación de los archivos."""
+    return jsonify(retention_report())
+
+
+@app.route('/admin/retention/run', methods=['POST'])
+@requires_auth
+def run_retention():
+    return jsonify({"status": "success", **apply_retention()})
+
+
+@app.route('/admin/archives', methods=['GET'])
+@requires_auth
+def list_archives():
+    return jsonify([{k: v for k, v in segment.items() if k != "path"} for segment in list_archive_segments(ARCHIVE_DIR)])
+
+
+@app.route('/admin/archives/query', methods=['GET'])
+@requires_auth
+def query_archived_history():
+    """Consulta sobre los segmentos archivados: mismos filtros que /admin/history."""
+    try:
+        filters = parse_history_filters(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(query_archives(ARCHIVE_DIR, filters))
+
+
+@app.route('/admin/archives/<function>/<day>', methods=['GET'])
+@requires_auth
+def export_archive(function, day):
+    """Descarga un segmento (jsonl.gz) tal cual, para exportarlo."""
+    for segment in list_archive_segments(ARCHIVE_DIR):
+        if segment["function"] == function and segment["day"] == day:
+            return send_file(os.path.abspath(segment["path"]), mimetype="application/gzip", as_attachment=True,
+                             download_name=f"{function}-{day}.jsonl.gz")
+    return jsonify({"status": "error", "message": f"Segmento no encontrado: {function}/{day}"}), 404
+
+
 @app.route('/admin/logs/<func_name>', methods=['GET'])
 @requires_auth
 def get_function_logs(func_name):
     """Devuelve el historial de logs de ejecución para una función."""
     if func_name in logs:
-        return jsonify(logs[func_name])
+        return jsonify([dict(entry) for entry in logs[func_name]])
     else:
         return jsonify({"status": "error", "message": f"Logs no encontrados para: {func_name}"}), 404
 
+@app.route('/admin/pipelines', methods=['POST'])
+@requires_auth
+def register_pipeline():
+    """Registra (o reemplaza) un pipeline: {"name": ..., "stages": [...]}."""
+    data = request.get_json(silent=True) or {}
+    pipeline_name = data.get("name")
+    if not pipeline_name:
+        return jsonify({"status": "error", "message": "El nombre del pipeline es obligatorio."}), 400
+
+    try:
+        stages = normalize_pipeline(data.get("stages"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Pipeline inválido: {e}"}), 400
+
+    missing = sorted({stage["function"] for stage in stages if stage["function"] not in functions})
+    if missing:
+        return jsonify({"status": "error", "message": f"Funciones no cargadas: {', '.join(missing)}"}), 404
+
+    pipelines[pipeline_name] = {
+        "name": pipeline_name,
+        "stages": stages,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_state()
+    return jsonify({"status": "success", "message": f"Pipeline registrado: {pipeline_name}", "stages": stages})
+
+
+@app.route('/admin/pipelines', methods=['GET'])
+@requires_auth
+def list_pipelines():
+    return jsonify(pipelines)
+
+
+@app.route('/admin/pipelines/<pipeline_name>', methods=['DELETE'])
+@requires_auth
+def delete_pipeline(pipeline_name):
+    if pipeline_name not in pipelines:
+        return jsonify({"status": "error", "message": f"Pipeline no encontrado: {pipeline_name}"}), 404
+    del pipelines[pipeline_name]
+    logs.pop(f"pipeline:{pipeline_name}", None)
+    HISTORY.forget(f"pipeline:{pipeline_name}")
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+    save_state()
+    return jsonify({"status": "success", "message": f"Pipeline eliminado: {pipeline_name}"})
+
 # ========================================================
 # 🚀 ENDPOINT DE INVOCACIÓN (NO PROTEGIDO)
 # ========================================================
 
+def stream_invocation(func_name, main, args, timeout, init_ms=None):
+    """
+    Cuerpo NDJSON de un `main` generador: una línea {"seq", "item"} por elemento según
+    se produce y, al final, la entrada de log con "done": true. El log guarda solo el
+    recuento de elementos, nunca la secuencia completa.
+    """
+    s_time = time.time()
+    invocation_id = str(uuid.uuid4())
+    entry = {"id": invocation_id, "args": args,
+             "time_start": datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f")}
+    stream = {"items": 0, "first_item_ms": None}
+    t_call = time.perf_counter()
+    try:
+        for item in iterate_stream(main, args, FUNCTION_RESOURCES.context(func_name, invocation_id), timeout):
+            if stream["first_item_ms"] is None:
+                stream["first_item_ms"] = round((time.perf_counter() - t_call) * 1000, 3)
+            stream["items"] += 1
+            yield json.dumps({"seq": stream["items"] - 1, "item": item}, default=str) + "\n"
+        entry["status"] = "success"
+    except GeneratorExit:
+        entry.update({"error": "Stream cancelado: el cliente cerró la conexión.", "status": "error"})
+        raise
+    except Exception as e:
+        entry.update({"error": str(e), "status": "error"})
+    finally:
+        entry.setdefault("status", "error")
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000, error=entry["status"] == "error")
+        entry["time_end"] = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+        entry["stream"] = stream
+        if init_ms is not None:
+            entry["init_ms"] = init_ms
+        log_entry = compact_entry(BLOBS_DIR, entry)
+        logs.setdefault(func_name, []).append(log_entry)
+        save_state()
+        HISTORY.record(func_name, log_entry)
+        publish_invocation(func_name, log_entry)
+    yield json.dumps({**entry, "done": True}, default=str) + "\n"
+
+
 @app.route('/function/<func_name>', methods=['POST'])
+@admission_controlled
 def core_execute_function(func_name):
     if func_name not in functions:
         return jsonify({"status": "error", "message": f"Función no cargada: {func_name}"}), 404
@@ -292,18 +1150,54 @@ def core_execute_function(func_name):
     module = functions[func_name].get("module")
     if module is None:
         return jsonify({"status": "error", "message": "Módulo de función no cargado en memoria."}), 500
+
+    try:
+        timeout = call_timeout(data, ASYNC_DEFAULT_TIMEOUT, ASYNC_MAX_TIMEOUT)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "'timeout' debe ser un número de segundos."}), 400
+
+    # init() pendiente (función sin prewarm): su coste no cuenta en la latencia de la invocación
+    try:
+        init_ms = ensure_initialized(func_name)
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Fallo en init() de {func_name}: {str(e)}"}), 500
+
+    # Con micro-batching, la invocación espera a que se ejecute su lote
+    batcher = batchers.get(func_name)
+    if batcher:
+        done = threading.Event()
+        holder = {}
+        def on_done(entry):
+            holder["entry"] = entry
+            done.set()
+        batcher.submit(args, on_done)
+        # Espera acotada: ventana del lote más el plazo de la invocación
+        if not done.wait(batcher.window + timeout):
+            return jsonify({"status": "error",
+                            "message": f"Timeout: el lote de {func_name} no respondió en {timeout}s."}), 504
+        return jsonify(holder["entry"])
+
+    # `main` generador: respuesta por partes (NDJSON) en lugar de materializar el resultado
+    if is_stream_function(module.main):
+        return Response(stream_invocation(func_name, module.main, args, timeout, init_ms),
+                        mimetype="application/x-ndjson",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
         
     s_time = time.time()
     start_time = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f") 
+    invocation_id = str(uuid.uuid4())
+    t_call = time.perf_counter()
 
     try:
-        result = module.main(*args)
+        result = call_function(module.main, *args, timeout=timeout,
+                               context=FUNCTION_RESOURCES.context(func_name, invocation_id))
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000)
         
         e_time = time.time()
         end_time = datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")   
         
         entry = {
-            "id": str(uuid.uuid4()), 
+            "id": invocation_id, 
             "args": args, 
             "result": result, 
             "status": "success",
@@ -312,9 +1206,10 @@ def core_execute_function(func_name):
         }
     except Exception as e:
         e_time = time.time()
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000, error=True)
         
         entry = {
-            "id": str(uuid.uuid4()), 
+            "id": invocation_id, 
             "args": args, 
             "error": str(e), 
             "status": "error",
@@ -322,18 +1217,70 @@ def core_execute_function(func_name):
             "time_end": datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")
         }
 
-    logs.setdefault(func_name, []).append(entry)
+    if init_ms is not None:
+        entry["init_ms"] = init_ms
+
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(func_name, []).append(log_entry)
     save_state()
+    HISTORY.record(func_name, log_entry)
+    publish_invocation(func_name, log_entry)
     
     return jsonify(entry)
 
+@app.route('/pipeline/<pipeline_name>', methods=['POST'])
+@pipeline_admission_controlled
+def execute_pipeline(pipeline_name):
+    if pipeline_name not in pipelines:
+        return jsonify({"status": "error", "message": f"Pipeline no encontrado: {pipeline_name}"}), 404
+
+    data = request.get_json(silent=True)
+    args = data.get('args', []) if data and isinstance(data, dict) else []
+
+    try:
+        timeout = call_timeout(data, ASYNC_DEFAULT_TIMEOUT, ASYNC_MAX_TIMEOUT)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "'timeout' debe ser un número de segundos."}), 400
+
+    t_pipeline = time.perf_counter()
+    entry = run_pipeline(pipeline_name, args, timeout)
+    record_metrics(f"pipeline:{pipeline_name}", (time.perf_counter() - t_pipeline) * 1000,
+                   error=entry["status"] == "error")
+
+    # Los logs del pipeline se guardan junto a los de las funciones, con prefijo
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(f"pipeline:{pipeline_name}", []).append(log_entry)
+    save_state()
+    HISTORY.record(f"pipeline:{pipeline_name}", log_entry)
+    publish_invocation(f"pipeline:{pipeline_name}", log_entry)
+
+    return jsonify(entry)
+
+# ========================================================
+# 🧵 SERVICIOS EN SEGUNDO PLANO
+# ========================================================
+
+def start_background_services():
+    """
+    Arranca los hilos del servidor: bucle asyncio, muestreo del sistema, escritor del
+    historial (crea data/history.db) y retención. Importar el módulo no arranca ninguno.
+    """
+    threading.Thread(target=EVENT_LOOP.run_forever, name="faas-asyncio", daemon=True).start()
+    SAMPLER.start()
+    HISTORY.start()
+    atexit.register(HISTORY.close)
+    threading.Thread(target=retention_worker, name="faas-retention", daemon=True).start()
+
+
 # ========================================================
 # 🚀 MAIN
 # ========================================================
 if __name__ == "__main__":
+    start_background_services()
     load_state() 
     
     print("TinyFaaS V2.3 HTTP Server (Final) iniciado en http://127.0.0.1:8080")
     print("Accede a la GUI de administración en: http://127.0.0.1:8080/admin/gui")
     
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    # Sin recargador: el proceso padre de Werkzeug volvería a arrancar los hilos y a escribir el estado
+    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""
+Código común de los servidores de LIFTR (HTTP persistente, MQTT y contenedorizado).
+
+Los servidores son scripts independientes: cada uno añade la raíz del repositorio
+a sys.path antes de importar este paquete.
+"""
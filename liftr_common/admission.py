@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import deque
+
+# ========================================================
+# 🚦 CONTROL DE ADMISIÓN (concurrencia, colas con plazo y límites por llamante)
+# ========================================================
+
+ADMISSION_KEYS = ("max_concurrency", "queue_size", "queue_timeout", "rate_limit", "rate_burst")
+ADMISSION_RETRY_AFTER = 1          # Sugerencia (s) al rechazar por cola llena o plazo vencido
+RATE_BUCKETS_MAX = 10000           # Por encima se descartan los buckets ya llenos (llamantes inactivos)
+
+
+class Overloaded(Exception):
+    """Invocación rechazada por el control de admisión ('reason': rate_limited, queue_full o queue_timeout)."""
+
+    def __init__(self, func_name, reason, retry_after=ADMISSION_RETRY_AFTER):
+        messages = {
+            "rate_limited": "Límite de invocaciones por segundo alcanzado",
+            "queue_full": "Servidor ocupado: cola de espera llena",
+            "queue_timeout": "Servidor ocupado: plazo de espera en cola agotado",
+        }
+        super().__init__(f"{messages[reason]} ({func_name}).")
+        self.reason = reason
+        self.retry_after = max(1, int(-(-retry_after // 1)))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Consume un token; devuelve 0 o los segundos que faltan para el siguiente."""
+        self.refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ConcurrencyLimiter:
+    """
+    Hasta 'limit' ejecuciones a la vez y 'queue_size' invocaciones esperando turno.
+    reserve() ocupa un hueco (o falla al instante si no lo hay) y take() espera el
+    turno en orden de llegada hasta el plazo; release() lo devuelve al terminar.
+    """
+
+    def __init__(self, limit, queue_size):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.cond = threading.Condition()
+        self.active = 0
+        self.reserved = 0          # Reservas aún sin turno (en la cola)
+        self.waiters = deque()     # Orden de llegada de los que esperan en take()
+
+    def reserve(self):
+        with self.cond:
+            if self.limit and self.active + self.reserved >= self.limit + self.queue_size:
+                return False
+            self.reserved += 1
+            return True
+
+    def cancel(self):
+        with self.cond:
+            self.reserved -= 1
+
+    def take(self, deadline=None):
+        """Turno para una reserva previa; False si vence 'deadline' (reloj monotónico) antes."""
+        with self.cond:
+            me = object()
+            self.waiters.append(me)
+            while self.waiters[0] is not me or (self.limit and self.active >= self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.waiters.remove(me)
+                    self.reserved -= 1
+                    self.cond.notify_all()
+                    return False
+                self.cond.wait(remaining)
+            self.waiters.popleft()
+            self.reserved -= 1
+            self.active += 1
+            self.cond.notify_all()
+            return True
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"limit": self.limit, "queue_size": self.queue_size,
+                    "active": self.active, "queued": self.reserved}
+
+
+class Admission:
+    """Plaza de una invocación: reservada al llegar y ocupada mientras se ejecuta."""
+
+    def __init__(self, limiters):
+        self.limiters = limiters
+        self.taken = []
+        self.lock = threading.Lock()
+
+    def start(self, deadline=None):
+        """Espera el turno en cada limitador (el de la función primero); False si vence el plazo."""
+        for i, limiter in enumerate(self.limiters):
+            if not limiter.take(deadline):
+                for pending in self.limiters[i + 1:]:
+                    pending.cancel()
+                self.release()
+                return False
+            self.taken.append(limiter)
+        return True
+
+    def release(self):
+        with self.lock:
+            taken, self.taken = self.taken, []
+        for limiter in taken:
+            limiter.release()
+
+
+class AdmissionControl:
+    """
+    Control de admisión de un servidor: límite global, limitadores por función, token
+    buckets por llamante y recuento de rechazos. La política de una función es `defaults`
+    con lo que devuelva `overrides(nombre)` (None si la función no tiene política propia).
+    """
+
+    def __init__(self, defaults, max_concurrency, queue_size, overrides):
+        self.defaults = defaults
+        self.overrides = overrides
+        self.lock = threading.Lock()
+        self.function_limiters = {}    # nombre -> ConcurrencyLimiter (solo funciones con límite propio)
+        self.rate_buckets = {}         # (llamante, función) -> TokenBucket
+        self.rejections = {}           # (función, motivo) -> rechazos
+        self.global_limiter = ConcurrencyLimiter(max_concurrency, queue_size)
+
+    def policy(self, func_name):
+        """Política efectiva: la global con las sobrescrituras de la función (si las tiene)."""
+        policy = dict(self.defaults)
+        policy.update(self.overrides(func_name) or {})
+        return policy
+
+    def function_limiter(self, func_name, policy):
+        """Limitador propio de la función; se recrea si su política cambió al volver a subirla."""
+        with self.lock:
+            if not policy["max_concurrency"]:
+                self.function_limiters.pop(func_name, None)
+                return None
+            limiter = self.function_limiters.get(func_name)
+            if limiter is None or (limiter.limit, limiter.queue_size) != (policy["max_concurrency"],
+                                                                          policy["queue_size"]):
+                limiter = self.function_limiters[func_name] = ConcurrencyLimiter(policy["max_concurrency"],
+                                                                                 policy["queue_size"])
+            return limiter
+
+    def take_rate_token(self, func_name, caller, policy):
+        """Token bucket del llamante para la función; 0 si puede invocar ya."""
+        if not policy["rate_limit"]:
+            return 0
+        key = (caller, func_name)
+        with self.lock:
+            bucket = self.rate_buckets.get(key)
+            if bucket is None or bucket.rate != policy["rate_limit"]:
+                if len(self.rate_buckets) >= RATE_BUCKETS_MAX:
+                    now = time.monotonic()
+                    for idle_key, idle in list(self.rate_buckets.items()):
+                        idle.refill(now)
+                        if idle.tokens >= idle.burst:
+                            del self.rate_buckets[idle_key]
+                burst = policy["rate_burst"] or max(1, int(policy["rate_limit"]))
+                bucket = self.rate_buckets[key] = TokenBucket(policy["rate_limit"], burst)
+            return bucket.take()
+
+    def count_rejection(self, func_name, reason):
+        with self.lock:
+            self.rejections[(func_name, reason)] = self.rejections.get((func_name, reason), 0) + 1
+
+    def reserve(self, func_name, caller):
+        """
+        Primera fase de la admisión, sin esperar: límite de ritmo del llamante y hueco en
+        las colas de la función y global. Lanza Overloaded si no hay sitio.
+        """
+        policy = self.policy(func_name)
+        retry_after = self.take_rate_token(func_name, caller, policy)
+        if retry_after:
+            self.count_rejection(func_name, "rate_limited")
+            raise Overloaded(func_name, "rate_limited", retry_after)
+        limiters = [limiter for limiter in (self.function_limiter(func_name, policy), self.global_limiter) if limiter]
+        for i, limiter in enumerate(limiters):
+            if not limiter.reserve():
+                for reserved in limiters[:i]:
+                    reserved.cancel()
+                self.count_rejection(func_name, "queue_full")
+                raise Overloaded(func_name, "queue_full")
+        return Admission(limiters)
+
+    def admit(self, func_name, caller, wait=True):
+        """
+        Admisión completa: reserva y espera de turno hasta 'queue_timeout' (sin espera si
+        wait=False). Devuelve la plaza (hay que liberarla con release()) o lanza Overloaded.
+        """
+        admission = self.reserve(func_name, caller)
+        timeout = self.policy(func_name)["queue_timeout"] if wait else 0
+        if not admission.start(time.monotonic() + timeout):
+            self.count_rejection(func_name, "queue_timeout")
+            raise Overloaded(func_name, "queue_timeout")
+        return admission
+
+    def report(self, func_names):
+        """Límite global, política y limitador de cada función de `func_names` y rechazos."""
+        with self.lock:
+            limiters = dict(self.function_limiters)
+            rejections = {}
+            for (func_name, reason), count in self.rejections.items():
+                rejections.setdefault(func_name, {})[reason] = count
+        return {
+            "global": self.global_limiter.stats(),
+            "defaults": self.defaults,
+            "functions": {
+                func_name: {"policy": self.policy(func_name),
+                            "limiter": limiters[func_name].stats() if func_name in limiters else None}
+                for func_name in func_names
+            },
+            "rejections": rejections,
+        }
+
+
+def normalize_admission(values):
+    """Política por función a partir de los campos de ADMISSION_KEYS; None si no se indicó ninguno."""
+    policy = {}
+    for key in ADMISSION_KEYS:
+        value = (values or {}).get(key)
+        if value in (None, ""):
+            continue
+        try:
+            value = float(value) if key in ("queue_timeout", "rate_limit") else int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' debe ser un número.")
+        if value < 0:
+            raise ValueError(f"'{key}' no puede ser negativo.")
+        policy[key] = value
+    return policy or None
@@ -0,0 +1,159 @@
+import asyncio
+import inspect
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+from liftr_common.invocation import call_function, context_kwargs, run_on_event_loop
+from liftr_common.metrics import record_metrics
+
+# ========================================================
+# 📦 MICRO-BATCHING (opcional por función)
+# ========================================================
+
+def run_batch(module, batch_args, batch_context, contexts, timeout):
+    """
+    Ejecuta un lote de invocaciones con una sola llamada a `main_batch(lista_de_args)`
+    si el módulo la define (debe devolver una lista del mismo tamaño); si no, llama
+    a `main(*args)` en bucle. Devuelve una lista de (resultado, error).
+    """
+    if callable(getattr(module, 'main_batch', None)):
+        try:
+            results = call_function(module.main_batch, batch_args, timeout=timeout, context=batch_context)
+            if not isinstance(results, (list, tuple)) or len(results) != len(batch_args):
+                raise ValueError("main_batch debe devolver una lista con un resultado por invocación.")
+            return [(result, None) for result in results]
+        except Exception as e:
+            return [(None, str(e))] * len(batch_args)
+
+    # Con 'async def main', todas las invocaciones del lote se esperan a la vez
+    if inspect.iscoroutinefunction(module.main):
+        async def gather_batch():
+            return await asyncio.gather(
+                *(module.main(*args, **context_kwargs(module.main, ctx)) for args, ctx in zip(batch_args, contexts)),
+                return_exceptions=True
+            )
+        try:
+            results = run_on_event_loop(gather_batch(), timeout)
+        except Exception as e:
+            return [(None, str(e))] * len(batch_args)
+        return [(None, str(r)) if isinstance(r, BaseException) else (r, None) for r in results]
+
+    outcomes = []
+    for args, ctx in zip(batch_args, contexts):
+        try:
+            outcomes.append((call_function(module.main, *args, timeout=timeout, context=ctx), None))
+        except Exception as e:
+            outcomes.append((None, str(e)))
+    return outcomes
+
+
+class MicroBatcher(threading.Thread):
+    """
+    Agrupa las invocaciones de una función durante `window_ms` desde la primera
+    pendiente, o hasta reunir `max_size`, y las ejecuta juntas en este hilo.
+    Cada invocación recibe su propia entrada de log a través de su callback.
+
+    Lo propio de cada servidor llega como parámetros: `load_module(nombre)` devuelve
+    el módulo ya inicializado (o lanza la excepción con el motivo), `record_batch(nombre,
+    entradas)` registra el lote y `resources` (FunctionResources) crea los contextos.
+    """
+
+    def __init__(self, func_name, window_ms, max_size, load_module, record_batch, resources, timeout):
+        super().__init__(daemon=True)
+        self.func_name = func_name
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self.load_module = load_module
+        self.record_batch = record_batch
+        self.resources = resources
+        self.timeout = timeout
+        self.pending = []  # (llegada, args, callback)
+        self.cond = threading.Condition()
+        self.running = True
+
+    def submit(self, args, callback):
+        with self.cond:
+            self.pending.append((time.monotonic(), args, callback))
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and self.running:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                deadline = self.pending[0][0] + self.window
+                while len(self.pending) < self.max_size and self.running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch, self.pending = self.pending[:self.max_size], self.pending[self.max_size:]
+            try:
+                self.execute(batch)
+            except Exception:
+                # Último recurso: el hilo del batcher no debe morir (los envíos posteriores se perderían)
+                print(f"ADVERTENCIA: fallo inesperado en el lote de '{self.func_name}'.")
+                traceback.print_exc()
+
+    def execute(self, batch):
+        batch_id = str(uuid.uuid4())
+        invocation_ids = [str(uuid.uuid4()) for _ in batch]
+        start_time = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+        t_batch = time.monotonic()
+        try:
+            outcomes = self.run_functions(batch, batch_id, invocation_ids)
+        except Exception as e:
+            outcomes = [(None, f"Error interno del micro-batching: {e}")] * len(batch)
+        end_time = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+        entries = []
+        batch_ms = (time.monotonic() - t_batch) * 1000
+        for invocation_id, (arrival, args, callback), (result, error) in zip(invocation_ids, batch, outcomes):
+            record_metrics(self.func_name, batch_ms, error is not None, queue_ms=(t_batch - arrival) * 1000)
+            entry = {"id": invocation_id, "args": args, "time_start": start_time, "time_end": end_time,
+                     "batch": {"id": batch_id, "size": len(batch)}}
+            if error is None:
+                entry.update({"result": result, "status": "success"})
+            else:
+                entry.update({"error": error, "status": "error"})
+            entries.append((entry, callback))
+
+        # Un único guardado de estado por lote; un fallo al registrar no impide entregar las respuestas
+        try:
+            self.record_batch(self.func_name, [entry for entry, _ in entries])
+        except Exception as e:
+            print(f"ADVERTENCIA: no se pudo registrar el lote de '{self.func_name}': {e}")
+        for entry, callback in entries:
+            self.deliver(callback, entry)
+
+    def deliver(self, callback, entry):
+        """Entrega la entrada; si el callback falla, lo reintenta con una entrada de error mínima."""
+        try:
+            callback(entry)
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al entregar la invocación {entry['id']} de '{self.func_name}': {e}")
+            try:
+                callback({"id": entry["id"], "status": "error", "error": f"Fallo al entregar el resultado: {e}",
+                          "time_start": entry["time_start"], "time_end": entry["time_end"], "batch": entry["batch"]})
+            except Exception:
+                traceback.print_exc()
+
+    def run_functions(self, batch, batch_id, invocation_ids):
+        """(resultado, error) de cada invocación del lote."""
+        try:
+            module = self.load_module(self.func_name)
+        except Exception as e:
+            return [(None, str(e))] * len(batch)
+        contexts = [self.resources.context(self.func_name, invocation_id) for invocation_id in invocation_ids]
+        return run_batch(module, [args for _, args, _ in batch], self.resources.context(self.func_name, batch_id),
+                         contexts, self.timeout)
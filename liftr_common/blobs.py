@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+# ========================================================
+# 🧱 ALMACÉN DE BLOBS (args/resultados grandes fuera del log, por contenido)
+# ========================================================
+
+BLOB_THRESHOLD_BYTES = int(os.getenv("FAAS_BLOB_THRESHOLD", str(64 * 1024)))
+BLOB_PREVIEW_CHARS = 256
+BLOB_FIELDS = ("args", "result")
+BLOB_GC_GRACE_SECONDS = 300        # Un blob recién escrito puede no estar aún en el log
+BLOB_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_path(blobs_dir, digest):
+    return os.path.join(blobs_dir, digest[:2], digest)
+
+
+def store_blob(blobs_dir, data):
+    """Guarda `data` (bytes) una sola vez bajo su SHA-256 y devuelve el digest."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(blobs_dir, digest)
+    if os.path.exists(path):
+        os.utime(path)  # Renueva el margen de gracia del recolector
+        return digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest
+
+
+def read_blob(blobs_dir, digest):
+    """Contenido del blob, o None si el digest no es válido o no existe."""
+    if not BLOB_DIGEST_PATTERN.match(digest or ""):
+        return None
+    try:
+        with open(blob_path(blobs_dir, digest), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def externalize_entry(blobs_dir, entry):
+    """
+    Copia de la entrada para el log y el historial: los 'args'/'result' cuyo JSON supera
+    BLOB_THRESHOLD_BYTES se guardan como blob y se sustituyen por {"$blob", "size", "preview"}.
+    La respuesta al cliente sigue usando la entrada completa.
+    """
+    log_entry = entry
+    for field in BLOB_FIELDS:
+        if field not in entry:
+            continue
+        encoded = json.dumps(entry[field], default=str).encode("utf-8")
+        if len(encoded) <= BLOB_THRESHOLD_BYTES:
+            continue
+        try:
+            digest = store_blob(blobs_dir, encoded)
+        except OSError as e:
+            print(f"ADVERTENCIA: no se pudo guardar el blob de '{field}' ({len(encoded)} bytes): {e}")
+            continue
+        if log_entry is entry:
+            log_entry = dict(entry)
+        log_entry[field] = {"$blob": digest, "size": len(encoded),
+                            "preview": encoded[:BLOB_PREVIEW_CHARS].decode("utf-8", "ignore")}
+    return log_entry
+
+
+def inline_blobs(blobs_dir, entry):
+    """Los segmentos archivados son autónomos: las referencias a blobs se sustituyen por su contenido."""
+    for field in BLOB_FIELDS:
+        value = entry.get(field)
+        if isinstance(value, dict) and "$blob" in value:
+            blob = read_blob(blobs_dir, value["$blob"])
+            if blob is not None:
+                entry = {**entry, field: json.loads(blob)}
+    return entry
+
+
+def blob_references(logs):
+    """Digests referenciados por las entradas de log que siguen retenidas ({log: [entradas]})."""
+    referenced = set()
+    for entries in list(logs.values()):
+        for entry in list(entries):
+            for field in BLOB_FIELDS:
+                value = entry.get(field)
+                if isinstance(value, dict) and "$blob" in value:
+                    referenced.add(value["$blob"])
+    return referenced
+
+
+def collect_blob_garbage(blobs_dir, references):
+    """
+    Borra los blobs que ya no referencia ningún log (respetando el margen de gracia).
+    `references()` devuelve los digests en uso; se llama antes de recorrer blobs_dir.
+    """
+    referenced = references()
+    cutoff = time.time() - BLOB_GC_GRACE_SECONDS
+    removed, freed = 0, 0
+    for root, _, files in os.walk(blobs_dir):
+        for name in files:
+            if name in referenced:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return {"removed": removed, "freed_bytes": freed}
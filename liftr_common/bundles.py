@@ -0,0 +1,268 @@
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import os
+import posixpath
+import py_compile
+import shutil
+import stat
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+
+# ========================================================
+# 📦 PAQUETES DE FUNCIÓN (zip/tar con manifiesto, bytecode precompilado)
+# ========================================================
+
+BUNDLE_MANIFEST = "manifest.json"
+BUNDLE_ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+BUNDLE_MAX_FILES = int(os.environ.get("FAAS_BUNDLE_MAX_FILES", "2000"))
+BUNDLE_MAX_BYTES = int(os.environ.get("FAAS_BUNDLE_MAX_BYTES", str(100 * 1024 * 1024)))  # Descomprimido
+BUNDLE_GC_GRACE_SECONDS = 300  # Un paquete recién desplegado aún puede no estar registrado
+BUNDLE_PACKAGE_PREFIX = "faas_bundle_"
+
+
+def bundle_path(bundles_dir, digest):
+    return os.path.join(bundles_dir, digest)
+
+
+def bundle_stem(filename):
+    """Nombre por defecto de la función: el del archivo sin la extensión del empaquetado."""
+    for suffix in BUNDLE_ARCHIVE_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def safe_member_path(name):
+    """Ruta relativa normalizada de un miembro del paquete; ValueError si sale del paquete."""
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if path in (".", "..") or path.startswith(("/", "../")):
+        raise ValueError(f"Ruta no permitida en el paquete: {name}")
+    return path
+
+
+def read_bundle_archive(data):
+    """
+    Archivos regulares de un zip o tar (opcionalmente comprimido) como {ruta: bytes}.
+    Se rechazan enlaces, dispositivos y rutas fuera del paquete, y los límites de
+    número de archivos y tamaño descomprimido se comprueban antes de leer cada miembro.
+    """
+    files, total = {}, 0
+
+    def add(name, size, read):
+        nonlocal total
+        total += size
+        if len(files) >= BUNDLE_MAX_FILES:
+            raise ValueError(f"El paquete supera el máximo de {BUNDLE_MAX_FILES} archivos.")
+        if total > BUNDLE_MAX_BYTES:
+            raise ValueError(f"El paquete descomprimido supera {BUNDLE_MAX_BYTES} bytes.")
+        files[safe_member_path(name)] = read()
+
+    try:
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if stat.S_ISLNK(info.external_attr >> 16):
+                        raise ValueError(f"Enlace simbólico no permitido en el paquete: {info.filename}")
+                    add(info.filename, info.file_size, lambda: archive.read(info))
+            return files
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            for member in archive:
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    raise ValueError(f"Solo se admiten archivos regulares en el paquete: {member.name}")
+                add(member.name, member.size, lambda: archive.extractfile(member).read())
+        return files
+    except tarfile.ReadError:
+        raise ValueError("El paquete debe ser un archivo zip o tar (.tar, .tar.gz, .tgz).")
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        raise ValueError(f"Paquete corrupto: {e}")
+
+
+def strip_bundle_root(files):
+    """Si todo cuelga de un único directorio (zip -r fn.zip fn/), ese directorio es la raíz."""
+    if BUNDLE_MANIFEST in files:
+        return files
+    tops = {path.split("/", 1)[0] for path in files}
+    if len(tops) != 1 or not all("/" in path for path in files):
+        return files
+    prefix = tops.pop() + "/"
+    return {path[len(prefix):]: content for path, content in files.items()}
+
+
+def bundle_module_name(entry):
+    """'src/main.py' -> 'src.main': nombre con el que se importa el punto de entrada."""
+    parts = posixpath.splitext(entry)[0].split("/")
+    if not all(part.isidentifier() for part in parts):
+        raise ValueError(f"'entry' debe ser una ruta importable como módulo Python: {entry}")
+    return ".".join(parts)
+
+
+def parse_bundle_manifest(files, runtimes):
+    """
+    Valida manifest.json: {"entry": "main.py", "runtime": "python", "dependencies": [...]}.
+    `runtimes` ({nombre: extensión}) son los que admite el servidor; si no se indica
+    'runtime', se deduce de la extensión de 'entry'.
+    """
+    if BUNDLE_MANIFEST not in files:
+        raise ValueError(f"Falta {BUNDLE_MANIFEST} en la raíz del paquete.")
+    try:
+        manifest = json.loads(files[BUNDLE_MANIFEST])
+    except ValueError as e:
+        raise ValueError(f"{BUNDLE_MANIFEST} no es JSON válido: {e}")
+    if not isinstance(manifest, dict):
+        raise ValueError(f"{BUNDLE_MANIFEST} debe ser un objeto JSON.")
+
+    entry = manifest.get("entry")
+    if not isinstance(entry, str) or safe_member_path(entry) not in files:
+        raise ValueError("'entry' debe indicar un archivo del paquete.")
+    entry = safe_member_path(entry)
+    extension = posixpath.splitext(entry)[1]
+    runtime = manifest.get("runtime") or next(
+        (name for name, suffix in runtimes.items() if suffix == extension), None)
+    if runtimes.get(runtime) != extension:
+        supported = ", ".join(f"{name} ({suffix})" for name, suffix in runtimes.items())
+        raise ValueError(f"'runtime' y la extensión de 'entry' deben corresponder a uno de: {supported}.")
+    if runtime == "python":
+        bundle_module_name(entry)
+
+    dependencies = manifest.get("dependencies") or []
+    if not isinstance(dependencies, list) or not all(isinstance(d, str) and d.strip() for d in dependencies):
+        raise ValueError("'dependencies' debe ser una lista de paquetes (p. ej. \"requests==2.31\").")
+    return {"entry": entry, "runtime": runtime, "dependencies": [d.strip() for d in dependencies]}
+
+
+def bundle_digest(files):
+    """sha256 de rutas y contenidos: no depende del orden ni de las fechas del archivo."""
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        content = files[path]
+        digest.update(f"{path}\0{len(content)}\0".encode("utf-8"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def compile_bundle(root):
+    """.py -> .pyc con hash sin comprobar: el paquete nunca cambia, así que importar no lee el fuente."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(".py"):
+                continue
+            source = os.path.join(dirpath, name)
+            try:
+                py_compile.compile(source, doraise=True,
+                                   invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+            except py_compile.PyCompileError as e:
+                raise ValueError(f"{os.path.relpath(source, root)}: {e.exc_type_name}: {e.exc_value}")
+
+
+def freeze_bundle(root):
+    """Quita el permiso de escritura a todos los archivos del paquete."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~0o222)
+
+
+def deploy_bundle(bundles_dir, data, runtimes, build=None):
+    """
+    Despliega un paquete zip/tar y devuelve sus metadatos ("entry", "runtime", "dependencies",
+    "digest", "files", "size"). Se desempaqueta una sola vez en bundles_dir/<sha256 del
+    contenido>, ya compilado y de solo lectura; un paquete idéntico reutiliza ese directorio.
+    `build(directorio, bundle)` añade los pasos propios del servidor (p. ej. compilar C)
+    antes de congelarlo. Lanza ValueError si el paquete o su manifiesto no son válidos.
+    """
+    files = strip_bundle_root(read_bundle_archive(data))
+    bundle = parse_bundle_manifest(files, runtimes)
+    digest = bundle_digest(files)
+    bundle.update(digest=digest, files=len(files), size=sum(len(content) for content in files.values()))
+
+    final_dir = bundle_path(bundles_dir, digest)
+    if os.path.isdir(final_dir):
+        os.utime(final_dir)  # Renueva el margen de gracia frente a collect_bundle_garbage
+        return bundle
+
+    os.makedirs(bundles_dir, exist_ok=True)
+    staging_dir = os.path.join(bundles_dir, f".staging-{uuid.uuid4().hex[:8]}")
+    try:
+        for path, content in files.items():
+            target = os.path.join(staging_dir, *path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(content)
+        if bundle["runtime"] == "python":
+            compile_bundle(staging_dir)
+        if build is not None:
+            build(staging_dir, bundle)
+        freeze_bundle(staging_dir)
+        try:
+            os.rename(staging_dir, final_dir)
+        except OSError:
+            # Un despliegue simultáneo del mismo contenido puede haberlo publicado antes
+            if not os.path.isdir(final_dir):
+                raise
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return bundle
+
+
+def import_bundle(bundles_dir, bundle):
+    """
+    Importa el punto de entrada como submódulo de un paquete propio de esta carga: dos
+    funciones (o dos versiones) nunca comparten módulos y los módulos del paquete se
+    importan entre sí de forma relativa (from . import utils), usando los .pyc ya generados.
+    """
+    package = f"{BUNDLE_PACKAGE_PREFIX}{uuid.uuid4().hex}"
+    spec = importlib.util.spec_from_loader(package, None, is_package=True)
+    spec.submodule_search_locations.append(bundle_path(bundles_dir, bundle["digest"]))
+    sys.modules[package] = importlib.util.module_from_spec(spec)
+    try:
+        return importlib.import_module(f"{package}.{bundle_module_name(bundle['entry'])}")
+    except BaseException:
+        forget_bundle_modules(package)
+        raise
+
+
+def forget_bundle_modules(module):
+    """Retira de sys.modules el paquete de una carga (acepta el módulo de entrada o el nombre)."""
+    package = module if isinstance(module, str) else module.__name__.split(".")[0]
+    if not package.startswith(BUNDLE_PACKAGE_PREFIX):
+        return
+    for name in [name for name in sys.modules if name == package or name.startswith(package + ".")]:
+        sys.modules.pop(name, None)
+
+
+def bundle_references(function_data):
+    """Digests de los paquetes que usan los metadatos de función dados."""
+    return {data["bundle"]["digest"] for data in function_data
+            if isinstance(data, dict) and data.get("bundle")}
+
+
+def collect_bundle_garbage(bundles_dir, references):
+    """
+    Borra los paquetes que ya no usa ninguna función (respetando el margen de gracia).
+    `references()` devuelve los digests en uso; se llama justo antes de recorrer bundles_dir.
+    """
+    if not os.path.isdir(bundles_dir):
+        return 0
+    referenced = references()
+    cutoff = time.time() - BUNDLE_GC_GRACE_SECONDS
+    removed = 0
+    for name in os.listdir(bundles_dir):
+        path = os.path.join(bundles_dir, name)
+        try:
+            if name in referenced or os.stat(path).st_mtime > cutoff:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
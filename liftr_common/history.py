@@ -0,0 +1,253 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# ========================================================
+# 🗄️ HISTORIAL DE EJECUCIONES EN SQLITE (WAL, indexado, con agregados)
+# ========================================================
+
+HISTORY_BATCH_SIZE = 256           # Máximo de operaciones por transacción
+HISTORY_FLUSH_SECONDS = 0.5        # Espera máxima para agrupar inserciones
+HISTORY_DEFAULT_LIMIT = 100
+HISTORY_MAX_LIMIT = 1000
+HISTORY_DEFAULT_BUCKET_SECONDS = 3600
+HISTORY_QUANTILES = (0.5, 0.95, 0.99)
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invocations (
+    id TEXT PRIMARY KEY,
+    function TEXT NOT NULL,
+    ts REAL NOT NULL,
+    duration_ms REAL,
+    status TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invocations_function_ts ON invocations (function, ts);
+CREATE INDEX IF NOT EXISTS idx_invocations_status_ts ON invocations (status, ts);
+CREATE INDEX IF NOT EXISTS idx_invocations_ts ON invocations (ts);
+"""
+
+
+def entry_timestamp(value):
+    """Epoch de 'time_start'/'time_end' (cadena '%Y-%m-%d %H:%M:%S.%f' o número); None si no se reconoce."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+            try:
+                return datetime.strptime(value, fmt).timestamp()
+            except ValueError:
+                pass
+    return None
+
+
+def parse_history_filters(params):
+    """
+    Filtros de consulta del historial: function, status, since, until (epoch en segundos;
+    un valor negativo es relativo a ahora, p. ej. since=-3600), limit, offset y bucket.
+    Lanza ValueError con un mensaje legible si algún valor no es válido.
+    """
+    now = time.time()
+    filters = {"function": params.get("function") or None, "status": params.get("status") or None}
+    for key in ("since", "until"):
+        value = params.get(key)
+        if value in (None, ""):
+            filters[key] = None
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' debe ser un epoch en segundos (o negativo, relativo a ahora).")
+        filters[key] = now + value if value < 0 else value
+    try:
+        filters["limit"] = min(int(params.get("limit") or HISTORY_DEFAULT_LIMIT), HISTORY_MAX_LIMIT)
+        filters["offset"] = int(params.get("offset") or 0)
+        filters["bucket"] = int(params.get("bucket") or HISTORY_DEFAULT_BUCKET_SECONDS)
+    except (TypeError, ValueError):
+        raise ValueError("'limit', 'offset' y 'bucket' deben ser enteros.")
+    if filters["limit"] < 1 or filters["offset"] < 0 or filters["bucket"] < 1:
+        raise ValueError("'limit' y 'bucket' deben ser mayores que 0 y 'offset' no puede ser negativo.")
+    return filters
+
+
+class HistoryStore(threading.Thread):
+    """
+    Historial de invocaciones en SQLite (modo WAL). El camino de invocación solo encola
+    la entrada; un único hilo escritor las inserta por lotes, en una transacción por lote.
+    Las consultas abren su propia conexión de lectura, que WAL no bloquea durante la escritura.
+    La base de datos no se crea hasta start(); `json_default` serializa las entradas.
+    """
+
+    def __init__(self, path, json_default=str):
+        super().__init__(name="faas-history", daemon=True)
+        self.path = str(path)
+        self.json_default = json_default
+        self.pending = queue.Queue()
+
+    def start(self):
+        conn = self.connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(HISTORY_SCHEMA)
+        finally:
+            conn.close()
+        super().start()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, log_key, entry):
+        self.pending.put(("insert", log_key, entry))
+
+    def forget(self, log_key):
+        self.pending.put(("delete", log_key, None))
+
+    def forget_ids(self, ids):
+        """Retira del historial las entradas ya rotadas a los archivos."""
+        if ids:
+            self.pending.put(("delete_ids", None, ids))
+
+    def close(self):
+        """Vacía la cola pendiente y detiene el escritor (al salir del proceso)."""
+        if self.is_alive():
+            self.pending.put(None)
+            self.join(timeout=10)
+
+    def row(self, log_key, entry):
+        start = entry_timestamp(entry.get("time_start"))
+        end = entry_timestamp(entry.get("time_end"))
+        duration_ms = round((end - start) * 1000, 3) if start is not None and end is not None else None
+        return (entry.get("id") or str(uuid.uuid4()), log_key, start if start is not None else time.time(),
+                duration_ms, entry.get("status"), json.dumps(entry, default=self.json_default))
+
+    def write(self, conn, ops):
+        try:
+            with conn:  # Una única transacción (y un único fsync) por lote
+                for op, log_key, entry in ops:
+                    if op == "insert":
+                        conn.execute("INSERT OR REPLACE INTO invocations VALUES (?, ?, ?, ?, ?, ?)",
+                                     self.row(log_key, entry))
+                    elif op == "delete":
+                        conn.execute("DELETE FROM invocations WHERE function = ?", (log_key,))
+                    else:
+                        conn.executemany("DELETE FROM invocations WHERE id = ?", [(i,) for i in entry])
+        except Exception as e:
+            print(f"ADVERTENCIA: no se pudo escribir el historial ({len(ops)} operaciones): {e}")
+
+    def run(self):
+        conn = self.connect()
+        stopping = False
+        while not stopping or not self.pending.empty():
+            ops = []
+            deadline = None
+            while len(ops) < HISTORY_BATCH_SIZE:
+                try:
+                    if stopping:
+                        op = self.pending.get_nowait()
+                    elif deadline is None:
+                        op = self.pending.get()
+                        deadline = time.monotonic() + HISTORY_FLUSH_SECONDS
+                    else:
+                        op = self.pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                else:
+                    ops.append(op)
+            if ops:
+                self.write(conn, ops)
+        conn.close()
+
+    def backfill(self, logs_by_key):
+        """Importa los logs existentes la primera vez que se crea la base de datos (tras start())."""
+        conn = self.connect()
+        try:
+            if conn.execute("SELECT 1 FROM invocations LIMIT 1").fetchone():
+                return
+            rows = [self.row(log_key, entry) for log_key, entries in logs_by_key.items() for entry in entries]
+            if rows:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO invocations VALUES (?, ?, ?, ?, ?, ?)", rows)
+                print(f"Historial: {len(rows)} ejecuciones importadas a {self.path}.")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def where(filters):
+        clauses, params = [], []
+        for column, op, key in (("function", "=", "function"), ("status", "=", "status"),
+                                ("ts", ">=", "since"), ("ts", "<", "until")):
+            if filters.get(key) is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(filters[key])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, filters):
+        """Entradas que cumplen los filtros, de la más reciente a la más antigua."""
+        where, params = self.where(filters)
+        conn = self.connect()
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM invocations{where}", params).fetchone()[0]
+            rows = conn.execute(f"SELECT function, entry FROM invocations{where} ORDER BY ts DESC LIMIT ? OFFSET ?",
+                                params + [filters["limit"], filters["offset"]]).fetchall()
+        finally:
+            conn.close()
+        return {"total": total, "entries": [{"function": function, **json.loads(entry)} for function, entry in rows]}
+
+    def aggregate(self, filters):
+        """
+        Por función y ventana de 'bucket' segundos: llamadas, errores, tasa de error,
+        latencia media y percentiles (rango más cercano), calculados dentro de SQLite.
+        """
+        where, params = self.where(filters)
+        percentile_columns = ", ".join(
+            f"MIN(CASE WHEN rn >= {q} * n THEN duration_ms END) AS p{int(q * 100)}" for q in HISTORY_QUANTILES
+        )
+        percentile_names = ", ".join(f"p.p{int(q * 100)}" for q in HISTORY_QUANTILES)
+        sql = f"""
+            WITH filtered AS (
+                SELECT function, CAST(ts / ? AS INTEGER) * ? AS bucket, status, duration_ms
+                FROM invocations{where}
+            ),
+            ranked AS (
+                SELECT function, bucket, duration_ms,
+                       ROW_NUMBER() OVER (PARTITION BY function, bucket ORDER BY duration_ms) AS rn,
+                       COUNT(*) OVER (PARTITION BY function, bucket) AS n
+                FROM filtered WHERE duration_ms IS NOT NULL
+            ),
+            percentiles AS (
+                SELECT function, bucket, {percentile_columns} FROM ranked GROUP BY function, bucket
+            )
+            SELECT f.function, f.bucket, COUNT(*), SUM(f.status = 'error'), ROUND(AVG(f.duration_ms), 3),
+                   {percentile_names}
+            FROM filtered f LEFT JOIN percentiles p ON p.function = f.function AND p.bucket = f.bucket
+            GROUP BY f.function, f.bucket
+            ORDER BY f.bucket, f.function
+        """
+        conn = self.connect()
+        try:
+            rows = conn.execute(sql, [filters["bucket"], filters["bucket"]] + params).fetchall()
+        finally:
+            conn.close()
+
+        buckets = []
+        for function, bucket, calls, errors, avg_ms, *quantiles in rows:
+            item = {
+                "function": function,
+                "bucket_start": bucket,
+                "bucket_end": bucket + filters["bucket"],
+                "calls": calls,
+                "errors": errors,
+                "error_rate": round(errors / calls, 4) if calls else 0.0,
+                "avg_ms": avg_ms,
+            }
+            item.update({f"p{int(q * 100)}_ms": value for q, value in zip(HISTORY_QUANTILES, quantiles)})
+            buckets.append(item)
+        return {"bucket_seconds": filters["bucket"], "buckets": buckets}
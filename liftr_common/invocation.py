@@ -0,0 +1,172 @@
+import asyncio
+import inspect
+import json
+import os
+import threading
+import time
+
+try:
+    import requests
+except ImportError:  # Solo lo necesita context.http
+    requests = None
+
+# ========================================================
+# 🧰 CONTEXTO DE FUNCIÓN (recursos compartidos entre invocaciones)
+# ========================================================
+
+CONTEXT_ENTRY_POINTS = ("main", "main_batch")  # Los que reciben `context` si lo declaran
+
+
+class FunctionResources:
+    """
+    Recursos que cada función conserva entre invocaciones (caché y sesión HTTP).
+    `publisher()` devuelve el cliente MQTT del servidor y `entry_points(nombre)` los
+    puntos de entrada que declaran `context` en la carga actual (None si no consta).
+    """
+
+    def __init__(self, functions_dir, publisher, entry_points):
+        self.functions_dir = functions_dir
+        self.publisher = publisher
+        self.entry_points = entry_points
+        self.lock = threading.Lock()
+        self.functions = {}  # nombre -> {"cache": {}, "http": requests.Session}
+
+    def context(self, func_name, invocation_id):
+        return FunctionContext(self, func_name, invocation_id)
+
+    def release(self, func_name):
+        """Cierra las conexiones y vacía la caché de la función (nueva versión o borrado)."""
+        with self.lock:
+            resources = self.functions.pop(func_name, None)
+        if resources and "http" in resources:
+            resources["http"].close()
+
+
+class FunctionContext:
+    """
+    Se pasa como argumento `context` a las funciones cuyo `main` lo declara
+    (def main(x, context=None)). La sesión HTTP, el publicador MQTT y la caché
+    se conservan entre invocaciones de la misma función: las conexiones no se
+    vuelven a abrir en cada llamada.
+    """
+
+    def __init__(self, registry, func_name, invocation_id):
+        self.function_name = func_name
+        self.invocation_id = invocation_id
+        self._registry = registry
+        with registry.lock:
+            self._resources = registry.functions.setdefault(func_name, {"cache": {}})
+
+    @property
+    def cache(self):
+        """Diccionario propio de la función que sobrevive entre invocaciones."""
+        return self._resources["cache"]
+
+    @property
+    def scratch_dir(self):
+        """Directorio de trabajo persistente de la función."""
+        path = os.path.join(self._registry.functions_dir, self.function_name, "scratch")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @property
+    def http(self):
+        """requests.Session compartida (keep-alive y pool de conexiones por host)."""
+        if requests is None:
+            raise RuntimeError("El paquete 'requests' no está instalado en el servidor.")
+        with self._registry.lock:
+            if "http" not in self._resources:
+                self._resources["http"] = requests.Session()
+            return self._resources["http"]
+
+    def publish(self, topic, payload, qos=0):
+        """Publica en el broker del servidor reutilizando su conexión."""
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+        return self._registry.publisher().publish(topic, payload, qos=qos)
+
+
+def accepts_context(func):
+    try:
+        return "context" in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def context_entry_points(module):
+    """Puntos de entrada del módulo que declaran `context`; se calcula una vez por carga."""
+    entry_points = (getattr(module, name, None) for name in CONTEXT_ENTRY_POINTS)
+    return tuple(func for func in entry_points if callable(func) and accepts_context(func))
+
+
+def context_kwargs(func, context):
+    """{'context': context} si la función declara el parámetro; si no, nada."""
+    if context is None:
+        return {}
+    declared = context._registry.entry_points(context.function_name)
+    if declared is None:
+        # Módulo no registrado por el cargador: se inspecciona en cada llamada
+        return {"context": context} if accepts_context(func) else {}
+    return {"context": context} if func in declared else {}
+
+# ========================================================
+# ⏳ FUNCIONES ASYNC (bucle asyncio compartido)
+# ========================================================
+
+# Un único bucle en un hilo propio ejecuta todas las corrutinas: las esperas de E/S
+# de miles de invocaciones no ocupan un hilo del sistema cada una.
+EVENT_LOOP = asyncio.new_event_loop()  # Cada servidor lo pone en marcha en su hilo al arrancar
+
+
+def call_timeout(data, default, maximum):
+    """Plazo de la invocación: 'timeout' del cliente (segundos), acotado por `maximum`."""
+    timeout = data.get("timeout") if isinstance(data, dict) else None
+    if timeout is None:
+        return default
+    return min(float(timeout), maximum)
+
+
+def run_on_event_loop(awaitable, timeout):
+    """Ejecuta la corrutina en el bucle compartido y espera su resultado con un plazo."""
+    async def with_deadline():
+        return await asyncio.wait_for(awaitable, timeout)
+    future = asyncio.run_coroutine_threadsafe(with_deadline(), EVENT_LOOP)
+    try:
+        return future.result()
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Timeout: La función excedió el límite de tiempo de ejecución ({timeout}s).")
+
+
+def call_function(func, *args, timeout, context=None):
+    """Llama a `main` (síncrona o `async def`); las corrutinas se resuelven en el bucle compartido."""
+    result = func(*args, **context_kwargs(func, context))
+    if inspect.isawaitable(result):
+        return run_on_event_loop(result, timeout)
+    return result
+
+
+def is_stream_function(func):
+    """`main` generador (def ... yield o async def ... yield): su resultado se entrega por partes."""
+    return inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)
+
+
+def iterate_stream(func, args, context, timeout):
+    """
+    Recorre un `main` generador elemento a elemento. Los generadores async avanzan en el
+    bucle compartido, con `timeout` como plazo total de la secuencia.
+    """
+    produced = func(*args, **context_kwargs(func, context))
+    if not inspect.isasyncgen(produced):
+        yield from produced
+        return
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                yield run_on_event_loop(produced.__anext__(), max(deadline - time.monotonic(), 0))
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                raise TimeoutError(f"Timeout: La función excedió el límite de tiempo de ejecución ({timeout}s).")
+    finally:
+        asyncio.run_coroutine_threadsafe(produced.aclose(), EVENT_LOOP)
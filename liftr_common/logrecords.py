@@ -0,0 +1,146 @@
+import os
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+from functools import lru_cache
+
+from liftr_common.blobs import externalize_entry
+
+# ========================================================
+# 📇 REGISTROS DE EJECUCIÓN COMPACTOS (logs en memoria)
+# ========================================================
+
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+LOG_TIME_LENGTH = 26  # "AAAA-MM-DD HH:MM:SS.ffffff"
+LOG_RECORD_SLOTS = {"id": "uid", "args": "args", "result": "result", "status": "status",
+                    "time_start": "started", "time_end": "ended"}
+UNSET = object()
+# Cadenas ya decodificadas de id/time_*: el panel y /logs sirven una y otra vez las entradas
+# recientes. La caché es global y acotada (en entradas; cada una aporta dos fechas) para no
+# devolver a cada entrada el peso de un dict.
+LOG_DECODE_CACHE_SIZE = int(os.getenv("FAAS_LOG_DECODE_CACHE", "8192"))
+
+
+def encode_log_uuid(value):
+    """UUID canónico -> 16 bytes; None si no lo es (se guarda tal cual en 'extra')."""
+    if not isinstance(value, str) or len(value) != 36 or value != value.lower():
+        return None
+    if value[8] != "-" or value[13] != "-" or value[18] != "-" or value[23] != "-":
+        return None
+    try:
+        return bytes.fromhex(value.replace("-", ""))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=LOG_DECODE_CACHE_SIZE)
+def decode_log_uuid(value):
+    h = value.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def encode_log_time(value):
+    """'%Y-%m-%d %H:%M:%S.%f' -> epoch float; None si el formato no es exactamente ese."""
+    if not isinstance(value, str) or len(value) != LOG_TIME_LENGTH or value[10] != " " or value[19] != ".":
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=2 * LOG_DECODE_CACHE_SIZE)
+def decode_log_time(value):
+    return datetime.fromtimestamp(value).isoformat(" ", "microseconds")
+
+
+class LogRecord(Mapping):
+    """
+    Entrada de log en memoria: slots en vez de dict, UUID binario (16 bytes) y marcas de
+    tiempo epoch. Se lee como un dict (get, [], in, **) y se convierte a la forma JSON de
+    siempre al servirse; los campos poco frecuentes van en 'extra'. Servirla cuesta más
+    que copiar un dict (id y fechas se reconstruyen); la caché de decodificación lo acota
+    para las entradas recientes (ver http_server/benchmark_log_records.py).
+    """
+    __slots__ = ("uid", "args", "result", "status", "started", "ended", "extra")
+
+    def __init__(self, entry):
+        self.uid = self.args = self.result = self.status = self.started = self.ended = UNSET
+        extra = None
+        for key, value in entry.items():
+            slot = LOG_RECORD_SLOTS.get(key)
+            if slot in ("uid", "started", "ended"):
+                encoded = encode_log_uuid(value) if slot == "uid" else encode_log_time(value)
+                if encoded is None:
+                    slot = None  # Formato no reconocido: se conserva literal
+            elif slot == "status" and isinstance(value, str):
+                encoded = sys.intern(value)
+            else:
+                encoded = value
+            if slot is None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+            else:
+                setattr(self, slot, encoded)
+        self.extra = extra
+
+    def __getitem__(self, key):
+        slot = LOG_RECORD_SLOTS.get(key)
+        value = getattr(self, slot) if slot else UNSET
+        if value is UNSET:
+            if self.extra and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key)
+        if slot == "uid":
+            return decode_log_uuid(value)
+        if slot in ("started", "ended"):
+            return decode_log_time(value)
+        return value
+
+    def __contains__(self, key):
+        slot = LOG_RECORD_SLOTS.get(key)
+        if slot and getattr(self, slot) is not UNSET:
+            return True
+        return bool(self.extra) and key in self.extra
+
+    def __iter__(self):
+        for key, slot in LOG_RECORD_SLOTS.items():
+            if getattr(self, slot) is not UNSET:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"LogRecord({self.to_dict()!r})"
+
+    def to_dict(self):
+        # Una sola pasada por los slots (es el camino de jsonify), sin pasar por __getitem__
+        data = {}
+        for key, slot in LOG_RECORD_SLOTS.items():
+            value = getattr(self, slot)
+            if value is UNSET:
+                continue
+            if slot == "uid":
+                value = decode_log_uuid(value)
+            elif slot == "started" or slot == "ended":
+                value = decode_log_time(value)
+            data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def compact_entry(blobs_dir, entry):
+    """Lo que se guarda en 'logs': args/resultados grandes como blob (en blobs_dir) y el resto compacto."""
+    return LogRecord(externalize_entry(blobs_dir, entry))
+
+
+def log_json_default(value):
+    """'default' de json.dumps para estructuras que contienen entradas de log."""
+    if isinstance(value, LogRecord):
+        return value.to_dict()
+    return str(value)
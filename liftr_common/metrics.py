@@ -0,0 +1,164 @@
+import bisect
+import threading
+
+# ========================================================
+# 📈 MÉTRICAS POR FUNCIÓN (contadores e histogramas de buckets fijos)
+# ========================================================
+# Cada servidor es un proceso propio: el registro por función es global del módulo.
+
+# Límites superiores (ms) de los buckets; el último bucket implícito es +Inf
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class FunctionMetrics:
+    """
+    Contadores e histogramas de una función. Registrar una muestra solo incrementa
+    posiciones de listas preasignadas (búsqueda binaria sobre 14 límites): coste
+    constante y sin crear estructuras nuevas en el camino de invocación.
+    """
+    __slots__ = ("lock", "calls", "errors", "cache_hits",
+                 "latency_counts", "latency_sum", "queue_counts", "queue_sum", "queue_samples")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.queue_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.queue_sum = 0.0
+        self.queue_samples = 0
+
+    def observe(self, latency_ms, error=False, queue_ms=None, cache_hit=False):
+        with self.lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            if cache_hit:
+                self.cache_hits += 1
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            self.latency_sum += latency_ms
+            if queue_ms is not None:
+                self.queue_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, queue_ms)] += 1
+                self.queue_sum += queue_ms
+                self.queue_samples += 1
+
+    def count_cache_hit(self):
+        """Respuesta servida sin ejecutar la función: no cuenta como llamada ni entra en los histogramas."""
+        with self.lock:
+            self.cache_hits += 1
+
+
+FUNCTION_METRICS = {}  # nombre -> FunctionMetrics
+METRICS_LOCK = threading.Lock()
+
+
+def record_metrics(func_name, latency_ms, error=False, queue_ms=None, cache_hit=False):
+    metrics = FUNCTION_METRICS.get(func_name)
+    if metrics is None:
+        with METRICS_LOCK:
+            metrics = FUNCTION_METRICS.setdefault(func_name, FunctionMetrics())
+    metrics.observe(latency_ms, error, queue_ms, cache_hit)
+
+
+def record_cache_hit(func_name):
+    metrics = FUNCTION_METRICS.get(func_name)
+    if metrics is None:
+        with METRICS_LOCK:
+            metrics = FUNCTION_METRICS.setdefault(func_name, FunctionMetrics())
+    metrics.count_cache_hit()
+
+
+def estimate_quantile(counts, q):
+    """Cuantil aproximado a partir del histograma (interpolación lineal dentro del bucket)."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            if i == len(LATENCY_BUCKETS_MS):
+                return float(lower)  # bucket +Inf: se informa su límite inferior
+            return round(lower + (LATENCY_BUCKETS_MS[i] - lower) * (rank - seen) / count, 3)
+        seen += count
+    return None
+
+
+def metrics_snapshot():
+    """Copia coherente de las métricas (para /metrics y el comando MQTT)."""
+    snapshot = {}
+    for func_name, metrics in list(FUNCTION_METRICS.items()):
+        with metrics.lock:
+            snapshot[func_name] = {
+                "calls": metrics.calls, "errors": metrics.errors, "cache_hits": metrics.cache_hits,
+                "latency_counts": list(metrics.latency_counts), "latency_sum": metrics.latency_sum,
+                "queue_counts": list(metrics.queue_counts), "queue_sum": metrics.queue_sum,
+                "queue_samples": metrics.queue_samples,
+            }
+    return snapshot
+
+
+def metrics_summary():
+    """Resumen legible: contadores y p50/p95/p99 de latencia y de espera en cola."""
+    return {
+        func_name: {
+            "calls": m["calls"], "errors": m["errors"], "cache_hits": m["cache_hits"],
+            "latency_ms": {f"p{int(q * 100)}": estimate_quantile(m["latency_counts"], q) for q in QUANTILES},
+            "queue_wait_ms": {f"p{int(q * 100)}": estimate_quantile(m["queue_counts"], q) for q in QUANTILES},
+        }
+        for func_name, m in metrics_snapshot().items()
+    }
+
+
+def render_prometheus(rejections):
+    """
+    Métricas en formato de exposición de texto de Prometheus, con los rechazos del
+    control de admisión ({(función, motivo): rechazos}).
+    """
+    snapshot = metrics_snapshot()
+    lines = []
+
+    def label(func_name):
+        return func_name.replace("\\", "\\\\").replace('"', '\\"')
+
+    for metric, key, help_text in (
+        ("faas_invocations_total", "calls", "Invocaciones atendidas."),
+        ("faas_invocation_errors_total", "errors", "Invocaciones terminadas con error."),
+        ("faas_cache_hits_total", "cache_hits", "Invocaciones resueltas sin ejecutar la función."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for func_name, m in snapshot.items():
+            lines.append(f'{metric}{{function="{label(func_name)}"}} {m[key]}')
+
+    for metric, counts_key, sum_key, count_key, help_text in (
+        ("faas_invocation_duration_ms", "latency_counts", "latency_sum", "calls", "Latencia de invocación (ms)."),
+        ("faas_queue_wait_ms", "queue_counts", "queue_sum", "queue_samples", "Espera en cola antes de ejecutar (ms)."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for func_name, m in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS + ("+Inf",), m[counts_key]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{function="{label(func_name)}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{function="{label(func_name)}"}} {round(m[sum_key], 3)}')
+            lines.append(f'{metric}_count{{function="{label(func_name)}"}} {m[count_key]}')
+
+    lines.append("# HELP faas_invocation_duration_quantile_ms Cuantiles estimados a partir del histograma (ms).")
+    lines.append("# TYPE faas_invocation_duration_quantile_ms gauge")
+    for func_name, m in snapshot.items():
+        for q in QUANTILES:
+            value = estimate_quantile(m["latency_counts"], q)
+            if value is not None:
+                lines.append(f'faas_invocation_duration_quantile_ms{{function="{label(func_name)}",quantile="{q}"}} {value}')
+
+    lines.append("# HELP faas_admission_rejections_total Invocaciones rechazadas por el control de admisión.")
+    lines.append("# TYPE faas_admission_rejections_total counter")
+    for (func_name, reason), count in sorted(rejections.items()):
+        lines.append(f'faas_admission_rejections_total{{function="{label(func_name)}",reason="{reason}"}} {count}')
+    return "\n".join(lines) + "\n"
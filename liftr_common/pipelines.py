@@ -0,0 +1,63 @@
+# ========================================================
+# 🔗 PIPELINES (validación y orden de las etapas del DAG)
+# ========================================================
+
+
+def unique_stage_name(function, taken):
+    """Nombre por defecto de una etapa: el de su función, con sufijo #2, #3... si se repite."""
+    name, n = function, 1
+    while name in taken:
+        n += 1
+        name = f"{function}#{n}"
+    return name
+
+
+def normalize_pipeline(stages):
+    """
+    Valida la definición de un pipeline y devuelve sus etapas en orden topológico.
+
+    Cada etapa es {"name", "function", "inputs"}. Una lista de nombres de función
+    (["decode", "filter", "aggregate"]) se interpreta como una cadena lineal.
+    Las etapas sin 'name' toman el de su función ("f", "f#2"... si se repite).
+    Las etapas sin 'inputs' reciben los args de la invocación; el resto recibe
+    como argumentos los resultados de sus entradas, en el orden indicado.
+    """
+    if not isinstance(stages, list) or not stages:
+        raise ValueError("'stages' debe ser una lista no vacía.")
+
+    by_name = {}
+    previous = None
+    for stage in stages:
+        if isinstance(stage, str):
+            stage = {"function": stage, "inputs": [previous] if previous else []}
+        if not isinstance(stage, dict) or not stage.get("function"):
+            raise ValueError("Cada etapa debe indicar 'function'.")
+        name = stage["name"] if "name" in stage else unique_stage_name(stage["function"], by_name)
+        inputs = stage.get("inputs", [])
+        if name in by_name:
+            raise ValueError(f"Etapa duplicada: {name}.")
+        if not isinstance(inputs, list):
+            raise ValueError(f"'inputs' de la etapa {name} debe ser una lista.")
+        by_name[name] = {"name": name, "function": stage["function"], "inputs": list(inputs)}
+        previous = name
+
+    for stage in by_name.values():
+        unknown = [i for i in stage["inputs"] if i not in by_name]
+        if unknown:
+            raise ValueError(f"La etapa {stage['name']} depende de etapas inexistentes: {', '.join(unknown)}.")
+
+    # Orden topológico (Kahn); si quedan etapas sin ordenar, hay un ciclo
+    pending = {name: len(set(stage["inputs"])) for name, stage in by_name.items()}
+    ordered = []
+    ready = [name for name, count in pending.items() if count == 0]
+    while ready:
+        name = ready.pop(0)
+        ordered.append(by_name[name])
+        for other in by_name.values():
+            if name in other["inputs"]:
+                pending[other["name"]] -= 1
+                if pending[other["name"]] == 0:
+                    ready.append(other["name"])
+    if len(ordered) != len(by_name):
+        raise ValueError("El pipeline contiene un ciclo.")
+    return ordered
@@ -0,0 +1,147 @@
+import gzip
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from liftr_common.history import entry_timestamp
+
+# ========================================================
+# ♻️ RETENCIÓN DE LOGS Y ARCHIVOS COMPRIMIDOS POR DÍA
+# ========================================================
+
+RETENTION_KEYS = ("max_entries", "max_age", "max_bytes")
+
+
+def normalize_retention(values):
+    """Política por función a partir de {max_entries, max_age, max_bytes}; None si no se indicó ninguna."""
+    policy = {}
+    for key in RETENTION_KEYS:
+        value = (values or {}).get(key)
+        if value in (None, ""):
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' de la retención debe ser un entero.")
+        if value < 0:
+            raise ValueError(f"'{key}' de la retención no puede ser negativo.")
+        policy[key] = value
+    return policy or None
+
+
+def expired_count(entries, policy, now, json_default=str):
+    """
+    Cuántas entradas del principio de la lista (las más antiguas) exceden la política
+    ({max_entries, max_age, max_bytes}, 0 = sin límite); `json_default` mide su tamaño en JSON.
+    """
+    expired = 0
+    if policy["max_entries"] and len(entries) > policy["max_entries"]:
+        expired = len(entries) - policy["max_entries"]
+    if policy["max_age"]:
+        cutoff = now - policy["max_age"]
+        while expired < len(entries):
+            ts = entry_timestamp(entries[expired].get("time_start"))
+            if ts is not None and ts >= cutoff:
+                break
+            expired += 1
+    if policy["max_bytes"]:
+        total = 0
+        for i in range(len(entries) - 1, expired - 1, -1):
+            total += len(json.dumps(entries[i], default=json_default))
+            if total > policy["max_bytes"]:
+                expired = i + 1
+                break
+    return expired
+
+
+def archive_key_dir(archive_dir, log_key):
+    return os.path.join(archive_dir, re.sub(r"[^A-Za-z0-9_.:-]", "_", log_key))
+
+
+def archive_entries(archive_dir, log_key, entries):
+    """
+    Añade las entradas a segmentos gzip por día (AAAA-MM-DD.jsonl.gz, un JSON por línea).
+    Los segmentos son autónomos: las entradas deben llegar ya sin referencias a blobs.
+    """
+    by_day = {}
+    for entry in entries:
+        ts = entry_timestamp(entry.get("time_start")) or time.time()
+        by_day.setdefault(datetime.fromtimestamp(ts).strftime("%Y-%m-%d"), []).append(entry)
+    key_dir = archive_key_dir(archive_dir, log_key)
+    os.makedirs(key_dir, exist_ok=True)
+    for day, day_entries in by_day.items():
+        # Cada escritura añade un miembro gzip nuevo; gzip.open lee el segmento completo
+        with gzip.open(os.path.join(key_dir, f"{day}.jsonl.gz"), "at", encoding="utf-8") as f:
+            for entry in day_entries:
+                f.write(json.dumps({"function": log_key, **entry}, default=str) + "\n")
+
+
+def list_archive_segments(archive_dir):
+    segments = []
+    if not os.path.isdir(archive_dir):
+        return segments
+    for key_name in sorted(os.listdir(archive_dir)):
+        key_dir = os.path.join(archive_dir, key_name)
+        for name in sorted(os.listdir(key_dir)):
+            if name.endswith(".jsonl.gz"):
+                path = os.path.join(key_dir, name)
+                segments.append({"function": key_name, "day": name[:-len(".jsonl.gz")],
+                                 "bytes": os.path.getsize(path), "path": path})
+    return segments
+
+
+def enforce_archive_limit(archive_dir, max_bytes):
+    """Borra los segmentos más antiguos (de cualquier función) mientras se supere `max_bytes` (0 = sin límite)."""
+    segments = sorted(list_archive_segments(archive_dir), key=lambda s: s["day"])
+    total = sum(segment["bytes"] for segment in segments)
+    removed = 0
+    while segments and max_bytes and total > max_bytes:
+        segment = segments.pop(0)
+        os.remove(segment["path"])
+        total -= segment["bytes"]
+        removed += 1
+    return removed
+
+
+def query_archives(archive_dir, filters):
+    """
+    Busca en los segmentos archivados con los mismos filtros que el historial (más reciente
+    primero). Los días se recorren del más reciente al más antiguo y la búsqueda se detiene en
+    cuanto la página está completa, así que "total" es una cota inferior si "total_exact" es False.
+    """
+    since_day = datetime.fromtimestamp(filters["since"]).strftime("%Y-%m-%d") if filters["since"] else None
+    until_day = datetime.fromtimestamp(filters["until"]).strftime("%Y-%m-%d") if filters["until"] else None
+    key_name = os.path.basename(archive_key_dir(archive_dir, filters["function"])) if filters["function"] else None
+    by_day = {}
+    for segment in list_archive_segments(archive_dir):
+        if key_name and segment["function"] != key_name:
+            continue
+        if (since_day and segment["day"] < since_day) or (until_day and segment["day"] > until_day):
+            continue
+        by_day.setdefault(segment["day"], []).append(segment)
+    wanted = filters["offset"] + filters["limit"]
+    matches = []
+    days = sorted(by_day, reverse=True)
+    for index, day in enumerate(days):
+        # Un día se lee completo (sus segmentos se mezclan por fecha), pero no los anteriores
+        day_matches = []
+        for segment in by_day[day]:
+            with gzip.open(segment["path"], "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    ts = entry_timestamp(entry.get("time_start"))
+                    if filters["status"] and entry.get("status") != filters["status"]:
+                        continue
+                    if ts is not None and ((filters["since"] and ts < filters["since"]) or
+                                           (filters["until"] and ts >= filters["until"])):
+                        continue
+                    day_matches.append((ts or 0, entry))
+        day_matches.sort(key=lambda match: match[0], reverse=True)
+        matches.extend(day_matches)
+        if len(matches) >= wanted and index < len(days) - 1:
+            page = matches[filters["offset"]:wanted]
+            return {"total": len(matches), "total_exact": False, "entries": [entry for _, entry in page]}
+    page = matches[filters["offset"]:wanted]
+    return {"total": len(matches), "total_exact": True, "entries": [entry for _, entry in page]}
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
+
+# ========================================================
+# 📉 MUESTREO DEL SISTEMA EN SEGUNDO PLANO (ring buffer de series temporales)
+# ========================================================
+
+class SystemSampler(threading.Thread):
+    """
+    Toma cada `interval` segundos una muestra de CPU, RSS, memoria, carga y del
+    estado de cada función (`function_stats()`, propio de cada servidor), y la guarda
+    en un buffer circular de tamaño fijo. Los endpoints de estado responden con la
+    última muestra sin llamar a psutil (ni dormir) dentro de la petición.
+    """
+
+    def __init__(self, interval, size, function_stats):
+        super().__init__(name="faas-sampler", daemon=True)
+        self.interval = interval
+        self.function_stats = function_stats
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.process = psutil.Process(os.getpid())
+        # cpu_percent(None) mide desde la llamada anterior: la primera solo fija la referencia
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
+        self.record()
+
+    def sample(self):
+        system_mem = psutil.virtual_memory()
+        return {
+            "ts": round(time.time(), 3),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "process_cpu_percent": self.process.cpu_percent(interval=None),
+            "process_rss_mb": round(self.process.memory_info().rss / (1024 * 1024), 2),
+            "ram_percent": system_mem.percent,
+            "ram_total_gb": round(system_mem.total / (1024 ** 3), 2),
+            "ram_available_gb": round(system_mem.available / (1024 ** 3), 2),
+            "load_avg": [round(load, 2) for load in os.getloadavg()] if hasattr(os, "getloadavg") else None,
+            "functions": self.function_stats(),
+        }
+
+    def record(self):
+        try:
+            sample = self.sample()
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al muestrear el sistema: {e}")
+            return
+        with self.lock:
+            self.samples.append(sample)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.record()
+
+    def latest(self):
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    def history(self, seconds):
+        """Muestras de los últimos `seconds` segundos, de la más antigua a la más reciente."""
+        since = time.time() - seconds
+        with self.lock:
+            return [sample for sample in self.samples if sample["ts"] >= since]
+
+
+def parse_history_window(value):
+    """Ventana de historial pedida (segundos); None si no se pidió. Lanza ValueError si no es válida."""
+    if value in (None, ""):
+        return None
+    seconds = float(value)
+    if seconds <= 0:
+        raise ValueError("'history' debe ser un número de segundos mayor que 0.")
+    return seconds
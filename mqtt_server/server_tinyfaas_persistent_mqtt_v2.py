@@ -8,10 +8,32 @@ from functools import wraps
 import shutil
 import time
 from datetime import datetime
-import psutil
 import threading
 import paho.mqtt.client as mqtt
 import base64 
+from collections import OrderedDict
+import asyncio
+import inspect
+import queue
+import atexit
+
+# Código común de los servidores (liftr_common/, en la raíz del repositorio)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from liftr_common.admission import AdmissionControl, Overloaded, normalize_admission
+from liftr_common.batching import MicroBatcher
+from liftr_common.blobs import blob_references, collect_blob_garbage, inline_blobs, read_blob
+from liftr_common.bundles import (bundle_path, bundle_references, collect_bundle_garbage, deploy_bundle,
+                                  forget_bundle_modules, import_bundle)
+from liftr_common.history import HistoryStore, parse_history_filters
+from liftr_common.invocation import (EVENT_LOOP, FunctionResources, call_function, call_timeout,
+                                     context_entry_points, context_kwargs, is_stream_function, iterate_stream)
+from liftr_common.logrecords import LogRecord, compact_entry, log_json_default
+from liftr_common.metrics import (FUNCTION_METRICS, metrics_summary, record_cache_hit, record_metrics,
+                                  render_prometheus)
+from liftr_common.pipelines import normalize_pipeline
+from liftr_common.sampler import SystemSampler, parse_history_window
+from liftr_common.retention import (archive_entries, enforce_archive_limit, expired_count, list_archive_segments,
+                                    normalize_retention, query_archives)
 
 # ========================================================
 # ⚙️ CONFIGURACIÓN DEL SERVIDOR
@@ -25,6 +47,10 @@ MQTT_PASSWORD = ""
 MQTT_BASE_TOPIC = "faas"      # Tópico base para todas las operaciones (admin, invoke)
 MQTT_RESPONSE_TOPIC = "faas/response" # Tópico para devolver resultados
 
+# Deduplicación de reentregas QoS1 (por tópico + request_id)
+DEDUPE_TTL_SECONDS = 600
+DEDUPE_MAX_ENTRIES = 10000
+
 # Directorios y Archivos de Persistencia
 FUNCTIONS_DIR = "functions"
 DATA_DIR = "data"
@@ -33,10 +59,24 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 FUNCTIONS_FILE = os.path.join(DATA_DIR, "functions.json")
 LOGS_FILE = os.path.join(DATA_DIR, "logs.json")
+PIPELINES_FILE = os.path.join(DATA_DIR, "pipelines.json")
 
 # Almacenamiento en Memoria (Global)
 functions = {}
 logs = {}
+pipelines = {}  # nombre -> {"name", "stages", "created_at"}
+batchers = {}   # nombre -> MicroBatcher (solo funciones con micro-batching activado)
+loaded_modules = {}  # nombre -> {"module", "lock", "initialized", "context_funcs"} (una carga por versión subida)
+MODULES_LOCK = threading.Lock()
+
+DEFAULT_BATCH_MAX_SIZE = 32
+
+# Plazo por invocación de las funciones 'async def main' (el cliente puede pedir uno menor)
+ASYNC_DEFAULT_TIMEOUT = 30
+ASYNC_MAX_TIMEOUT = 300
+
+# Cliente del servidor, reutilizado por context.publish() (se asigna al crear el servidor)
+mqtt_publisher = None
 
 # ========================================================
 # 💾 FUNCIONES DE PERSISTENCIA Y ENTORNO
@@ -49,25 +89,107 @@ def save_state():
         with open(FUNCTIONS_FILE, "w") as f:
             json.dump(functions, f, indent=4)
         with open(LOGS_FILE, "w") as f:
-            json.dump(logs, f, indent=4)
+            json.dump(logs, f, indent=4, default=log_json_default)
+        with open(PIPELINES_FILE, "w") as f:
+            json.dump(pipelines, f, indent=4)
     except Exception as e:
         print(f"ERROR: No se pudo guardar el estado de TinyFaaS: {e}")
 
 def load_state():
     """Carga el estado de TinyFaaS desde 'data/'."""
-    global functions, logs
+    global functions, logs, pipelines
     try:
         if os.path.exists(FUNCTIONS_FILE):
             with open(FUNCTIONS_FILE, "r") as f:
                 functions = json.load(f)
         if os.path.exists(LOGS_FILE):
             with open(LOGS_FILE, "r") as f:
-                logs = json.load(f)
+                logs = {log_key: [LogRecord(entry) for entry in entries]
+                        for log_key, entries in json.load(f).items()}
+        if os.path.exists(PIPELINES_FILE):
+            with open(PIPELINES_FILE, "r") as f:
+                pipelines = json.load(f)
+        for func_name in functions:
+            configure_batcher(func_name)
         print("Estado de TinyFaaS cargado exitosamente.")
     except Exception as e:
         print(f"ADVERTENCIA: No se pudo cargar el estado. Inicializando vacío: {e}")
         functions = {}
         logs = {}
+        pipelines = {}
+
+    # Primera ejecución con SQLite: se importa el historial existente de logs.json
+    HISTORY.backfill(logs)
+    # Lo que exceda la retención se archiva ya, para que el estado siguiente sea acotado
+    apply_retention()
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+
+    # Pre-calentamiento: init() de las funciones marcadas con 'prewarm' antes de recibir mensajes
+    for func_name, func_info in functions.items():
+        if func_info.get("prewarm"):
+            try:
+                init_ms = ensure_initialized(func_name)
+                print(f"Función '{func_name}' precalentada (init: {init_ms} ms).")
+            except Exception as e:
+                print(f"ADVERTENCIA: init() de '{func_name}' falló al precalentar: {e}")
+
+# 🔄 CICLO DE VIDA: el módulo se carga una vez por versión; init() y shutdown() opcionales
+def get_function_module(func_name):
+    """Devuelve el estado del módulo cargado de la función, importándolo la primera vez."""
+    with MODULES_LOCK:
+        state = loaded_modules.get(func_name)
+        if state is None:
+            bundle = functions[func_name].get("bundle")
+            if bundle:
+                # Paquete desplegado: se importa desde su directorio inmutable, con los .pyc ya generados
+                module = import_bundle(BUNDLES_DIR, bundle)
+            else:
+                spec = importlib.util.spec_from_file_location("func", functions[func_name]["path"])
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            state = loaded_modules[func_name] = {"module": module, "lock": threading.Lock(), "initialized": False,
+                                                 "context_funcs": context_entry_points(module)}
+        return state
+
+def ensure_initialized(func_name):
+    """
+    Ejecuta el `init()` opcional si aún no se ha hecho para esta carga del módulo.
+    Devuelve los ms empleados si se ejecutó ahora (None si ya estaba inicializado),
+    de modo que el coste de init se informa aparte de la latencia de la invocación.
+    """
+    state = get_function_module(func_name)
+    if state["initialized"]:
+        return None
+    with state["lock"]:
+        if state["initialized"]:
+            return None
+        init_ms = None
+        if callable(getattr(state["module"], 'init', None)):
+            t_init = time.perf_counter()
+            call_function(state["module"].init, timeout=ASYNC_DEFAULT_TIMEOUT)
+            init_ms = round((time.perf_counter() - t_init) * 1000, 3)
+            functions[func_name]["init_ms"] = init_ms
+        state["initialized"] = True
+        return init_ms
+
+def shutdown_function(func_name):
+    """Descarta el módulo cargado, llamando a su `shutdown()` si llegó a inicializarse."""
+    with MODULES_LOCK:
+        state = loaded_modules.pop(func_name, None)
+    if state:
+        forget_bundle_modules(state["module"])
+    if not state or not state["initialized"] or not callable(getattr(state["module"], 'shutdown', None)):
+        return
+    try:
+        call_function(state["module"].shutdown, timeout=ASYNC_DEFAULT_TIMEOUT)
+    except Exception as e:
+        print(f"ADVERTENCIA: shutdown() de '{func_name}' falló: {e}")
+
+@atexit.register
+def shutdown_all_functions():
+    for func_name in list(loaded_modules):
+        shutdown_function(func_name)
 
 def create_venv(func_name, requirements):
     """Crea un entorno virtual dedicado para una función."""
@@ -86,6 +208,171 @@ def create_venv(func_name, requirements):
 
     return venv_path
 
+# ========================================================
+# 📦 PAQUETES DE FUNCIÓN (zip/tar con manifiesto, bytecode precompilado)
+# ========================================================
+
+BUNDLES_DIR = os.path.join(DATA_DIR, "bundles")
+BUNDLE_RUNTIMES = {"python": ".py"}  # Las funciones se ejecutan en el propio proceso
+# Lectura, validación, despliegue e importación de paquetes en liftr_common.bundles
+
+
+def referenced_bundles():
+    """Digests de los paquetes que usa alguna función registrada."""
+    return bundle_references(list(functions.values()))
+
+# ========================================================
+# 🧰 CONTEXTO DE FUNCIÓN (recursos compartidos entre invocaciones)
+# ========================================================
+
+# FunctionContext y los recursos por función están en liftr_common.invocation
+
+def context_functions(func_name):
+    """Puntos de entrada que declaran `context` en la carga actual (None si el módulo no está cargado)."""
+    return loaded_modules.get(func_name, {}).get("context_funcs")
+
+def get_mqtt_publisher():
+    """Conexión del propio servidor al broker."""
+    if mqtt_publisher is None:
+        raise RuntimeError("El servidor MQTT no está en marcha.")
+    return mqtt_publisher
+
+
+FUNCTION_RESOURCES = FunctionResources(FUNCTIONS_DIR, get_mqtt_publisher, context_functions)
+
+# ========================================================
+# ⏳ FUNCIONES ASYNC (bucle asyncio compartido)
+# ========================================================
+
+# El bucle compartido, call_function e iterate_stream están en liftr_common.invocation
+
+
+class StreamSummary:
+    """Recuento de un `main` generador async cuyos elementos se publican por partes."""
+    __slots__ = ("items", "first_item_ms")
+
+    def __init__(self):
+        self.items = 0
+        self.first_item_ms = None
+
+    def as_dict(self):
+        return {"items": self.items, "first_item_ms": self.first_item_ms}
+
+
+def consume_async_stream(agen, on_item, summary):
+    """Corrutina que publica cada elemento del generador async según llega (sin ocupar hilos)."""
+    async def consume():
+        t_call = time.perf_counter()
+        try:
+            async for item in agen:
+                if summary.first_item_ms is None:
+                    summary.first_item_ms = round((time.perf_counter() - t_call) * 1000, 3)
+                on_item(summary.items, item)
+                summary.items += 1
+        finally:
+            await agen.aclose()
+    return consume()
+
+
+# Las invocaciones async de MQTT no bloquean el hilo de mensajes: al terminar la
+# corrutina, un único hilo registra el log y publica la respuesta.
+ASYNC_COMPLETIONS = queue.Queue()
+
+
+def submit_async_invocation(func_name, invocation_id, coroutine, args, start_time, timeout, on_done, stream=None):
+    async def with_deadline():
+        return await asyncio.wait_for(coroutine, timeout)
+    t_call = time.perf_counter()
+    future = asyncio.run_coroutine_threadsafe(with_deadline(), EVENT_LOOP)
+    future.add_done_callback(
+        lambda f: ASYNC_COMPLETIONS.put((func_name, invocation_id, f, args, start_time, timeout, on_done,
+                                         (time.perf_counter() - t_call) * 1000, stream))
+    )
+
+
+def with_init_ms(on_done, init_ms):
+    """Añade a la entrada el tiempo de init() que precedió a la invocación."""
+    def deliver(entry):
+        entry["init_ms"] = init_ms
+        on_done(entry)
+    return deliver
+
+
+def async_completion_worker():
+    while True:
+        func_name, invocation_id, future, args, start_time, timeout, on_done, latency_ms, stream = ASYNC_COMPLETIONS.get()
+        end_time = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+        entry = {"id": invocation_id, "args": args, "time_start": start_time, "time_end": end_time}
+        try:
+            result = future.result()
+            entry.update({"result": result, "status": "success"} if stream is None else {"status": "success"})
+        except asyncio.TimeoutError:
+            entry.update({"error": f"Timeout: La función excedió el límite de tiempo de ejecución ({timeout}s).",
+                          "status": "error"})
+        except Exception as e:
+            entry.update({"error": str(e), "status": "error"})
+        record_metrics(func_name, latency_ms, error=entry["status"] == "error")
+        # Generador async: sus elementos ya se publicaron; el log guarda solo el recuento
+        if stream is not None:
+            entry["stream"] = stream.as_dict()
+
+        log_entry = compact_entry(BLOBS_DIR, entry)
+        logs.setdefault(func_name, []).append(log_entry)
+        save_state()
+        HISTORY.record(func_name, log_entry)
+        try:
+            on_done({**entry, "done": True} if stream is not None else entry)
+        except Exception as e:
+            print(f"ERROR: No se pudo entregar el resultado async de {func_name}: {e}")
+
+
+# ========================================================
+# 📦 MICRO-BATCHING (opcional por función)
+# ========================================================
+
+# run_batch y MicroBatcher están en liftr_common.batching; aquí solo lo propio de este servidor
+
+def batch_module(func_name):
+    """Módulo de la función listo para un lote (init() ya ejecutado); si no, lanza el motivo."""
+    ensure_initialized(func_name)
+    return get_function_module(func_name)["module"]
+
+
+def record_batch(func_name, entries):
+    """Registra las entradas de un lote con un único guardado de estado."""
+    log_entries = [compact_entry(BLOBS_DIR, entry) for entry in entries]
+    logs.setdefault(func_name, []).extend(log_entries)
+    save_state()
+    for log_entry in log_entries:
+        HISTORY.record(func_name, log_entry)
+
+
+def new_batcher(func_name, window_ms, max_size):
+    return MicroBatcher(func_name, window_ms, max_size, batch_module, record_batch, FUNCTION_RESOURCES,
+                        ASYNC_DEFAULT_TIMEOUT)
+
+
+def parse_batch_payload(data):
+    """Lee 'batch_window_ms' / 'batch_max_size' del payload; sin ventana, queda desactivado."""
+    window_ms = data.get("batch_window_ms")
+    if not window_ms:
+        return None
+    batch = {"window_ms": int(window_ms), "max_size": int(data.get("batch_max_size") or DEFAULT_BATCH_MAX_SIZE)}
+    if batch["window_ms"] <= 0 or batch["max_size"] <= 0:
+        raise ValueError("batch_window_ms y batch_max_size deben ser positivos.")
+    return batch
+
+
+def configure_batcher(func_name):
+    """(Re)crea el batcher de la función según sus metadatos, deteniendo el anterior."""
+    old = batchers.pop(func_name, None)
+    if old:
+        old.stop()
+    batch = functions.get(func_name, {}).get("batch")
+    if batch:
+        batchers[func_name] = new_batcher(func_name, batch["window_ms"], batch["max_size"])
+        batchers[func_name].start()
+
 # ========================================================
 # ⚡ FUNCIONES INTERNAS CENTRALIZADAS (Core)
 # ========================================================
@@ -93,17 +380,26 @@ def create_venv(func_name, requirements):
 #  internal_get_logs, internal_delete_function y core_execute_function se 
 #  mantienen iguales a la versión anterior, ya que son independientes de Flask.)
 
-def internal_upload_function(func_name, code_data, req_data=None):
-    # Simplemente usa bytes, ya que la subida es por Base64 en MQTT
+def internal_upload_function(func_name, code_data, req_data=None, batch=None, prewarm=False, retention=None,
+                             admission=None, bundle_data=None):
+    # Simplemente usa bytes, ya que la subida es por Base64 en MQTT.
+    # Con bundle_data (zip/tar con manifest.json) el código se despliega como paquete.
+    bundle = deploy_bundle(BUNDLES_DIR, bundle_data, BUNDLE_RUNTIMES) if bundle_data else None
+
     func_path = os.path.join(FUNCTIONS_DIR, func_name)
     os.makedirs(func_path, exist_ok=True)
 
-    code_path = os.path.join(func_path, "func.py")
     req_path = None
+    if bundle:
+        code_path = os.path.join(bundle_path(BUNDLES_DIR, bundle["digest"]), bundle["entry"])
+        if not req_data and bundle["dependencies"]:
+            req_data = ("\n".join(bundle["dependencies"]) + "\n").encode("utf-8")
+    else:
+        code_path = os.path.join(func_path, "func.py")
 
-    # Escribir el archivo de código (viene como bytes decodificados de MQTT)
-    with open(code_path, "wb") as f:
-        f.write(code_data)
+        # Escribir el archivo de código (viene como bytes decodificados de MQTT)
+        with open(code_path, "wb") as f:
+            f.write(code_data)
     
     # Escribir archivo de requerimientos
     if req_data:
@@ -113,85 +409,482 @@ def internal_upload_function(func_name, code_data, req_data=None):
 
     create_venv(func_name, req_path)
 
-    functions[func_name] = {"path": code_path, "venv": os.path.join(func_path, "venv")}
+    functions[func_name] = {"path": code_path, "venv": os.path.join(func_path, "venv"),
+                            "batch": batch, "prewarm": prewarm, "retention": retention,
+                            "admission": admission, "bundle": bundle}
+    shutdown_function(func_name)
+    configure_batcher(func_name)
+    FUNCTION_RESOURCES.release(func_name)
+    response = {"status": "ok", "function": func_name}
+    if bundle:
+        response["bundle"] = bundle
+    if prewarm:
+        try:
+            response["init_ms"] = ensure_initialized(func_name)
+        except Exception as e:
+            # Como en el servidor HTTP: si init() falla, la función no queda registrada
+            del functions[func_name]
+            configure_batcher(func_name)
+            shutdown_function(func_name)
+            shutil.rmtree(func_path, ignore_errors=True)
+            collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+            raise RuntimeError(f"Fallo en init(): {e}") from e
     logs[func_name] = []
     save_state()
-    return {"status": "ok", "function": func_name}
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
+    return response
 
 def internal_list_functions():
     return list(functions.keys())
 
-def internal_get_status():
-    if psutil is None: raise RuntimeError("psutil module not found.")
-    process = psutil.Process(os.getpid())
-    cpu_percent = process.cpu_percent(interval=0.1) 
-    milicpu_usage = (cpu_percent / 100.0) * 1000
-    mem_info = process.memory_info()
-    rss_mb = mem_info.rss / (1024 * 1024) 
-    system_mem = psutil.virtual_memory()
-    system_total_gb = system_mem.total / (1024 * 1024 * 1024) 
-    system_available_gb = system_mem.available / (1024 * 1024 * 1024) 
-    
-    return {
+def internal_get_status(history=None):
+    # Última muestra del muestreador: no se bloquea el bucle de red de paho midiendo CPU
+    window = parse_history_window(history)
+    sample = SAMPLER.latest()
+    milicpu_usage = (sample["process_cpu_percent"] / 100.0) * 1000
+
+    status = {
         "status": "running",
         "cpu_usage_absolute": {"process_milicpu": f"{milicpu_usage:.6f}"},
-        "memory_usage_absolute": {"process_rss_mb": f"{rss_mb:.2f} MB"},
-        "system_memory_info": {"total_ram_gb": f"{system_total_gb:.2f} GB", "available_ram_gb": f"{system_available_gb:.2f} GB"},
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "memory_usage_absolute": {"process_rss_mb": f"{sample['process_rss_mb']:.2f} MB"},
+        "system_memory_info": {"total_ram_gb": f"{sample['ram_total_gb']:.2f} GB", "available_ram_gb": f"{sample['ram_available_gb']:.2f} GB"},
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sample": sample
     }
+    if window is not None:
+        status["history"] = SAMPLER.history(window)
+    return status
 
 def internal_get_logs(func_name):
     if func_name not in logs: raise ValueError("Function not found")
-    return logs[func_name]
+    return [dict(entry) for entry in logs[func_name]]
 
 def internal_delete_function(func_name):
     if func_name not in functions: raise ValueError("Function not found")
 
     func_path = os.path.join(FUNCTIONS_DIR, func_name)
     del functions[func_name]
+    FUNCTION_METRICS.pop(func_name, None)
+    configure_batcher(func_name)
+    shutdown_function(func_name)
+    FUNCTION_RESOURCES.release(func_name)
     del logs[func_name]
+    HISTORY.forget(func_name)
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
     save_state()
 
     shutil.rmtree(func_path, ignore_errors=True)
+    collect_bundle_garbage(BUNDLES_DIR, referenced_bundles)
     return {"status": "deleted", "function": func_name}
 
-def core_execute_function(func_name, data):
+def core_execute_function(func_name, data, on_done=None, on_item=None):
+    """
+    Ejecuta la función y devuelve su entrada de log. Si `main` es `async def` y se
+    pasa `on_done`, la corrutina se agenda en el bucle compartido, se devuelve None
+    y la entrada se entrega a `on_done` cuando termina (sin ocupar este hilo).
+    Si `main` es un generador y se pasa `on_item`, cada elemento se entrega con
+    on_item(seq, elemento) según se produce y el log guarda solo el recuento; con
+    `on_done` además, el generador se recorre en otro hilo y se devuelve None.
+    """
     if func_name not in functions:
         return {"error": "Function not found", "status_code": 404} 
 
-    func_info = functions[func_name]
-    func_path = func_info["path"]
-
-    spec = importlib.util.spec_from_file_location("func", func_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    # init() pendiente (función sin prewarm): su coste no cuenta en la latencia de la invocación
+    try:
+        init_ms = ensure_initialized(func_name)
+    except Exception as e:
+        return {"error": f"Fallo en init(): {e}", "status_code": 500}
+    module = get_function_module(func_name)["module"]
 
     args = data.get("args", [])
+    timeout = call_timeout(data, ASYNC_DEFAULT_TIMEOUT, ASYNC_MAX_TIMEOUT)
 
     s_time = time.time()
     start_time = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f") 
+    invocation_id = str(uuid.uuid4())
+    context = FUNCTION_RESOURCES.context(func_name, invocation_id)
+
+    if on_done is not None and inspect.iscoroutinefunction(module.main):
+        coroutine = module.main(*args, **context_kwargs(module.main, context))
+        if init_ms is not None:
+            on_done = with_init_ms(on_done, init_ms)
+        submit_async_invocation(func_name, invocation_id, coroutine, args, start_time, timeout, on_done)
+        return None
+
+    if on_item is not None and on_done is not None and inspect.isasyncgenfunction(module.main):
+        agen = module.main(*args, **context_kwargs(module.main, context))
+        if init_ms is not None:
+            on_done = with_init_ms(on_done, init_ms)
+        summary = StreamSummary()
+        submit_async_invocation(func_name, invocation_id, consume_async_stream(agen, on_item, summary),
+                                args, start_time, timeout, on_done, stream=summary)
+        return None
+
+    if on_item is not None and is_stream_function(module.main):
+        def run_stream():
+            stream = {"items": 0, "first_item_ms": None}
+            t_call = time.perf_counter()
+            entry = {"id": invocation_id, "args": args, "time_start": start_time}
+            try:
+                for item in iterate_stream(module.main, args, context, timeout):
+                    if stream["first_item_ms"] is None:
+                        stream["first_item_ms"] = round((time.perf_counter() - t_call) * 1000, 3)
+                    on_item(stream["items"], item)
+                    stream["items"] += 1
+                entry["status"] = "success"
+            except Exception as e:
+                entry.update({"error": str(e), "status": "error"})
+            record_metrics(func_name, (time.perf_counter() - t_call) * 1000, error=entry["status"] == "error")
+            entry["time_end"] = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+            entry["stream"] = stream
+            if init_ms is not None:
+                entry["init_ms"] = init_ms
+            log_entry = compact_entry(BLOBS_DIR, entry)
+            logs[func_name].append(log_entry)
+            save_state()
+            HISTORY.record(func_name, log_entry)
+            return {**entry, "done": True}
 
+        if on_done is None:
+            return run_stream()
+        # Con on_done el generador se recorre en su propio hilo: en el hilo de red de paho
+        # los parciales quedarían en cola hasta que el generador terminase
+        threading.Thread(target=lambda: on_done(run_stream()), name=f"faas-stream-{func_name}", daemon=True).start()
+        return None
+
+    t_call = time.perf_counter()
     try:
-        result = module.main(*args)
+        result = call_function(module.main, *args, timeout=timeout, context=context)
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000)
         e_time = time.time()
         end_time = datetime.fromtimestamp(e_time).strftime("%Y-%m-%d %H:%M:%S.%f")   
         
         entry = {
-            "id": str(uuid.uuid4()), "args": args, "result": result, "status": "success",
+            "id": invocation_id, "args": args, "result": result, "status": "success",
             "time_start": start_time, "time_end": end_time
         }
     except Exception as e:
+        record_metrics(func_name, (time.perf_counter() - t_call) * 1000, error=True)
         end_time = time.time()
         entry = {
-            "id": str(uuid.uuid4()), "args": args, "error": str(e), "status": "error",
+            "id": invocation_id, "args": args, "error": str(e), "status": "error",
             "time_start": start_time, "time_end": end_time
         }
+    if init_ms is not None:
+        entry["init_ms"] = init_ms
+
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs[func_name].append(log_entry)
+    save_state()
+    HISTORY.record(func_name, log_entry)
+    return entry
+
+
+# ========================================================
+# 📈 MÉTRICAS POR FUNCIÓN (contadores e histogramas de buckets fijos)
+# ========================================================
+# FunctionMetrics y el registro por función están en liftr_common.metrics
+
+
+def render_metrics():
+    """Métricas en formato de exposición de texto de Prometheus."""
+    return render_prometheus(ADMISSION_CONTROL.rejections)
+
+# ========================================================
+# 📉 MUESTREO DEL SISTEMA EN SEGUNDO PLANO (ring buffer de series temporales)
+# ========================================================
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("FAAS_SAMPLE_INTERVAL", "2"))
+SAMPLE_HISTORY_SIZE = int(os.getenv("FAAS_SAMPLE_HISTORY", "1800"))  # 1 h a 2 s por muestra
+# SystemSampler está en liftr_common.sampler; aquí solo el estado propio de cada función
+
+
+def function_worker_stats():
+    """Estado por función para el muestreador: init() hecho, invocaciones en lote pendientes y contadores."""
+    stats = {}
+    for func_name in list(functions):
+        state = loaded_modules.get(func_name)
+        batcher = batchers.get(func_name)
+        metrics = FUNCTION_METRICS.get(func_name)
+        stats[func_name] = {
+            "initialized": bool(state and state["initialized"]),
+            "batch_pending": len(batcher.pending) if batcher else 0,
+            "calls": metrics.calls if metrics else 0,
+            "errors": metrics.errors if metrics else 0,
+        }
+    return stats
+
 
-    logs[func_name].append(entry)
+SAMPLER = SystemSampler(SAMPLE_INTERVAL_SECONDS, SAMPLE_HISTORY_SIZE, function_worker_stats)
+
+
+# ========================================================
+# 🧱 ALMACÉN DE BLOBS (args/resultados grandes fuera del log, por contenido)
+# ========================================================
+
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs")
+# Escritura, lectura y recolección de blobs en liftr_common.blobs
+
+
+def referenced_blobs():
+    """Digests referenciados por las entradas de log que siguen retenidas."""
+    return blob_references(logs)
+
+# ========================================================
+# 🗄️ HISTORIAL DE EJECUCIONES EN SQLITE (WAL, indexado, con agregados)
+# ========================================================
+
+HISTORY_DB_FILE = os.path.join(DATA_DIR, "history.db")
+# HistoryStore, los filtros de consulta y entry_timestamp están en liftr_common.history
+
+HISTORY = HistoryStore(HISTORY_DB_FILE, json_default=log_json_default)
+
+# ========================================================
+# ♻️ RETENCIÓN DE LOGS Y ARCHIVOS COMPRIMIDOS POR DÍA
+# ========================================================
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Política global (0 = sin límite); cada función puede sobrescribirla al subirse
+RETENTION_DEFAULTS = {
+    "max_entries": int(os.getenv("FAAS_RETENTION_MAX_ENTRIES", "1000")),
+    "max_age": int(os.getenv("FAAS_RETENTION_MAX_AGE", str(7 * 24 * 3600))),  # segundos
+    "max_bytes": int(os.getenv("FAAS_RETENTION_MAX_BYTES", str(1024 * 1024))),
+}
+ARCHIVE_MAX_BYTES = int(os.getenv("FAAS_ARCHIVE_MAX_BYTES", str(256 * 1024 * 1024)))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("FAAS_RETENTION_INTERVAL", "60"))
+RETENTION_LOCK = threading.Lock()
+# Los segmentos por día, su consulta y la política de caducidad están en liftr_common.retention
+
+
+def retention_policy(log_key):
+    """Política efectiva: la global con las sobrescrituras de la función (si las tiene)."""
+    policy = dict(RETENTION_DEFAULTS)
+    policy.update((functions.get(log_key) or {}).get("retention") or {})
+    return policy
+
+
+def apply_retention():
+    """
+    Rota a los archivos las entradas que exceden la política de cada log, las retira
+    del estado en memoria, del historial SQLite y de los blobs, y acota los archivos.
+    """
+    with RETENTION_LOCK:
+        now = time.time()
+        rotated = {}
+        for log_key, entries in list(logs.items()):
+            count = expired_count(entries, retention_policy(log_key), now, log_json_default)
+            if not count:
+                continue
+            expired = entries[:count]
+            try:
+                archive_entries(ARCHIVE_DIR, log_key, [inline_blobs(BLOBS_DIR, entry) for entry in expired])
+            except OSError as e:
+                print(f"ADVERTENCIA: no se pudo archivar el log de '{log_key}': {e}")
+                continue
+            # Solo se recorta el principio: las invocaciones concurrentes añaden al final
+            del entries[:count]
+            HISTORY.forget_ids([entry.get("id") for entry in expired if entry.get("id")])
+            rotated[log_key] = count
+        if rotated:
+            save_state()
+            collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+        return {"rotated": rotated, "archive_segments_removed": enforce_archive_limit(ARCHIVE_DIR, ARCHIVE_MAX_BYTES)}
+
+
+def retention_worker():
+    while True:
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            summary = apply_retention()
+            if summary["rotated"]:
+                print(f"Retención: entradas archivadas {summary['rotated']}.")
+        except Exception as e:
+            print(f"ADVERTENCIA: fallo al aplicar la retención de logs: {e}")
+
+
+def retention_report():
+    segments = list_archive_segments(ARCHIVE_DIR)
+    return {
+        "defaults": RETENTION_DEFAULTS,
+        "policies": {log_key: retention_policy(log_key) for log_key in list(logs)},
+        "archive": {"segments": len(segments), "bytes": sum(s["bytes"] for s in segments),
+                    "max_bytes": ARCHIVE_MAX_BYTES},
+    }
+
+
+# ========================================================
+# 🚦 CONTROL DE ADMISIÓN (concurrencia, colas con plazo y límites por llamante)
+# ========================================================
+
+# Límite global de ejecuciones simultáneas y de invocaciones esperando turno (0 = sin límite)
+GLOBAL_MAX_CONCURRENCY = int(os.getenv("FAAS_MAX_CONCURRENCY", "64"))
+GLOBAL_QUEUE_SIZE = int(os.getenv("FAAS_GLOBAL_QUEUE_SIZE", "256"))
+# Política por función (cada función puede sobrescribirla al subirse):
+# max_concurrency 0 = solo cuenta el límite global; rate_limit en invocaciones/s por llamante (0 = sin límite)
+ADMISSION_DEFAULTS = {
+    "max_concurrency": int(os.getenv("FAAS_FUNCTION_MAX_CONCURRENCY", "0")),
+    "queue_size": int(os.getenv("FAAS_QUEUE_SIZE", "64")),
+    "queue_timeout": float(os.getenv("FAAS_QUEUE_TIMEOUT", "10")),  # segundos
+    "rate_limit": float(os.getenv("FAAS_RATE_LIMIT", "0")),
+    "rate_burst": int(os.getenv("FAAS_RATE_BURST", "0")),           # 0 = max(1, rate_limit)
+}
+# AdmissionControl (limitadores, token buckets por llamante y rechazos) está en liftr_common.admission
+
+
+def function_admission(func_name):
+    """Política de admisión propia de la función (None si usa la global)."""
+    return (functions.get(func_name) or {}).get("admission")
+
+
+ADMISSION_CONTROL = AdmissionControl(ADMISSION_DEFAULTS, GLOBAL_MAX_CONCURRENCY, GLOBAL_QUEUE_SIZE,
+                                     function_admission)
+
+
+def releasing(admission, deliver):
+    """Libera la plaza de admisión antes de entregar una respuesta diferida."""
+    if admission is None:
+        return deliver
+    def release_and_deliver(entry):
+        admission.release()
+        deliver(entry)
+    return release_and_deliver
+
+# ========================================================
+# 🔗 PIPELINES (DAG de funciones ejecutado en el servidor)
+# ========================================================
+
+def internal_register_pipeline(pipeline_name, stages):
+    stages = normalize_pipeline(stages)
+    missing = sorted({stage["function"] for stage in stages if stage["function"] not in functions})
+    if missing: raise ValueError(f"Funciones no cargadas: {', '.join(missing)}")
+
+    pipelines[pipeline_name] = {
+        "name": pipeline_name,
+        "stages": stages,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_state()
+    return {"status": "ok", "pipeline": pipeline_name, "stages": stages}
+
+def internal_list_pipelines():
+    return pipelines
+
+def internal_delete_pipeline(pipeline_name):
+    if pipeline_name not in pipelines: raise ValueError("Pipeline not found")
+    del pipelines[pipeline_name]
+    logs.pop(f"pipeline:{pipeline_name}", None)
+    HISTORY.forget(f"pipeline:{pipeline_name}")
+    collect_blob_garbage(BLOBS_DIR, referenced_blobs)
     save_state()
+    return {"status": "deleted", "pipeline": pipeline_name}
+
+def core_execute_pipeline(pipeline_name, data):
+    """
+    Ejecuta las etapas en este mismo proceso, pasando los resultados intermedios en
+    memoria (con los módulos ya cargados de cada función). Devuelve una única
+    entrada de log con los tiempos de cada etapa.
+    """
+    if pipeline_name not in pipelines:
+        return {"error": "Pipeline not found", "status_code": 404}
+
+    stages = pipelines[pipeline_name]["stages"]
+    args = data.get("args", [])
+    timeout = call_timeout(data, ASYNC_DEFAULT_TIMEOUT, ASYNC_MAX_TIMEOUT)
+    results = {}
+    stage_timings = {}
+    current = None
+
+    s_time = time.time()
+    start_time = datetime.fromtimestamp(s_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry = {"id": str(uuid.uuid4()), "pipeline": pipeline_name, "args": args, "time_start": start_time}
+    t_pipeline = time.perf_counter()
+
+    try:
+        for stage in stages:
+            current = stage["name"]
+            func_name = stage["function"]
+            if func_name not in functions:
+                raise ValueError(f"Function not found: {func_name}")
+            ensure_initialized(func_name)
+            module = get_function_module(func_name)["module"]
+            stage_args = [results[i] for i in stage["inputs"]] if stage["inputs"] else args
+
+            t_stage = time.perf_counter()
+            try:
+                results[current] = call_function(module.main, *stage_args, timeout=timeout,
+                                                 context=FUNCTION_RESOURCES.context(func_name, entry["id"]))
+            finally:
+                stage_timings[current] = round((time.perf_counter() - t_stage) * 1000, 3)
+
+        # El resultado es el de la etapa final; si el DAG tiene varias, se agrupan por nombre
+        consumed = {i for stage in stages for i in stage["inputs"]}
+        sinks = [stage["name"] for stage in stages if stage["name"] not in consumed]
+        entry["result"] = results[sinks[0]] if len(sinks) == 1 else {name: results[name] for name in sinks}
+        entry["status"] = "success"
+    except Exception as e:
+        entry["error"] = str(e)
+        entry["failed_stage"] = current
+        entry["status"] = "error"
+
+    entry["time_end"] = datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S.%f")
+    entry["stages_ms"] = stage_timings
+    record_metrics(f"pipeline:{pipeline_name}", (time.perf_counter() - t_pipeline) * 1000,
+                   error=entry["status"] == "error")
+
+    log_entry = compact_entry(BLOBS_DIR, entry)
+    logs.setdefault(f"pipeline:{pipeline_name}", []).append(log_entry)
+    save_state()
+    HISTORY.record(f"pipeline:{pipeline_name}", log_entry)
     return entry
 
 
+# ========================================================
+# ♻️ DEDUPLICACIÓN DE MENSAJES (idempotencia por request_id)
+# ========================================================
+
+class ResponseCache:
+    """
+    Tabla acotada (tamaño y antigüedad) de los request_id vistos recientemente y sus
+    respuestas ya publicadas. Con QoS1 un mensaje puede llegar dos veces; la segunda
+    entrega republica la respuesta guardada en lugar de ejecutar de nuevo.
+    """
+    PENDING = object()
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # clave -> (instante, respuesta o PENDING)
+        self.lock = threading.Lock()
+
+    def _evict(self, now, room=0):
+        """Descarta lo caducado y lo más antiguo hasta dejar sitio para `room` claves nuevas."""
+        while self.entries:
+            key, (seen_at, _) = next(iter(self.entries.items()))
+            if len(self.entries) + room <= self.max_entries and now - seen_at < self.ttl:
+                break
+            self.entries.popitem(last=False)
+
+    def begin(self, key):
+        """Devuelve None si la clave es nueva (y la marca en curso), PENDING o la respuesta guardada."""
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            if key in self.entries:
+                return self.entries[key][1]
+            self._evict(now, room=1)
+            self.entries[key] = (now, self.PENDING)
+            return None
+
+    def complete(self, key, response_topic, response_payload):
+        with self.lock:
+            if key in self.entries:
+                self.entries[key] = (self.entries[key][0], (response_topic, response_payload))
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
 # ========================================================
 # 🆕 CLASE DEL SERVIDOR MQTT (YA NO NECESITA CONTEXTO DE FLASK)
 # ========================================================
@@ -200,9 +893,12 @@ class TinyFaaS_MqttServer(threading.Thread):
     
     def __init__(self, execute_function_callback):
         super().__init__()
+        global mqtt_publisher
         self.client = mqtt.Client(client_id=f"TinyFaaS_Server_{os.getpid()}") 
+        mqtt_publisher = self.client
         self.execute_function = execute_function_callback
         self.running = False
+        self.responses = ResponseCache(DEDUPE_TTL_SECONDS, DEDUPE_MAX_ENTRIES)
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -219,24 +915,102 @@ class TinyFaaS_MqttServer(threading.Thread):
         # 1. Parsear el tópico: faas/category/command/name
         path = topic.split('/')
         if len(path) < 3: return # Tópico no válido
-        category = path[1] # 'admin' o 'invoke'
+        category = path[1] # 'admin', 'invoke' o 'pipeline'
         
         response_topic = None
         result_payload = {}
         command = path[2] if len(path) > 2 else category
+        dedupe_key = None
+        admission = None
+        busy = None
 
         try:
             data = json.loads(payload) if payload else {}
             request_id = data.get("request_id", str(uuid.uuid4())) # Obtener o generar ID
 
+            # 0. Reentrega de un request_id ya visto: se republica la respuesta guardada
+            if "request_id" in data and category in ('invoke', 'pipeline', 'admin'):
+                dedupe_key = (topic, request_id)
+                cached = self.responses.begin(dedupe_key)
+                if cached is ResponseCache.PENDING:
+                    print(f"MQTT: Reentrega de {request_id} en curso; se ignora. Tópico: {topic}")
+                    return
+                if cached is not None:
+                    if category == 'invoke' and command in functions:
+                        record_cache_hit(command)
+                    client.publish(cached[0], cached[1], qos=1)
+                    print(f"MQTT: Reentrega de {request_id}; respuesta republicada en {cached[0]}")
+                    return
+
+            def publish_partial(topic):
+                """Callback para los elementos de un `main` generador: mensajes parciales numerados."""
+                def publish_item(seq, item):
+                    partial = {"request_id": request_id, "seq": seq, "item": item, "partial": True}
+                    client.publish(topic, json.dumps(partial, default=str), qos=1)
+                return publish_item
+
+            def publish_later(topic):
+                """Callback para respuestas diferidas (micro-batching y funciones async)."""
+                def publish_entry(entry):
+                    entry["request_id"] = request_id
+                    response = json.dumps(entry, default=str)
+                    if dedupe_key:
+                        self.responses.complete(dedupe_key, topic, response)
+                    client.publish(topic, response, qos=1)
+                return publish_entry
+
+            # Control de admisión sin espera (este hilo atiende todos los mensajes): "busy" inmediato.
+            # Un pipeline cuenta como una invocación más ('pipeline:<nombre>') con la política por defecto
+            admission_key = None
+            if category == 'invoke' and len(path) == 3 and path[2] in functions:
+                admission_key = path[2]
+            elif category == 'pipeline' and len(path) == 3 and path[2] in pipelines:
+                admission_key = f"pipeline:{path[2]}"
+            if admission_key:
+                try:
+                    admission = ADMISSION_CONTROL.admit(admission_key, data.get("client_id") or "mqtt", wait=False)
+                except Overloaded as e:
+                    busy = {"status": "busy", "error": str(e), "reason": e.reason, "retry_after": e.retry_after}
+                    # No se guarda para la deduplicación: el reintento con el mismo request_id debe ejecutarse
+                    if dedupe_key:
+                        self.responses.discard(dedupe_key)
+                        dedupe_key = None
+
             # --- A. FUNCTION INVOCATION (faas/invoke/func_name) ---
-            if category == 'invoke' and len(path) == 3:
+            if busy is not None:
+                response_topic = f"{MQTT_RESPONSE_TOPIC}/{category}/{path[2]}"
+                result_payload = busy
+
+            elif category == 'invoke' and len(path) == 3 and path[2] in batchers:
+                # Con micro-batching, la respuesta se publica cuando se ejecuta el lote
                 func_name = path[2]
-                result_entry = self.execute_function(func_name, data) 
+                batchers[func_name].submit(data.get("args", []),
+                                           releasing(admission, publish_later(f"{MQTT_RESPONSE_TOPIC}/invoke/{func_name}")))
+
+            elif category == 'invoke' and len(path) == 3:
+                func_name = path[2]
+                invoke_topic = f"{MQTT_RESPONSE_TOPIC}/invoke/{func_name}"
+                result_entry = self.execute_function(func_name, data,
+                                                     on_done=releasing(admission, publish_later(invoke_topic)),
+                                                     on_item=publish_partial(invoke_topic))
+                if result_entry is not None and admission:
+                    admission.release()
                 
-                # Respuesta: Retornar el log completo de la ejecución
-                response_topic = f"{MQTT_RESPONSE_TOPIC}/invoke/{func_name}"
-                result_payload = result_entry
+                # Respuesta: Retornar el log completo de la ejecución (las funciones async
+                # publican al terminar, desde el hilo de finalización)
+                if result_entry is not None:
+                    response_topic = invoke_topic
+                    result_payload = result_entry
+
+            # --- A.2 PIPELINE INVOCATION (faas/pipeline/pipeline_name) ---
+            elif category == 'pipeline' and len(path) == 3:
+                pipeline_name = path[2]
+                response_topic = f"{MQTT_RESPONSE_TOPIC}/pipeline/{pipeline_name}"
+                try:
+                    result_payload = core_execute_pipeline(pipeline_name, data)
+                finally:
+                    if admission:
+                        admission.release()
             
             # --- B. ADMINISTRATIVE COMMANDS (faas/admin/command[/name]) ---
             elif category == 'admin' and len(path) >= 3:
@@ -246,7 +1020,48 @@ class TinyFaaS_MqttServer(threading.Thread):
                     result_payload = {"functions": internal_list_functions()}
                 
                 elif command == 'status':
-                    result_payload = internal_get_status()
+                    # Payload opcional {"history": segundos} para la serie temporal
+                    result_payload = internal_get_status(data.get("history"))
+
+                elif command == 'history':
+                    # Payload: filtros {"function", "status", "since", "until", "limit", "offset"}
+                    result_payload = HISTORY.query(parse_history_filters(data))
+
+                elif command == 'history_aggregate':
+                    # Payload: filtros + "bucket" (segundos por ventana)
+                    result_payload = HISTORY.aggregate(parse_history_filters(data))
+
+                elif command == 'blob' and len(path) == 4:
+                    # Contenido completo de unos args/resultado guardados fuera del log
+                    digest = path[3]
+                    blob = read_blob(BLOBS_DIR, digest)
+                    if blob is None: raise ValueError(f"Blob no encontrado: {digest}")
+                    result_payload = {"digest": digest, "size": len(blob), "data": json.loads(blob)}
+                    response_topic = f"{MQTT_RESPONSE_TOPIC}/admin/blob/{digest}"
+
+                elif command == 'blobs_gc':
+                    result_payload = collect_blob_garbage(BLOBS_DIR, referenced_blobs)
+
+                elif command == 'admission':
+                    result_payload = ADMISSION_CONTROL.report(list(functions))
+
+                elif command == 'retention':
+                    result_payload = retention_report()
+
+                elif command == 'retention_run':
+                    result_payload = apply_retention()
+
+                elif command == 'archives':
+                    segments = list_archive_segments(ARCHIVE_DIR)
+                    result_payload = {"segments": [{k: v for k, v in s.items() if k != "path"} for s in segments]}
+
+                elif command == 'archive_query':
+                    # Mismos filtros que 'history', sobre los segmentos archivados
+                    result_payload = query_archives(ARCHIVE_DIR, parse_history_filters(data))
+
+                elif command == 'metrics':
+                    # Resumen (p50/p95/p99) y la exposición de texto de Prometheus
+                    result_payload = {"metrics": metrics_summary(), "exposition": render_metrics()}
                 
                 elif command == 'logs' and len(path) == 4:
                     func_name = path[3]
@@ -260,15 +1075,38 @@ class TinyFaaS_MqttServer(threading.Thread):
                     
                 elif command == 'upload' and len(path) == 4:
                     func_name = path[3]
-                    if "code_b64" not in data: raise ValueError("Payload debe contener 'code_b64'")
+                    if "code_b64" not in data and "bundle_b64" not in data:
+                        raise ValueError("Payload debe contener 'code_b64' (o el paquete zip/tar 'bundle_b64')")
                     
                     # Decodificación de archivos (se asume que la data viene limpia)
-                    code_data = base64.b64decode(data.get("code_b64"))
+                    code_data = base64.b64decode(data["code_b64"]) if data.get("code_b64") else None
+                    bundle_data = base64.b64decode(data["bundle_b64"]) if data.get("bundle_b64") else None
                     req_data = base64.b64decode(data.get("req_b64")) if data.get("req_b64") else None
                     
-                    result_payload = internal_upload_function(func_name, code_data, req_data)
+                    batch = parse_batch_payload(data)
+                    retention = normalize_retention(data.get("retention"))
+                    # 'admission' es la plaza de esta invocación: la política va en otra variable
+                    admission_config = normalize_admission(data.get("admission"))
+                    result_payload = internal_upload_function(func_name, code_data, req_data, batch,
+                                                              prewarm=bool(data.get("prewarm")),
+                                                              retention=retention, admission=admission_config,
+                                                              bundle_data=bundle_data)
                     response_topic = f"{MQTT_RESPONSE_TOPIC}/admin/upload/{func_name}"
 
+                elif command == 'pipelines':
+                    result_payload = {"pipelines": internal_list_pipelines()}
+
+                elif command == 'pipeline' and len(path) == 4:
+                    # Registro: payload {"stages": [...]}
+                    pipeline_name = path[3]
+                    result_payload = internal_register_pipeline(pipeline_name, data.get("stages"))
+                    response_topic = f"{MQTT_RESPONSE_TOPIC}/admin/pipeline/{pipeline_name}"
+
+                elif command == 'delete_pipeline' and len(path) == 4:
+                    pipeline_name = path[3]
+                    result_payload = internal_delete_pipeline(pipeline_name)
+                    response_topic = f"{MQTT_RESPONSE_TOPIC}/admin/delete_pipeline/{pipeline_name}"
+
                 else:
                     raise ValueError("Comando administrativo no válido.")
 
@@ -276,12 +1114,20 @@ class TinyFaaS_MqttServer(threading.Thread):
             if response_topic:
                 # Incluir el request_id original en la respuesta
                 result_payload["request_id"] = request_id
-                client.publish(response_topic, json.dumps(result_payload), qos=1)
+                response = json.dumps(result_payload)
+                if dedupe_key:
+                    self.responses.complete(dedupe_key, response_topic, response)
+                client.publish(response_topic, response, qos=1)
                 print(f"MQTT: Comando {category}/{command} completado. Respuesta enviada a {response_topic}")
             
         except Exception as e:
+            if admission:
+                admission.release()
             error_topic = f"{MQTT_RESPONSE_TOPIC}/error"
             error_payload = {"error": str(e), "topic": topic, "command": command}
+            # Los errores no se guardan: un reintento con el mismo request_id vuelve a ejecutarse
+            if dedupe_key:
+                self.responses.discard(dedupe_key)
             client.publish(error_topic, json.dumps(error_payload), qos=1)
             print(f"MQTT Error: {e}. Tópico: {topic}")
 
@@ -302,10 +1148,29 @@ class TinyFaaS_MqttServer(threading.Thread):
             self.running = False
 
 
+# ========================================================
+# 🧵 SERVICIOS EN SEGUNDO PLANO
+# ========================================================
+
+def start_background_services():
+    """
+    Arranca los hilos del servidor: bucle asyncio, entrega de resultados asíncronos,
+    muestreo del sistema, escritor del historial (crea data/history.db) y retención.
+    Importar el módulo no arranca ninguno.
+    """
+    threading.Thread(target=EVENT_LOOP.run_forever, name="faas-asyncio", daemon=True).start()
+    threading.Thread(target=async_completion_worker, name="faas-async-completions", daemon=True).start()
+    SAMPLER.start()
+    HISTORY.start()
+    atexit.register(HISTORY.close)
+    threading.Thread(target=retention_worker, name="faas-retention", daemon=True).start()
+
+
 # ========================================================
 # 🚀 MAIN
 # ========================================================
 if __name__ == "__main__":
+    start_background_services()
     load_state() 
     
     mqtt_server = TinyFaaS_MqttServer(
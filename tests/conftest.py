@@ -0,0 +1,15 @@
+"""
+Los servidores son scripts independientes: se importan desde sus directorios. Al
+importarse crean 'functions/' y 'data/' en el directorio actual, así que las
+pruebas se ejecutan dentro de un directorio temporal.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # liftr_common
+for subdir in ("http_server", os.path.join("http_server", "containerized"), "mqtt_server"):
+    sys.path.insert(0, os.path.join(ROOT, subdir))
+
+os.chdir(tempfile.mkdtemp(prefix="faas-tests-"))
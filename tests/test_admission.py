@@ -0,0 +1,144 @@
+"""Limitadores del control de admisión."""
+import threading
+import time
+
+import pytest
+
+from liftr_common.admission import (Admission, AdmissionControl, ConcurrencyLimiter, Overloaded, TokenBucket,
+                                    normalize_admission)
+
+
+def test_limiter_queues_up_to_queue_size():
+    limiter = ConcurrencyLimiter(1, 1)
+    assert limiter.reserve() and limiter.take()
+    assert limiter.reserve()          # Espera turno en la cola
+    assert not limiter.reserve()      # Cola llena
+    assert limiter.stats() == {"limit": 1, "queue_size": 1, "active": 1, "queued": 1}
+
+
+def test_limiter_take_times_out_and_frees_its_place():
+    limiter = ConcurrencyLimiter(1, 1)
+    assert limiter.reserve() and limiter.take()
+    assert limiter.reserve()
+    assert not limiter.take(time.monotonic() + 0.05)
+    assert limiter.stats()["queued"] == 0
+    assert limiter.reserve()
+
+
+def test_limiter_hands_the_slot_to_the_waiter_on_release():
+    limiter = ConcurrencyLimiter(1, 4)
+    assert limiter.reserve() and limiter.take()
+    order = []
+
+    def wait(name):
+        limiter.take(time.monotonic() + 5)
+        order.append(name)
+        limiter.release()
+
+    waiters = []
+    for name in ("a", "b"):
+        assert limiter.reserve()
+        waiters.append(threading.Thread(target=wait, args=(name,)))
+        waiters[-1].start()
+        while len(limiter.waiters) < len(waiters):
+            time.sleep(0.001)
+    limiter.release()
+    for thread in waiters:
+        thread.join(5)
+    assert order == ["a", "b"]
+    assert limiter.stats()["active"] == 0
+
+
+def test_limit_zero_is_unlimited():
+    limiter = ConcurrencyLimiter(0, 0)
+    for _ in range(100):
+        assert limiter.reserve() and limiter.take(time.monotonic())
+    assert limiter.stats()["active"] == 100
+
+
+def test_admission_release_is_idempotent():
+    limiters = [ConcurrencyLimiter(2, 0), ConcurrencyLimiter(2, 0)]
+    for limiter in limiters:
+        assert limiter.reserve()
+    admission = Admission(limiters)
+    assert admission.start()
+    admission.release()
+    admission.release()
+    assert [limiter.stats()["active"] for limiter in limiters] == [0, 0]
+
+
+def test_admission_start_cancels_pending_reservations_on_timeout():
+    busy = ConcurrencyLimiter(1, 1)
+    assert busy.reserve() and busy.take()
+    free = ConcurrencyLimiter(1, 1)
+    assert busy.reserve() and free.reserve()
+    admission = Admission([busy, free])
+    assert not admission.start(time.monotonic() + 0.05)
+    assert busy.stats()["queued"] == 0 and free.stats() == {"limit": 1, "queue_size": 1, "active": 0, "queued": 0}
+
+
+def test_token_bucket_allows_a_burst_then_reports_the_wait():
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert 0 < bucket.take() <= 0.5
+
+
+def test_overloaded_rounds_retry_after_up():
+    assert Overloaded("f", "rate_limited", 0.2).retry_after == 1
+    assert Overloaded("f", "queue_full", 2.5).retry_after == 3
+
+
+def test_normalize_admission():
+    assert normalize_admission({}) is None
+    assert normalize_admission({"max_concurrency": "2", "queue_timeout": "0.5"}) == {"max_concurrency": 2,
+                                                                                       "queue_timeout": 0.5}
+    with pytest.raises(ValueError):
+        normalize_admission({"queue_size": "-1"})
+
+
+DEFAULTS = {"max_concurrency": 0, "queue_size": 0, "queue_timeout": 0.05, "rate_limit": 0, "rate_burst": 0}
+
+
+def test_admission_control_applies_function_policies_and_counts_rejections():
+    policies = {"f": {"max_concurrency": 1}}
+    control = AdmissionControl(DEFAULTS, 0, 0, policies.get)
+    held = control.admit("f", "a")
+    with pytest.raises(Overloaded) as rejected:
+        control.admit("f", "a")
+    assert rejected.value.reason == "queue_full"
+    assert control.admit("g", "a").release() is None   # Sin política propia: solo el límite global
+
+    policies["f"] = {"max_concurrency": 1, "queue_size": 1}  # Se recrea el limitador al cambiar
+    second = control.admit("f", "a")
+    queued = control.reserve("f", "a")
+    with pytest.raises(Overloaded) as rejected:
+        control.reserve("f", "a")
+    assert rejected.value.reason == "queue_full"
+    second.release()
+    assert queued.start(time.monotonic() + 1)
+    queued.release()
+    held.release()
+
+    report = control.report(["f", "g"])
+    assert report["functions"]["f"]["limiter"]["limit"] == 1 and report["functions"]["g"]["limiter"] is None
+    assert report["rejections"] == {"f": {"queue_full": 2}}
+
+
+def test_admission_control_times_out_in_the_queue():
+    control = AdmissionControl({**DEFAULTS, "queue_size": 1}, 1, 1, lambda func_name: None)
+    held = control.admit("f", "a")
+    with pytest.raises(Overloaded) as rejected:
+        control.admit("f", "b")
+    assert rejected.value.reason == "queue_timeout"
+    held.release()
+    assert control.global_limiter.stats() == {"limit": 1, "queue_size": 1, "active": 0, "queued": 0}
+
+
+def test_admission_control_rate_limits_each_caller():
+    control = AdmissionControl({**DEFAULTS, "rate_limit": 1}, 0, 0, lambda func_name: None)
+    control.admit("f", "a").release()
+    with pytest.raises(Overloaded) as rejected:
+        control.admit("f", "a")
+    assert rejected.value.reason == "rate_limited" and rejected.value.retry_after == 1
+    control.admit("f", "b").release()   # Cada llamante tiene su bucket
+    assert control.rejections == {("f", "rate_limited"): 1}
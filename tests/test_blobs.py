@@ -0,0 +1,59 @@
+"""Almacén de blobs por contenido de liftr_common.blobs."""
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from liftr_common import blobs
+
+
+def test_only_fields_over_the_threshold_become_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "BLOB_THRESHOLD_BYTES", 100)
+    entry = {"id": "x", "args": [1, 2], "result": "r" * 400, "status": "success"}
+    log_entry = blobs.externalize_entry(tmp_path, entry)
+    assert log_entry["args"] == [1, 2] and entry["result"] == "r" * 400
+    reference = log_entry["result"]
+    encoded = json.dumps("r" * 400).encode()
+    assert reference["$blob"] == hashlib.sha256(encoded).hexdigest()
+    assert reference["size"] == len(encoded)
+    assert len(reference["preview"]) == blobs.BLOB_PREVIEW_CHARS
+    assert blobs.read_blob(tmp_path, reference["$blob"]) == encoded
+    assert blobs.inline_blobs(tmp_path, log_entry) == entry
+
+    small = {"args": [1], "result": 2}
+    assert blobs.externalize_entry(tmp_path, small) is small
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    first = blobs.store_blob(tmp_path, b"payload")
+    second = blobs.store_blob(tmp_path, b"payload")
+    assert first == second
+    stored = [name for _, _, files in os.walk(tmp_path) for name in files]
+    assert stored == [first]
+
+
+@pytest.mark.parametrize("digest", [None, "", "abc", "../" + "0" * 61, "A" * 64, "0" * 63 + "/"])
+def test_read_blob_rejects_malformed_digests(tmp_path, digest):
+    assert blobs.read_blob(tmp_path, digest) is None
+
+
+def test_read_blob_of_a_missing_digest_is_none(tmp_path):
+    assert blobs.read_blob(tmp_path, "0" * 64) is None
+
+
+def test_garbage_collection_honours_references_and_grace_period(tmp_path):
+    kept = blobs.store_blob(tmp_path, b"kept")
+    old = blobs.store_blob(tmp_path, b"old")
+    recent = blobs.store_blob(tmp_path, b"recent")
+    past = time.time() - blobs.BLOB_GC_GRACE_SECONDS - 10
+    for digest in (kept, old):
+        os.utime(blobs.blob_path(tmp_path, digest), (past, past))
+
+    logs = {"f": [{"args": {"$blob": kept, "size": 4, "preview": "kept"}, "result": 1}]}
+    report = blobs.collect_blob_garbage(tmp_path, lambda: blobs.blob_references(logs))
+    assert report == {"removed": 1, "freed_bytes": len(b"old")}
+    assert blobs.read_blob(tmp_path, old) is None
+    assert blobs.read_blob(tmp_path, kept) == b"kept"
+    assert blobs.read_blob(tmp_path, recent) == b"recent"
@@ -0,0 +1,103 @@
+"""Paquetes de función (zip/tar) de liftr_common.bundles."""
+import io
+import json
+import os
+import sys
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+from liftr_common import bundles
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("main.py", "main.py"),
+    ("./src/util.py", "src/util.py"),
+    ("src\\util.py", "src/util.py"),
+    ("src/../main.py", "main.py"),
+    ("src//lib/./x.py", "src/lib/x.py"),
+])
+def test_safe_member_path_normalizes(name, expected):
+    assert bundles.safe_member_path(name) == expected
+
+
+@pytest.mark.parametrize("name", ["/etc/passwd", "../x.py", "src/../../x.py", "..\\x.py", ".", "..", "a/.."])
+def test_safe_member_path_rejects_paths_outside_the_bundle(name):
+    with pytest.raises(ValueError):
+        bundles.safe_member_path(name)
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for info, content in members:
+            archive.writestr(info, content)
+    return buffer.getvalue()
+
+
+def test_read_bundle_archive_rejects_traversal_and_links():
+    assert bundles.read_bundle_archive(zip_bytes([("fn/main.py", b"x")])) == {"fn/main.py": b"x"}
+    with pytest.raises(ValueError, match="Ruta no permitida"):
+        bundles.read_bundle_archive(zip_bytes([("../evil.py", b"x")]))
+
+    link = zipfile.ZipInfo("main.py")
+    link.external_attr = (stat.S_IFLNK | 0o777) << 16
+    with pytest.raises(ValueError, match="Enlace simbólico"):
+        bundles.read_bundle_archive(zip_bytes([(link, "/etc/passwd")]))
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        member = tarfile.TarInfo("main.py")
+        member.type = tarfile.SYMTYPE
+        member.linkname = "/etc/passwd"
+        archive.addfile(member)
+    with pytest.raises(ValueError, match="archivos regulares"):
+        bundles.read_bundle_archive(buffer.getvalue())
+
+
+RUNTIMES = {"python": ".py"}
+
+
+def python_bundle(files):
+    return zip_bytes([("manifest.json", json.dumps({"entry": "main.py"})), *files.items()])
+
+
+def test_deploy_reuses_the_directory_of_identical_content(tmp_path):
+    data = python_bundle({"main.py": "from . import util\ndef main(x):\n    return util.double(x)\n",
+                          "util.py": "def double(x):\n    return 2 * x\n"})
+    bundle = bundles.deploy_bundle(tmp_path, data, RUNTIMES)
+    assert bundle["runtime"] == "python" and bundle["files"] == 3
+    root = bundles.bundle_path(tmp_path, bundle["digest"])
+    assert os.stat(os.path.join(root, "main.py")).st_mode & 0o222 == 0
+    assert bundles.deploy_bundle(tmp_path, data, RUNTIMES) == bundle
+    assert os.listdir(tmp_path) == [bundle["digest"]]
+
+    module = bundles.import_bundle(tmp_path, bundle)
+    assert module.main(21) == 42
+    bundles.forget_bundle_modules(module)
+    assert not any(name.startswith(bundles.BUNDLE_PACKAGE_PREFIX) for name in sys.modules)
+
+
+def test_deploy_runs_the_build_hook_and_rejects_unknown_runtimes(tmp_path):
+    built = []
+    data = python_bundle({"main.py": "def main():\n    return 1\n"})
+    bundles.deploy_bundle(tmp_path, data, RUNTIMES, build=lambda root, bundle: built.append(bundle["entry"]))
+    assert built == ["main.py"]
+
+    node = zip_bytes([("manifest.json", json.dumps({"entry": "index.js"})), ("index.js", "")])
+    with pytest.raises(ValueError, match="runtime"):
+        bundles.deploy_bundle(tmp_path, node, RUNTIMES)
+    assert bundles.deploy_bundle(tmp_path, node, {**RUNTIMES, "node": ".js"})["runtime"] == "node"
+
+
+def test_garbage_collection_keeps_referenced_and_recent_bundles(tmp_path, monkeypatch):
+    kept = bundles.deploy_bundle(tmp_path, python_bundle({"main.py": "def main():\n    return 1\n"}), RUNTIMES)
+    old = bundles.deploy_bundle(tmp_path, python_bundle({"main.py": "def main():\n    return 2\n"}), RUNTIMES)
+    references = lambda: bundles.bundle_references([{"bundle": kept}, {"file_path": "x.py"}])
+    assert bundles.collect_bundle_garbage(tmp_path, references) == 0  # Margen de gracia
+
+    monkeypatch.setattr(bundles, "BUNDLE_GC_GRACE_SECONDS", -1)
+    assert bundles.collect_bundle_garbage(tmp_path, references) == 1
+    assert os.listdir(tmp_path) == [kept["digest"]]
@@ -0,0 +1,137 @@
+"""Backends 'inprocess' y 'subprocess' del servidor contenedorizado (sin root ni crun)."""
+import textwrap
+
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+def write_function(tmp_path, source, name="func.py"):
+    path = tmp_path / name
+    path.write_text(textwrap.dedent(source))
+    return {"file_path": path.as_posix(), "file_ext": ".py", "limits": {}}
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    path = tmp_path / "scratch"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def subprocess_backend(monkeypatch):
+    # Un único worker por función: llamadas consecutivas comparten proceso
+    monkeypatch.setattr(server, "SUBPROCESS_POOL_SIZE", 1)
+    backend = server.SubprocessBackend()
+    yield backend
+    for func_name in list(backend.worker_stats()):
+        backend.retire(func_name)
+
+
+def test_execution_backend_is_abstract():
+    with pytest.raises(TypeError):
+        server.ExecutionBackend()
+
+
+def test_inprocess_returns_result_and_keeps_module_warm(tmp_path, scratch):
+    func_data = write_function(tmp_path, """
+        calls = []
+        def main(x):
+            calls.append(x)
+            return {"double": x * 2, "calls": len(calls)}
+    """)
+    backend = server.InProcessBackend()
+    try:
+        assert backend.invoke("f", func_data, [21], scratch, server.PhaseTimer())[0] == {"double": 42, "calls": 1}
+        result, extras = backend.invoke("f", func_data, [1], scratch, server.PhaseTimer())
+        assert result["calls"] == 2
+        assert "cpu_time_ms" in extras["resources"]
+    finally:
+        backend.retire("f")
+
+
+def test_inprocess_streams_items(tmp_path, scratch):
+    func_data = write_function(tmp_path, """
+        def main(n):
+            for i in range(n):
+                yield i
+    """)
+    backend = server.InProcessBackend()
+    items = []
+    try:
+        result, _ = backend.invoke("g", func_data, [3], scratch, server.PhaseTimer(), on_item=items.append)
+    finally:
+        backend.retire("g")
+    assert result is None and items == [0, 1, 2]
+
+
+def test_subprocess_returns_result(tmp_path, scratch, subprocess_backend):
+    func_data = write_function(tmp_path, """
+        def main(a, b):
+            print("capturado")
+            return a + b
+    """)
+    result, extras = subprocess_backend.invoke("add", func_data, [2, 3], scratch, server.PhaseTimer())
+    assert result == 5
+    assert extras["resources"]["peak_memory_bytes"] > 0
+
+
+def test_subprocess_timeout(tmp_path, scratch, subprocess_backend, monkeypatch):
+    monkeypatch.setattr(server, "INVOCATION_TIMEOUT", 0.5)
+    func_data = write_function(tmp_path, """
+        import time
+        def main():
+            time.sleep(5)
+    """)
+    with pytest.raises(TimeoutError):
+        subprocess_backend.invoke("slow", func_data, [], scratch, server.PhaseTimer())
+    # El worker bloqueado se descarta: el pool no queda ocupado
+    assert subprocess_backend.worker_stats()["slow"]["workers"] == 0
+
+
+def test_subprocess_memory_rlimit(tmp_path, scratch, subprocess_backend):
+    func_data = write_function(tmp_path, """
+        def main(mb):
+            return len(bytearray(mb * 1024 * 1024))
+    """)
+    func_data["limits"] = {"memory_mb": 256}
+    with pytest.raises(Exception, match="MemoryError"):
+        subprocess_backend.invoke("big", func_data, [1024], scratch, server.PhaseTimer())
+    # Dentro del límite la misma función sigue funcionando
+    assert subprocess_backend.invoke("big", func_data, [1], scratch, server.PhaseTimer())[0] == 1024 * 1024
+
+
+def test_subprocess_worker_crash(tmp_path, scratch, subprocess_backend):
+    func_data = write_function(tmp_path, """
+        import os
+        def main():
+            os._exit(3)
+    """)
+    with pytest.raises(RuntimeError, match="terminó inesperadamente"):
+        subprocess_backend.invoke("crash", func_data, [], scratch, server.PhaseTimer())
+
+
+def test_subprocess_env_does_not_leak_between_calls(tmp_path, scratch, subprocess_backend):
+    func_data = write_function(tmp_path, """
+        import os
+        def main():
+            return os.environ.get("FAAS_INPUT_BIN")
+    """)
+    (scratch / "input.bin").write_bytes(b"x")
+    first, _ = subprocess_backend.invoke("env", func_data, [], scratch, server.PhaseTimer())
+    assert first == (scratch / "input.bin").as_posix()
+
+    (scratch / "input.bin").unlink()
+    second, _ = subprocess_backend.invoke("env", func_data, [], scratch, server.PhaseTimer())
+    assert second is None
+    assert subprocess_backend.worker_stats()["env"]["workers"] == 1
+
+
+def test_subprocess_worker_has_no_new_privs(tmp_path, scratch, subprocess_backend):
+    func_data = write_function(tmp_path, """
+        def main():
+            with open("/proc/self/status") as f:
+                return [line.split()[1] for line in f if line.startswith("NoNewPrivs")][0]
+    """)
+    assert subprocess_backend.invoke("nnp", func_data, [], scratch, server.PhaseTimer())[0] == "1"
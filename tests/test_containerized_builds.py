@@ -0,0 +1,68 @@
+"""Activación de funciones tras construir su capa de dependencias en segundo plano."""
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+@pytest.fixture
+def layer_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "ensure_dependency_layer", lambda runtime, packages: "capa")
+    monkeypatch.setattr(server, "prune_unused_layers", lambda: None)
+    func_dir = tmp_path / "fn"
+    staging_dir = func_dir / ".staging-test"
+    staging_dir.mkdir(parents=True)
+    (staging_dir / "fn.py").write_text("def main(): return 1\n")
+    metadata = {"name": "fn", "file_path": (func_dir / "fn.py").as_posix(), "file_ext": ".py",
+                "layer": "capa", "status": "ready"}
+    # Sin encolarlo: el trabajo se ejecuta a mano, no en el hilo de construcciones
+    job = {"job_id": "job-1", "kind": "layer", "function_name": "fn", "runtime": "python", "packages": ["x"],
+           "layer": "capa", "staging_dir": staging_dir.as_posix(), "function_metadata": metadata, "log": []}
+    monkeypatch.setitem(server.functions, "fn", {**metadata, "status": "building", "build_job": job["job_id"]})
+    yield job
+    server.functions.pop("fn", None)
+
+
+def test_owning_job_activates_function(layer_job):
+    server.run_layer_job(layer_job)
+    assert server.functions["fn"]["status"] == "ready"
+    assert (server.Path(layer_job["staging_dir"]).parent / "fn.py").exists()
+
+
+def test_deleted_function_is_not_resurrected(layer_job):
+    del server.functions["fn"]
+    server.run_layer_job(layer_job)
+    assert "fn" not in server.functions
+    assert not server.Path(layer_job["staging_dir"]).exists()
+
+
+def test_superseded_job_is_discarded(layer_job):
+    server.functions["fn"] = {"name": "fn", "status": "ready", "created_at": "nueva"}
+    server.run_layer_job(layer_job)
+    assert server.functions["fn"]["created_at"] == "nueva"
+    assert not server.Path(layer_job["staging_dir"]).exists()
+
+
+def test_prune_keeps_layers_of_pending_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "LAYERS_DIR", tmp_path / "layers")
+    monkeypatch.setattr(server, "LAYER_GC_GRACE_SECONDS", 0)
+    for name in ("pendiente", "huerfana"):
+        (server.LAYERS_DIR / name).mkdir(parents=True)
+    monkeypatch.setitem(server.BUILD_JOBS, "job-2", {"status": "running", "layer": "pendiente"})
+    server.prune_unused_layers()
+    assert (server.LAYERS_DIR / "pendiente").exists()
+    assert not (server.LAYERS_DIR / "huerfana").exists()
+
+
+def test_failed_rootfs_build_keeps_packages_config(tmp_path, monkeypatch):
+    config = tmp_path / "packages.json"
+    config.write_text('{"common_python_packages": "requests"}')
+    monkeypatch.setattr(server, "PACKAGES_CONFIG_FILE", config)
+
+    def failing_copy(command, **kwargs):
+        raise server.subprocess.CalledProcessError(1, command)
+    monkeypatch.setattr(server, "run_privileged", failing_copy)
+
+    with pytest.raises(server.subprocess.CalledProcessError):
+        server.run_rootfs_job({"python_packages": ["numpy"], "log": []})
+    assert config.read_text() == '{"common_python_packages": "requests"}'
+    assert [p.name for p in tmp_path.iterdir()] == ["packages.json"]
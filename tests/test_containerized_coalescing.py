@@ -0,0 +1,75 @@
+"""Coalescencia de invocaciones idénticas en el servidor contenedorizado."""
+import os
+import textwrap
+import threading
+import time
+
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+@pytest.fixture
+def coalesced_function(tmp_path, monkeypatch):
+    path = tmp_path / "slow.py"
+    path.write_text(textwrap.dedent("""
+        import os, time
+        def main(x):
+            time.sleep(0.3)
+            with open(os.environ["FAAS_OUTPUT_BIN"], "wb") as f:
+                f.write(b"bin")
+            return x
+    """))
+    monkeypatch.setitem(server.functions, "slow", {
+        "name": "slow", "file_path": path.as_posix(), "file_ext": ".py", "limits": {},
+        "backend": "subprocess", "coalesce": True, "created_at": "test",
+    })
+    yield "slow"
+    server.retire_function_runtime("slow")
+
+
+def run_concurrently(func_name, count):
+    entries, errors = {}, {}
+
+    def call(task_id):
+        try:
+            entries[task_id] = server.execute_coalesced(func_name, [1], task_id, "start")
+        except Exception as e:
+            errors[task_id] = e
+
+    threads = [threading.Thread(target=call, args=(f"task-{i}",)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads), "una invocación adjunta quedó bloqueada"
+    return entries, errors
+
+
+def test_followers_get_their_own_timings_and_output(coalesced_function):
+    entries, errors = run_concurrently(coalesced_function, 3)
+    assert not errors
+    leader = entries["task-0"]
+    assert leader["coalesced"] == 2
+    for task_id in ("task-1", "task-2"):
+        follower = entries[task_id]
+        assert follower["result"] == 1 and follower["coalesced_with"] == "task-0"
+        assert follower["start_type"] == "coalesced"
+        assert set(follower["timings_ms"]) == {"coalesced_wait"}
+        assert follower["output_binary"]["url"] == f"/task/output/{task_id}"
+        assert (server.OUTPUTS_DIR / f"{task_id}.bin").read_bytes() == b"bin"
+    for task_id in entries:
+        (server.OUTPUTS_DIR / f"{task_id}.bin").unlink()
+
+
+def test_link_failure_does_not_block_followers(coalesced_function, monkeypatch):
+    def failing_link(src, dst):
+        raise FileExistsError(17, "File exists", str(dst))
+
+    monkeypatch.setattr(os, "link", failing_link)
+    entries, errors = run_concurrently(coalesced_function, 2)
+    assert not errors
+    assert "output_binary" in entries["task-0"]
+    assert "output_binary" not in entries["task-1"]
+    (server.OUTPUTS_DIR / "task-0.bin").unlink()
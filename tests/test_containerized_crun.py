@@ -0,0 +1,72 @@
+"""Limpieza de contenedores crun (con un crun falso que registra sus llamadas)."""
+import json
+import textwrap
+
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+@pytest.fixture
+def fake_crun(tmp_path, monkeypatch):
+    rootfs = tmp_path / "rootfs"
+    rootfs.mkdir()
+    (rootfs / "config.json").write_text(json.dumps({"root": {}, "process": {"env": []}}))
+    calls = tmp_path / "calls"
+    crun = tmp_path / "crun"
+    crun.write_text(textwrap.dedent(f"""\
+        #!/bin/sh
+        echo "$@" >> {calls}
+        if [ "$1" = run ]; then
+            for i in 1 2 3 4 5; do echo "linea $i"; sleep 0.2; done
+        fi
+    """))
+    crun.chmod(0o755)
+    monkeypatch.setattr(server, "ROOTFS_DIR", rootfs)
+    monkeypatch.setattr(server, "CRUN_BIN", crun.as_posix())
+    return calls
+
+
+def test_finished_container_is_deleted(fake_crun):
+    out, err, code = server.run_in_container(["true"], timeout=5)
+    calls = fake_crun.read_text().splitlines()
+    assert code == 0 and "linea 5" in out
+    assert [c.split()[0] for c in calls] == ["run", "delete"]
+
+
+def test_cancelled_stream_kills_container(fake_crun):
+    def on_line(line):
+        raise server.StreamCancelled("cliente desconectado")
+
+    out, err, code = server.run_in_container(["true"], timeout=5, on_line=on_line)
+    calls = fake_crun.read_text().splitlines()
+    container_id = calls[0].split()[1]
+    assert code != 0
+    assert calls[1:] == [f"kill {container_id} KILL", f"delete -f {container_id}"]
+
+
+def test_timeout_kills_container(fake_crun):
+    out, err, code = server.run_in_container(["true"], timeout=0.3)
+    assert code == 124
+    assert [c.split()[0] for c in fake_crun.read_text().splitlines()] == ["run", "kill", "delete"]
+
+
+def test_timeout_reads_cgroup_stats_from_host(fake_crun, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "CGROUP_ROOT", tmp_path / "cgroup")
+
+    def fake_kill(command, **kwargs):
+        if command[1] == "kill":
+            # El cgroup sigue existiendo hasta 'crun delete'
+            cgroup = server.CGROUP_ROOT / server.CGROUP_PARENT / command[2]
+            cgroup.mkdir(parents=True)
+            (cgroup / "cpu.stat").write_text("usage_usec 2500\nuser_usec 2000\nsystem_usec 500\n")
+            (cgroup / "memory.peak").write_text("4096\n")
+        return real_run(command, **kwargs)
+    real_run = server.subprocess.run
+    monkeypatch.setattr(server.subprocess, "run", fake_kill)
+
+    stats = {}
+    out, err, code = server.run_in_container(["true"], timeout=0.3, cgroup_stats=stats)
+    assert code == 124
+    assert server.parse_cgroup_stats(stats) == {"cpu_time_ms": 2.5, "cpu_user_ms": 2.0,
+                                                "cpu_system_ms": 0.5, "peak_memory_bytes": 4096}
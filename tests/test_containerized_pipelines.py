@@ -0,0 +1,51 @@
+"""Pipelines del servidor contenedorizado (etapas con el backend 'subprocess')."""
+import base64
+import textwrap
+
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for name, body in (("double", "return x * 2"), ("inc", "return x + 1"), ("fail", "raise ValueError('mal')")):
+        path = tmp_path / f"{name}.py"
+        path.write_text(textwrap.dedent(f"""
+            def main(x):
+                {body}
+        """))
+        monkeypatch.setitem(server.functions, name, {
+            "name": name, "file_path": path.as_posix(), "file_ext": ".py", "limits": {},
+            "backend": "subprocess", "created_at": "test",
+        })
+    monkeypatch.setattr(server, "pipelines", {})
+    monkeypatch.setattr(server, "save_state", lambda: None)
+    credentials = base64.b64encode(f"{server.USERNAME}:{server.PASSWORD}".encode()).decode()
+    yield server.app.test_client(), {"Authorization": f"Basic {credentials}"}
+    for name in ("double", "inc", "fail"):
+        server.retire_function_runtime(name)
+
+
+def test_chain_with_repeated_function(client):
+    c, auth = client
+    response = c.post('/admin/pipelines', headers=auth, json={"name": "p", "stages": ["double", "inc", "double"]})
+    assert response.status_code == 200
+    entry = c.post('/pipeline/p', json={"args": [3]}).get_json()
+    assert entry["status"] == "success"
+    assert entry["result"] == 14
+    assert set(entry["stages_ms"]) == {"double", "inc", "double#2"}
+
+
+def test_failed_stage_is_reported(client):
+    c, auth = client
+    c.post('/admin/pipelines', headers=auth, json={"name": "q", "stages": ["inc", "fail"]})
+    entry = c.post('/pipeline/q', json={"args": [1]}).get_json()
+    assert entry["status"] == "error"
+    assert entry["failed_stage"] == "fail"
+
+
+def test_unknown_pipeline_and_functions(client):
+    c, auth = client
+    assert c.post('/pipeline/nope', json={}).status_code == 404
+    assert c.post('/admin/pipelines', headers=auth, json={"name": "r", "stages": ["nope"]}).status_code == 404
@@ -0,0 +1,24 @@
+"""Stream SSE de finalización de tareas asíncronas (servidor contenedorizado)."""
+import server_tinyfaas_containerized as server
+
+
+def test_unread_stream_does_not_leave_a_subscriber():
+    before = len(server.TASK_EVENT_SUBSCRIBERS)
+    # Respuesta creada pero cerrada antes de enviar nada (el cliente se fue)
+    with server.app.test_request_context('/task/events'):
+        response = server.stream_task_events()
+    response.close()
+    assert len(server.TASK_EVENT_SUBSCRIBERS) == before
+
+
+def test_finished_task_is_sent_on_connect(monkeypatch):
+    task = {"task_id": "t-1", "function_name": "f", "status": "completed", "time_end": "x"}
+    monkeypatch.setitem(server.ASYNC_TASKS, "t-1", task)
+    with server.app.test_request_context('/task/events?task_id=t-1'):
+        response = server.stream_task_events()
+    chunks = iter(response.response)
+    assert next(chunks) == ": conectado\n\n"
+    assert next(chunks).startswith("event: task\nid: t-1\n")
+    assert len(server.TASK_EVENT_SUBSCRIBERS) == 1
+    response.close()
+    assert len(server.TASK_EVENT_SUBSCRIBERS) == 0
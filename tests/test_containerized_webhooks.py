@@ -0,0 +1,66 @@
+"""Restricción de destinos de los callbacks asíncronos del servidor contenedorizado."""
+import http.server
+import threading
+
+import pytest
+
+import server_tinyfaas_containerized as server
+
+
+@pytest.fixture
+def redirect_server():
+    hits = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            hits.append(self.path)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(302)
+            self.send_header("Location", "http://169.254.169.254/latest/meta-data")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1], hits
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8080/hook",
+    "http://localhost/hook",
+    "https://[::1]:9443/hook",
+])
+def test_loopback_callbacks_are_allowed(url):
+    scheme, netloc, host, port, address = server.resolve_callback_url(url)
+    assert server.webhook_host_allowed(host, address)
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://127.0.0.1/hook",
+    "http:///hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://10.0.0.5/hook",
+])
+def test_other_callbacks_are_rejected(url):
+    with pytest.raises(ValueError):
+        server.resolve_callback_url(url)
+
+
+def test_allowlist_accepts_hosts_and_networks(monkeypatch):
+    monkeypatch.setattr(server, "WEBHOOK_ALLOWED_HOSTS", ["10.0.5.0/24", "hooks.internal"])
+    assert server.resolve_callback_url("http://10.0.5.7/hook")[4] == "10.0.5.7"
+    assert server.webhook_host_allowed("hooks.internal", "192.168.1.10")
+    with pytest.raises(ValueError):
+        server.resolve_callback_url("http://10.0.6.7/hook")
+
+
+def test_redirects_are_not_followed(redirect_server):
+    port, hits = redirect_server
+    status = server.WebhookClient()._send(f"http://127.0.0.1:{port}/hook", b"{}")
+    assert status == 302
+    assert hits == ["/hook"]
@@ -0,0 +1,82 @@
+"""Historial de invocaciones en SQLite (liftr_common.history)."""
+import time
+
+import pytest
+
+from liftr_common.history import HistoryStore, parse_history_filters
+
+HOUR = 3600
+BASE = 1_700_000_000 // HOUR * HOUR   # Inicio de una ventana de una hora
+
+
+def entry(uid, start, duration_ms, status="success"):
+    return {"id": uid, "args": [], "status": status, "time_start": start, "time_end": start + duration_ms / 1000}
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(tmp_path / "history.db")
+    history.start()
+    yield history
+    history.close()
+
+
+def flushed(history):
+    """Espera a que el escritor vacíe la cola (close() la procesa entera)."""
+    history.close()
+    return history
+
+
+def test_aggregate_counts_errors_and_percentiles_per_bucket(store):
+    for i in range(1, 11):
+        store.record("f", entry(f"a{i}", BASE + i, i, status="error" if i in (3, 7) else "success"))
+    store.record("f", entry("b1", BASE + HOUR + 5, 40))
+    store.record("g", entry("c1", BASE + 20, 2))
+
+    result = flushed(store).aggregate(parse_history_filters({"bucket": HOUR}))
+    assert result["bucket_seconds"] == HOUR
+    buckets = {(b["function"], b["bucket_start"]): b for b in result["buckets"]}
+    assert list(buckets) == [("f", BASE), ("g", BASE), ("f", BASE + HOUR)]
+
+    first = buckets[("f", BASE)]
+    assert (first["calls"], first["errors"], first["error_rate"]) == (10, 2, 0.2)
+    assert first["bucket_end"] == BASE + HOUR
+    assert first["avg_ms"] == pytest.approx(5.5)
+    assert (first["p50_ms"], first["p95_ms"], first["p99_ms"]) == pytest.approx((5, 10, 10))
+    assert buckets[("f", BASE + HOUR)]["p50_ms"] == pytest.approx(40)
+
+    only_g = store.aggregate(parse_history_filters({"function": "g"}))
+    assert [(b["function"], b["calls"], b["errors"]) for b in only_g["buckets"]] == [("g", 1, 0)]
+
+
+def test_relative_since_is_measured_from_now(store):
+    now = time.time()
+    store.record("f", entry("old", now - 2 * HOUR, 1))
+    store.record("f", entry("new", now - 60, 1))
+
+    filters = parse_history_filters({"since": "-3600"})
+    assert filters["since"] == pytest.approx(now - HOUR, abs=5)
+    result = flushed(store).query(filters)
+    assert result["total"] == 1
+    assert [e["id"] for e in result["entries"]] == ["new"]
+
+
+def test_forget_ids_removes_only_those_entries(store):
+    for i in range(3):
+        store.record("f", entry(f"e{i}", BASE + i, 1))
+    store.record("g", entry("g0", BASE, 1))
+    store.forget_ids(["e0", "e2"])
+    store.forget_ids([])                # Sin ids no se encola nada
+
+    result = flushed(store).query(parse_history_filters({}))
+    assert result["total"] == 2
+    assert sorted(e["id"] for e in result["entries"]) == ["e1", "g0"]
+    assert all("function" in e for e in result["entries"])
+
+
+def test_parse_history_filters_rejects_bad_values():
+    with pytest.raises(ValueError):
+        parse_history_filters({"since": "ayer"})
+    with pytest.raises(ValueError):
+        parse_history_filters({"limit": "0"})
+    assert parse_history_filters({"limit": "100000"})["limit"] == 1000
@@ -0,0 +1,134 @@
+"""Contexto de función, bucle asyncio compartido y lotes (liftr_common.invocation / batching)."""
+import asyncio
+import threading
+import types
+
+import pytest
+
+from liftr_common.batching import MicroBatcher, run_batch
+from liftr_common.invocation import (EVENT_LOOP, FunctionResources, call_function, call_timeout,
+                                     context_entry_points, iterate_stream)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def event_loop_thread():
+    if not EVENT_LOOP.is_running():
+        threading.Thread(target=EVENT_LOOP.run_forever, name="faas-asyncio-test", daemon=True).start()
+
+
+@pytest.fixture
+def declared():
+    return {}  # nombre -> puntos de entrada con `context` (lo que el servidor guarda por carga)
+
+
+@pytest.fixture
+def resources(tmp_path, declared):
+    return FunctionResources(str(tmp_path), publisher=lambda: None, entry_points=declared.get)
+
+
+def test_context_is_passed_only_to_declared_entry_points(resources, declared):
+    def main(x, context=None):
+        context.cache["calls"] = context.cache.get("calls", 0) + 1
+        return x, context.invocation_id
+
+    module = types.SimpleNamespace(main=main, main_batch=lambda batch: batch)
+    declared["f"] = context_entry_points(module)
+    assert declared["f"] == (main,)
+
+    assert call_function(main, 1, timeout=1, context=resources.context("f", "i-1")) == (1, "i-1")
+    assert call_function(module.main_batch, [2], timeout=1, context=resources.context("f", "i-2")) == [2]
+    assert resources.context("f", "i-3").cache == {"calls": 1}
+
+    resources.release("f")
+    assert "f" not in resources.functions
+
+
+def test_async_main_runs_on_the_shared_loop_with_a_deadline():
+    async def main(x):
+        await asyncio.sleep(0)
+        return x + 1
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    assert call_function(main, 1, timeout=1) == 2
+    with pytest.raises(TimeoutError):
+        call_function(slow, timeout=0.05)
+    assert call_timeout({"timeout": 900}, 30, 300) == 300
+    assert call_timeout({}, 30, 300) == 30
+
+
+def test_iterate_stream_walks_sync_and_async_generators(resources):
+    def numbers(n):
+        yield from range(n)
+
+    async def letters(text):
+        for char in text:
+            yield char
+
+    assert list(iterate_stream(numbers, [3], None, 1)) == [0, 1, 2]
+    assert list(iterate_stream(letters, ["ab"], resources.context("s", "i"), 1)) == ["a", "b"]
+
+
+def test_run_batch_prefers_main_batch_and_splits_failures(resources):
+    contexts = [resources.context("b", str(i)) for i in range(3)]
+    with_batch = types.SimpleNamespace(main=None, main_batch=lambda batch: [args[0] * 10 for args in batch])
+    assert run_batch(with_batch, [[1], [2], [3]], None, contexts, 1) == [(10, None), (20, None), (30, None)]
+
+    def main(x):
+        return 1 / x
+
+    assert run_batch(types.SimpleNamespace(main=main), [[2], [0]], None, contexts[:2], 1) == \
+        [(0.5, None), (None, "division by zero")]
+
+    async def async_main(x):
+        return -x
+
+    assert run_batch(types.SimpleNamespace(main=async_main), [[1], [2]], None, contexts[:2], 1) == \
+        [(-1, None), (-2, None)]
+
+
+def test_micro_batcher_uses_the_server_callbacks(resources):
+    recorded, delivered = [], []
+    done = threading.Event()
+
+    def load_module(func_name):
+        return types.SimpleNamespace(main_batch=lambda batch: [sum(args) for args in batch])
+
+    def deliver(entry):
+        delivered.append(entry)
+        if len(delivered) == 2:
+            done.set()
+
+    batcher = MicroBatcher("sumas-lote", 50, 2, load_module, lambda name, entries: recorded.append((name, entries)),
+                           resources, 1)
+    batcher.start()
+    try:
+        batcher.submit([1, 2], deliver)
+        batcher.submit([3, 4], deliver)
+        assert done.wait(2)
+    finally:
+        batcher.stop()
+        batcher.join(timeout=2)
+
+    assert [entry["result"] for entry in delivered] == [3, 7]
+    assert delivered[0]["batch"]["size"] == 2
+    assert [(name, len(entries)) for name, entries in recorded] == [("sumas-lote", 2)]
+
+
+def test_micro_batcher_reports_load_failures_per_invocation(resources):
+    def load_module(func_name):
+        raise RuntimeError(f"Función no cargada: {func_name}")
+
+    entries = []
+    done = threading.Event()
+    batcher = MicroBatcher("ausente-lote", 1, 4, load_module, lambda name, batch: None, resources, 1)
+    batcher.start()
+    try:
+        batcher.submit([1], lambda entry: (entries.append(entry), done.set()))
+        assert done.wait(2)
+    finally:
+        batcher.stop()
+        batcher.join(timeout=2)
+    assert entries[0]["status"] == "error"
+    assert entries[0]["error"] == "Función no cargada: ausente-lote"
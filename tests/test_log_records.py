@@ -0,0 +1,40 @@
+"""Entradas de log compactas (LogRecord) de liftr_common.logrecords."""
+import json
+
+from liftr_common import logrecords
+
+
+ENTRY = {"id": "3685adb3-b58b-4369-9144-4a14f648a147", "args": [1], "result": 2, "status": "success",
+         "time_start": "2026-01-01 12:00:00.000001", "time_end": "2026-01-01 12:00:00.250000"}
+
+
+def test_round_trip_matches_original_entry():
+    record = logrecords.LogRecord(ENTRY)
+    assert record.to_dict() == ENTRY
+    assert dict(record) == ENTRY
+    assert list(record) == list(ENTRY)
+    assert isinstance(record.uid, bytes) and isinstance(record.started, float)
+    assert json.loads(json.dumps([record], default=logrecords.log_json_default)) == [ENTRY]
+
+
+def test_unrecognised_formats_are_kept_verbatim():
+    entry = {**ENTRY, "id": "no-es-un-uuid", "time_start": "ayer", "batch": 4}
+    record = logrecords.LogRecord(entry)
+    assert record.uid is logrecords.UNSET and record.started is logrecords.UNSET
+    assert record.extra == {"id": "no-es-un-uuid", "time_start": "ayer", "batch": 4}
+    assert record.to_dict() == entry
+    assert record["batch"] == 4 and "batch" in record and "missing" not in record
+
+
+def test_decoded_strings_are_cached():
+    record = logrecords.LogRecord(ENTRY)
+    assert record.to_dict()["id"] is record.to_dict()["id"]
+    assert record["time_end"] is record.to_dict()["time_end"]
+
+
+def test_compact_entry_keeps_large_fields_as_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr("liftr_common.blobs.BLOB_THRESHOLD_BYTES", 16)
+    record = logrecords.compact_entry(tmp_path, {**ENTRY, "result": "x" * 64})
+    assert isinstance(record, logrecords.LogRecord)
+    assert record["result"]["size"] == 66 and "$blob" in record["result"]
+    assert record["id"] == ENTRY["id"]
@@ -0,0 +1,57 @@
+"""Contadores, histogramas y exposición de Prometheus de liftr_common.metrics."""
+import pytest
+
+from liftr_common import metrics
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "FUNCTION_METRICS", {})
+
+
+def test_samples_land_in_the_bucket_of_their_upper_bound():
+    for latency_ms in (0.5, 1, 1.01, 30000, 30001):
+        metrics.record_metrics("f", latency_ms)
+    counts = metrics.FUNCTION_METRICS["f"].latency_counts
+    assert counts[0] == 2                      # 0.5 y 1 (límite incluido)
+    assert counts[1] == 1                      # 1.01 -> (1, 2.5]
+    assert counts[len(metrics.LATENCY_BUCKETS_MS) - 1] == 1
+    assert counts[-1] == 1                     # +Inf
+    assert sum(counts) == metrics.FUNCTION_METRICS["f"].calls == 5
+
+
+def test_estimate_quantile_interpolates_within_the_bucket():
+    counts = [0] * (len(metrics.LATENCY_BUCKETS_MS) + 1)
+    assert metrics.estimate_quantile(counts, 0.5) is None
+    counts[3] = 10                              # (5, 10]
+    assert metrics.estimate_quantile(counts, 0.5) == 7.5
+    assert metrics.estimate_quantile(counts, 1.0) == 10
+    counts[-1] = 90                             # +Inf: se informa el último límite
+    assert metrics.estimate_quantile(counts, 0.99) == float(metrics.LATENCY_BUCKETS_MS[-1])
+
+
+def test_cache_hits_do_not_count_as_calls():
+    metrics.record_metrics("f", 3)
+    metrics.record_cache_hit("f")
+    metrics.record_cache_hit("f")
+    summary = metrics.metrics_summary()["f"]
+    assert (summary["calls"], summary["cache_hits"]) == (1, 2)
+    assert sum(metrics.FUNCTION_METRICS["f"].latency_counts) == 1
+
+
+def test_render_prometheus_exposes_counters_histograms_and_rejections():
+    metrics.record_metrics('fn"1', 3, queue_ms=0.5)
+    metrics.record_metrics('fn"1', 700, error=True)
+    metrics.record_cache_hit('fn"1')
+    lines = metrics.render_prometheus({("fn\"1", "queue_full"): 2}).splitlines()
+    label = 'function="fn\\"1"'
+    assert f"faas_invocations_total{{{label}}} 2" in lines
+    assert f"faas_invocation_errors_total{{{label}}} 1" in lines
+    assert f"faas_cache_hits_total{{{label}}} 1" in lines
+    assert f'faas_invocation_duration_ms_bucket{{{label},le="5"}} 1' in lines
+    assert f'faas_invocation_duration_ms_bucket{{{label},le="1000"}} 2' in lines
+    assert f'faas_invocation_duration_ms_bucket{{{label},le="+Inf"}} 2' in lines
+    assert f"faas_invocation_duration_ms_sum{{{label}}} 703.0" in lines
+    assert f"faas_queue_wait_ms_count{{{label}}} 1" in lines
+    assert f'faas_admission_rejections_total{{{label},reason="queue_full"}} 2' in lines
+    assert "# TYPE faas_invocation_duration_ms histogram" in lines
@@ -0,0 +1,118 @@
+"""Mensajes del servidor MQTT procesados por on_message (sin broker)."""
+import base64
+import json
+import time
+import types
+
+import pytest
+
+import server_tinyfaas_persistent_mqtt_v2 as server
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload)))
+
+
+@pytest.fixture
+def mqtt_server(monkeypatch):
+    monkeypatch.setattr(server, "mqtt_publisher", None)
+    return server.TinyFaaS_MqttServer(execute_function_callback=server.core_execute_function)
+
+
+def send(mqtt_server, topic, data):
+    client = FakeClient()
+    mqtt_server.on_message(client, None, types.SimpleNamespace(topic=topic, payload=json.dumps(data).encode()))
+    return client.published
+
+
+def test_failed_upload_with_admission_policy_publishes_error(mqtt_server):
+    published = send(mqtt_server, "faas/admin/upload/broken", {
+        "bundle_b64": base64.b64encode(b"no es un zip").decode(),
+        "admission": {"max_concurrency": 1},
+    })
+    assert published == [(f"{server.MQTT_RESPONSE_TOPIC}/error", {
+        "error": "El paquete debe ser un archivo zip o tar (.tar, .tar.gz, .tgz).",
+        "topic": "faas/admin/upload/broken", "command": "upload"})]
+    assert "broken" not in server.functions
+
+
+def test_sync_stream_publishes_partials_before_it_finishes(mqtt_server):
+    code = "import time\ndef main(n):\n    for i in range(n):\n        yield i\n        time.sleep(0.3)\n"
+    send(mqtt_server, "faas/admin/upload/slowgen", {"code_b64": base64.b64encode(code.encode()).decode()})
+    client = FakeClient()
+    payload = json.dumps({"args": [2], "request_id": "r1"}).encode()
+    mqtt_server.on_message(client, None, types.SimpleNamespace(topic="faas/invoke/slowgen", payload=payload))
+    # on_message vuelve sin esperar al generador (el hilo de red de paho queda libre)
+    assert [p for _, p in client.published if p.get("done")] == []
+    deadline = time.monotonic() + 5
+    while not any(p.get("done") for _, p in client.published) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    messages = [p for _, p in client.published]
+    assert [m["item"] for m in messages if m.get("partial")] == [0, 1]
+    assert messages[-1]["done"] and messages[-1]["stream"]["items"] == 2
+    assert messages[-1]["request_id"] == "r1"
+    server.internal_delete_function("slowgen")
+
+
+def test_failed_prewarm_rolls_the_upload_back(mqtt_server):
+    code = "def init():\n    raise RuntimeError('sin conexión')\ndef main():\n    return 1\n"
+    published = send(mqtt_server, "faas/admin/upload/badinit", {
+        "code_b64": base64.b64encode(code.encode()).decode(),
+        "prewarm": True,
+        "batch_window_ms": 5,
+    })
+    assert published == [(f"{server.MQTT_RESPONSE_TOPIC}/error", {
+        "error": "Fallo en init(): sin conexión", "topic": "faas/admin/upload/badinit", "command": "upload"})]
+    assert "badinit" not in server.functions
+    assert "badinit" not in server.batchers and "badinit" not in server.loaded_modules
+    assert "badinit" not in server.logs
+
+
+def test_replayed_invocation_counts_a_cache_hit_only(mqtt_server):
+    code = "def main(x):\n    return x + 1\n"
+    send(mqtt_server, "faas/admin/upload/replayed", {"code_b64": base64.b64encode(code.encode()).decode()})
+    first = send(mqtt_server, "faas/invoke/replayed", {"args": [1], "request_id": "dup"})
+    replay = send(mqtt_server, "faas/invoke/replayed", {"args": [1], "request_id": "dup"})
+    assert replay == first and first[0][1]["result"] == 2
+    summary = server.metrics_summary()["replayed"]
+    assert (summary["calls"], summary["cache_hits"]) == (1, 1)
+    server.internal_delete_function("replayed")
+
+
+def test_failed_request_is_not_replayed(mqtt_server):
+    data = {"request_id": "retry-me"}
+    first = send(mqtt_server, "faas/admin/logs/missing", data)
+    assert first[0][0] == f"{server.MQTT_RESPONSE_TOPIC}/error"
+    assert mqtt_server.responses.begin(("faas/admin/logs/missing", "retry-me")) is None
+
+
+def test_response_cache_marks_pending_and_replays():
+    cache = server.ResponseCache(ttl=60, max_entries=10)
+    assert cache.begin("k") is None
+    assert cache.begin("k") is server.ResponseCache.PENDING
+    cache.complete("k", "faas/response/invoke/f", '{"result": 1}')
+    assert cache.begin("k") == ("faas/response/invoke/f", '{"result": 1}')
+    cache.discard("k")
+    assert cache.begin("k") is None
+    cache.complete("other", "t", "p")                # Sin begin() previo no se guarda
+    assert "other" not in cache.entries
+
+
+def test_response_cache_evicts_by_size_and_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache = server.ResponseCache(ttl=10, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.begin(key)
+    assert list(cache.entries) == ["b", "c"]          # Al entrar 'c' sale la más antigua
+    assert cache.begin("b") is server.ResponseCache.PENDING
+    assert list(cache.entries) == ["b", "c"]          # Consultar no desplaza a nadie
+    cache.begin("d")
+    assert list(cache.entries) == ["c", "d"]
+    now[0] += 10
+    assert cache.begin("e") is None                   # 'c' y 'd' han caducado
+    assert list(cache.entries) == ["e"]
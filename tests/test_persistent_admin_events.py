@@ -0,0 +1,43 @@
+"""Stream SSE del panel de administración (servidor HTTP persistente)."""
+import base64
+import json
+
+import pytest
+
+import server_tinyfaas_persistent_http_v21 as server
+
+
+@pytest.fixture
+def client():
+    credentials = base64.b64encode(f"{server.USERNAME}:{server.PASSWORD}".encode()).decode()
+    return server.app.test_client(), {"Authorization": f"Basic {credentials}"}
+
+
+def test_unread_stream_does_not_leave_a_subscriber(client):
+    c, auth = client
+    before = len(server.ADMIN_EVENT_SUBSCRIBERS)
+    # Respuesta creada pero cerrada antes de enviar nada (el cliente se fue)
+    with server.app.test_request_context('/admin/events', headers=auth):
+        response = server.stream_admin_events()
+    response.close()
+    assert len(server.ADMIN_EVENT_SUBSCRIBERS) == before
+
+
+def test_status_events_carry_uptime(client, monkeypatch):
+    c, auth = client
+    samples = iter(range(1, 1000))
+    monkeypatch.setattr(server.SAMPLER, "latest", lambda: {"ts": next(samples), "cpu_percent": 1, "ram_percent": 2})
+    monkeypatch.setattr(server, "SAMPLE_INTERVAL_SECONDS", 0.01)
+    response = c.get('/admin/events?types=status', headers=auth)
+    events = []
+    for chunk in response.response:
+        events.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+        if len(events) == 2:
+            break
+    response.close()
+    kinds = [event.split("\n")[0] for event in events]
+    assert kinds == ["event: snapshot", "event: status"]
+    status = json.loads(events[1].split("data: ", 1)[1])
+    assert status["uptime"].endswith("s")
+    assert json.loads(events[0].split("data: ", 1)[1])["status"]["uptime"]
+    assert len(server.ADMIN_EVENT_SUBSCRIBERS) == 0
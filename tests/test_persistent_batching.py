@@ -0,0 +1,66 @@
+"""Micro-batching del servidor HTTP persistente ante fallos al registrar o entregar."""
+import threading
+import types
+
+import pytest
+
+import server_tinyfaas_persistent_http_v21 as server
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    module = types.SimpleNamespace(main=lambda x: x * 2)
+    monkeypatch.setitem(server.functions, "doble", {"name": "doble", "module": module})
+    monkeypatch.setitem(server.lifecycle, "doble",
+                        {"module": module, "lock": threading.Lock(), "initialized": True})
+    batcher = server.new_batcher("doble", window_ms=20, max_size=4)
+    batcher.start()
+    yield batcher
+    batcher.stop()
+    batcher.join(timeout=2)
+
+
+def submit_and_wait(batcher, args, callback=None):
+    done = threading.Event()
+    entries = []
+
+    def deliver(entry):
+        if callback:
+            callback(entry)
+        entries.append(entry)
+        done.set()
+
+    batcher.submit(args, deliver)
+    assert done.wait(2)
+    return entries
+
+
+def test_save_state_failure_still_delivers(batcher, monkeypatch):
+    def boom():
+        raise OSError("disco lleno")
+    monkeypatch.setattr(server, "save_state", boom)
+    entries = submit_and_wait(batcher, [3])
+    assert entries[0]["status"] == "success"
+    assert entries[0]["result"] == 6
+    assert batcher.is_alive()
+
+
+def test_failing_callback_gets_error_entry(batcher):
+    calls = []
+
+    def flaky(entry):
+        calls.append(entry)
+        if len(calls) == 1:
+            raise ValueError("no serializable")
+
+    entries = submit_and_wait(batcher, [1], callback=flaky)
+    assert entries[0]["status"] == "error"
+    assert "no serializable" in entries[0]["error"]
+    assert submit_and_wait(batcher, [2])[0]["result"] == 4
+
+
+def test_missing_module_yields_error(batcher, monkeypatch):
+    monkeypatch.setitem(server.functions, "doble", {"name": "doble"})
+    entries = submit_and_wait(batcher, [1])
+    assert entries[0]["status"] == "error"
+    assert batcher.is_alive()
@@ -0,0 +1,27 @@
+"""Pipelines del servidor HTTP persistente."""
+import threading
+import types
+
+import server_tinyfaas_persistent_http_v21 as server
+
+
+def test_unloaded_stage_fails_cleanly(monkeypatch):
+    module = types.SimpleNamespace(main=lambda x: x + 1)
+    monkeypatch.setitem(server.functions, "inc", {"name": "inc", "module": module})
+    monkeypatch.setitem(server.lifecycle, "inc", {"module": module, "lock": threading.Lock(), "initialized": True})
+    monkeypatch.setitem(server.functions, "ghost", {"name": "ghost"})  # Registrada, sin módulo cargado
+    monkeypatch.setitem(server.pipelines, "p", {"name": "p", "stages": server.normalize_pipeline(["inc", "ghost"])})
+
+    entry = server.run_pipeline("p", [1])
+    assert entry["status"] == "error"
+    assert entry["failed_stage"] == "ghost"
+    assert entry["error"] == "Función no cargada: ghost"
+    assert "ghost" not in server.FUNCTION_RESOURCES.functions
+
+
+def test_repeated_function_chain(monkeypatch):
+    module = types.SimpleNamespace(main=lambda x: x * 2)
+    monkeypatch.setitem(server.functions, "double", {"name": "double", "module": module})
+    monkeypatch.setitem(server.lifecycle, "double", {"module": module, "lock": threading.Lock(), "initialized": True})
+    monkeypatch.setitem(server.pipelines, "q", {"name": "q", "stages": server.normalize_pipeline(["double"] * 3)})
+    assert server.run_pipeline("q", [1])["result"] == 8
@@ -0,0 +1,39 @@
+"""Validación y orden de las etapas de un pipeline."""
+import pytest
+
+from liftr_common.pipelines import normalize_pipeline
+
+
+def names(stages):
+    return [(stage["name"], stage["inputs"]) for stage in stages]
+
+
+def test_linear_chain():
+    assert names(normalize_pipeline(["a", "b", "c"])) == [("a", []), ("b", ["a"]), ("c", ["b"])]
+
+
+def test_repeated_function_gets_unique_stage_names():
+    stages = normalize_pipeline(["f", "f", "g", "f"])
+    assert names(stages) == [("f", []), ("f#2", ["f"]), ("g", ["f#2"]), ("f#3", ["g"])]
+    assert [stage["function"] for stage in stages] == ["f", "f", "g", "f"]
+
+
+def test_dag_is_topologically_sorted():
+    stages = normalize_pipeline([
+        {"name": "sum", "function": "add", "inputs": ["left", "right"]},
+        {"name": "left", "function": "decode"},
+        {"name": "right", "function": "decode"},
+    ])
+    assert [stage["name"] for stage in stages] == ["left", "right", "sum"]
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([], "lista no vacía"),
+    ([{"name": "x"}], "'function'"),
+    ([{"name": "x", "function": "f"}, {"name": "x", "function": "g"}], "duplicada"),
+    ([{"function": "f", "inputs": ["nope"]}], "inexistentes"),
+    ([{"name": "a", "function": "f", "inputs": ["b"]}, {"name": "b", "function": "f", "inputs": ["a"]}], "ciclo"),
+])
+def test_invalid_pipelines(stages, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_pipeline(stages)
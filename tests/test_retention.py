@@ -0,0 +1,70 @@
+"""Caducidad de las entradas de log y consulta de los archivos comprimidos por día."""
+import gzip
+import json
+import os
+from datetime import datetime
+
+from liftr_common import retention
+from liftr_common.retention import expired_count, query_archives
+
+NO_LIMITS = {"max_entries": 0, "max_age": 0, "max_bytes": 0}
+
+
+def entry(ts, **fields):
+    return {"status": "ok", "time_start": datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f"), **fields}
+
+
+def test_expired_count_without_limits():
+    assert expired_count([entry(0)] * 5, NO_LIMITS, now=10**9) == 0
+
+
+def test_expired_count_max_entries_keeps_newest():
+    assert expired_count([entry(i) for i in range(5)], {**NO_LIMITS, "max_entries": 3}, now=100) == 2
+
+
+def test_expired_count_max_age_stops_at_first_recent_entry():
+    entries = [entry(10), entry(20), {"status": "ok"}, entry(95), entry(50)]
+    # Sin marca de tiempo reconocible cuenta como caducada; tras la primera reciente se para
+    assert expired_count(entries, {**NO_LIMITS, "max_age": 10}, now=100) == 3
+
+
+def test_expired_count_max_bytes_counts_from_the_newest():
+    entries = [entry(i, result="x" * 100) for i in range(10)]
+    size = len(json.dumps(entries[0]))
+    assert expired_count(entries, {**NO_LIMITS, "max_bytes": 3 * size}, now=100) == 7
+    assert expired_count(entries, {**NO_LIMITS, "max_entries": 8, "max_bytes": 100 * size}, now=100) == 2
+
+
+def write_segment(archive_dir, function, day, timestamps):
+    key_dir = os.path.join(archive_dir, function)
+    os.makedirs(key_dir, exist_ok=True)
+    with gzip.open(os.path.join(key_dir, f"{day}.jsonl.gz"), "wt", encoding="utf-8") as f:
+        for ts in timestamps:
+            f.write(json.dumps({"function": function, **entry(ts)}) + "\n")
+
+
+def filters(**overrides):
+    return {"function": None, "status": None, "since": None, "until": None, "offset": 0, "limit": 2, **overrides}
+
+
+def test_query_archives_stops_at_requested_page(monkeypatch, tmp_path):
+    days = [datetime(2026, 1, d, 12).timestamp() for d in (1, 2, 3)]
+    for function in ("a", "b"):
+        for ts in days:
+            write_segment(str(tmp_path), function, datetime.fromtimestamp(ts).strftime("%Y-%m-%d"), [ts, ts + 60])
+    opened = []
+    real_open = gzip.open
+    monkeypatch.setattr(retention.gzip, "open", lambda path, *a, **kw: opened.append(path) or real_open(path, *a, **kw))
+
+    result = query_archives(str(tmp_path), filters())
+    assert not result["total_exact"]
+    assert result["total"] == 4  # Cota inferior: solo se leyó el día más reciente
+    assert [e["time_start"] for e in result["entries"]] == [entry(days[2] + 60)["time_start"]] * 2
+    assert all("2026-01-03" in path for path in opened)
+
+    result = query_archives(str(tmp_path), filters(offset=12))
+    assert result["total_exact"] and result["total"] == 12 and result["entries"] == []
+
+    result = query_archives(str(tmp_path), filters(function="b", limit=10))
+    assert result["total_exact"] and result["total"] == 6
+    assert {e["function"] for e in result["entries"]} == {"b"}